@@ -0,0 +1,123 @@
+"""Micro-benchmark for citation rendering.
+
+Compares the previous per-citation string rebuilding and per-source
+``str.replace`` loop against the single-pass implementations in
+``agent.citations``, across answer lengths and citation counts.
+
+Usage:
+    python benchmarks/bench_citations.py [--repeat 5] [--json results.json]
+"""
+
+import argparse
+import json
+import random
+import timeit
+
+from agent.citations import ShortUrlRewriter, insert_citation_markers
+
+PREFIX = "https://vertexaisearch.cloud.google.com/id/"
+
+
+def legacy_insert_citation_markers(text, citations_list):
+    """Insert markers by rebuilding the text once per citation, as before."""
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    modified_text = text
+    for citation_info in sorted_citations:
+        end_idx = citation_info["end_index"]
+        marker_to_insert = ""
+        for segment in citation_info["segments"]:
+            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
+        modified_text = (
+            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+        )
+    return modified_text
+
+
+def legacy_rewrite(content, sources):
+    """Rewrite short urls with one ``str.replace`` pass per source, as before."""
+    for source in sources:
+        if source["short_url"] in content:
+            content = content.replace(source["short_url"], source["value"])
+    return content
+
+
+def make_case(length, n_citations, seed=0):
+    """Return random text of ``length`` chars with its citations and sources."""
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    text = ""
+    while len(text) < length:
+        text += rng.choice(words) + " "
+    text = text[:length]
+    sources, citations = [], []
+    for i in range(n_citations):
+        end = rng.randrange(1, length)
+        segments = []
+        for j in range(rng.randint(1, 3)):
+            short_url = f"{PREFIX}{i % 7}-{i * 3 + j}"
+            source = {
+                "label": f"site{i}",
+                "short_url": short_url,
+                "value": f"https://example.com/{i}/{j}",
+            }
+            segments.append(source)
+            sources.append(source)
+        citations.append(
+            {"start_index": max(0, end - 40), "end_index": end, "segments": segments}
+        )
+    return text, citations, sources
+
+
+def bench(length, n_citations, repeat):
+    """Time the legacy and single-pass implementations on one case, in ms."""
+    text, citations, sources = make_case(length, n_citations)
+    marked = insert_citation_markers(text, citations)
+    assert marked == legacy_insert_citation_markers(text, citations)
+    url_map = {s["short_url"]: s["value"] for s in sources}
+
+    def run(fn):
+        return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+    return {
+        "length": length,
+        "citations": n_citations,
+        "insert_legacy_ms": run(
+            lambda: legacy_insert_citation_markers(text, citations)
+        ),
+        "insert_single_pass_ms": run(lambda: insert_citation_markers(text, citations)),
+        "rewrite_legacy_ms": run(lambda: legacy_rewrite(marked, sources)),
+        "rewrite_single_pass_ms": run(
+            lambda: ShortUrlRewriter(url_map).rewrite(marked)
+        ),
+    }
+
+
+def main():
+    """Run every case and print, and optionally save, the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    results = [
+        bench(length, n_citations, args.repeat)
+        for length in (2_000, 20_000, 200_000)
+        for n_citations in (10, 100, 1_000)
+    ]
+    header = f"{'length':>8} {'cites':>6} {'insert old':>11} {'insert new':>11} {'rewrite old':>12} {'rewrite new':>12}"
+    print(header)  # noqa: T201
+    for r in results:
+        print(  # noqa: T201
+            f"{r['length']:>8} {r['citations']:>6} "
+            f"{r['insert_legacy_ms']:>9.2f}ms {r['insert_single_pass_ms']:>9.2f}ms "
+            f"{r['rewrite_legacy_ms']:>10.2f}ms {r['rewrite_single_pass_ms']:>10.2f}ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""End-to-end benchmark of the compiled research graph on fake backends.
+
+Runs ``agent.graph.graph`` against the deterministic Gemini stand-ins in
+``benchmarks/fakes.py`` and sweeps the number of initial queries, the number
+of research loops and the number of concurrent runs. Each sweep point runs
+in a fresh subprocess so peak RSS and CPU time are measured per point, and
+reports throughput, p50/p95/p99 run latency, peak RSS and CPU time per run.
+
+Every number comes from the fakes, whose latencies are simulated: they
+measure the graph's own overhead and concurrency behaviour, not Gemini's.
+Saved results say so in their ``backend`` field.
+
+Usage:
+    python benchmarks/bench_graph.py [--queries 1 3 5] [--loops 1 2]
+        [--concurrency 1 8 32] [--runs 32] [--sync] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` for ``q`` in [0, 100]."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _backend_config(args):
+    from fakes import Distribution, FakeBackendConfig
+
+    return FakeBackendConfig(
+        search_latency=Distribution(args.search_latency, args.latency_sigma),
+        llm_latency=Distribution(args.llm_latency, args.latency_sigma),
+        search_chars=Distribution(args.search_chars, args.size_sigma),
+        answer_chars=Distribution(args.answer_chars, args.size_sigma),
+        sources_per_search=args.sources,
+        follow_up_queries=args.follow_ups,
+        sufficient_rate=args.sufficient_rate,
+        seed=args.seed,
+    )
+
+
+def _run_input(index, queries, loops):
+    return {
+        "messages": [{"role": "user", "content": f"Benchmark question {index}"}],
+        "initial_search_query_count": queries,
+        "max_research_loops": loops,
+    }
+
+
+def run_point(args, queries, loops, concurrency):
+    """Run one sweep point in this process and return its measurements."""
+    # Keep the caches in memory only
+    os.environ.setdefault("AGENT_SEARCH_CACHE_PATH", "")
+    os.environ.setdefault("AGENT_ANSWER_CACHE_PATH", "")
+    import logging
+
+    logging.disable(logging.INFO)
+    import fakes
+
+    # ``agent.graph`` the attribute is the compiled graph, we need the module
+    graph_module = importlib.import_module("agent.graph")
+
+    backends = fakes.install(graph_module, _backend_config(args))
+    graph = graph_module.graph
+    config = {
+        "configurable": {
+            "search_cache_enabled": args.cache,
+            "search_coalescing_enabled": args.cache,
+            # Measure the research itself, never a cached answer
+            "answer_cache_enabled": False,
+        },
+        "recursion_limit": 100,
+    }
+
+    def one_sync(index):
+        started = time.perf_counter()
+        graph.invoke(_run_input(index, queries, loops), config)
+        return time.perf_counter() - started
+
+    async def one_async(index, gate):
+        async with gate:
+            started = time.perf_counter()
+            await graph.ainvoke(_run_input(index, queries, loops), config)
+            return time.perf_counter() - started
+
+    async def run_all(indices):
+        gate = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(one_async(i, gate) for i in indices))
+
+    def run_batch(indices):
+        if args.sync:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                return list(pool.map(one_sync, indices))
+        return asyncio.run(run_all(indices))
+
+    # Warm up imports, pools and compiled regexes outside the measurement
+    run_batch([-1])
+    calls_before = backends.stats()
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    latencies = run_batch(range(args.runs))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    calls = backends.stats()
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "queries": queries,
+        "loops": loops,
+        "concurrency": concurrency,
+        "mode": "sync" if args.sync else "async",
+        "runs": args.runs,
+        "throughput_rps": args.runs / elapsed,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "latency_mean_ms": sum(latencies) / len(latencies) * 1000,
+        "cpu_ms_per_run": cpu / args.runs * 1000,
+        "peak_rss_mb": peak_rss_kb / 1024,
+        "search_calls_per_run": (calls["search_calls"] - calls_before["search_calls"])
+        / args.runs,
+        "llm_calls_per_run": (calls["llm_calls"] - calls_before["llm_calls"])
+        / args.runs,
+    }
+
+
+def parse_args(argv=None):
+    """Parse the sweep, fake backend and output options."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--loops", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--runs", type=int, default=32, help="Runs per sweep point.")
+    parser.add_argument(
+        "--sync", action="store_true", help="Use graph.invoke on threads."
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="Enable search cache and coalescing."
+    )
+    parser.add_argument(
+        "--search-latency", type=float, default=0.8, help="Median seconds."
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.4, help="Median seconds."
+    )
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--search-chars", type=float, default=2000)
+    parser.add_argument("--answer-chars", type=float, default=3000)
+    parser.add_argument("--size-sigma", type=float, default=0.3)
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--follow-ups", type=int, default=2)
+    parser.add_argument("--sufficient-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--point", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Run every sweep point in a fresh subprocess and print the results."""
+    args = parse_args()
+    if args.point:
+        point = json.loads(args.point)
+        print(json.dumps(run_point(args, **point)))  # noqa: T201
+        return
+
+    forwarded = list(sys.argv[1:])
+    if "--json" in forwarded:
+        i = forwarded.index("--json")
+        del forwarded[i : i + 2]
+    results = []
+    header = (
+        f"{'q':>3} {'loops':>5} {'conc':>5} {'rps':>8} {'p50':>9} {'p95':>9} "
+        f"{'p99':>9} {'cpu/run':>9} {'rss':>8}"
+    )
+    print(header)  # noqa: T201
+    for queries, loops, concurrency in product(
+        args.queries, args.loops, args.concurrency
+    ):
+        point = {"queries": queries, "loops": loops, "concurrency": concurrency}
+        proc = subprocess.run(
+            [sys.executable, __file__, *forwarded, "--point", json.dumps(point)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(r)
+        print(  # noqa: T201
+            f"{queries:>3} {loops:>5} {concurrency:>5} {r['throughput_rps']:>8.2f} "
+            f"{r['latency_p50_ms']:>7.0f}ms {r['latency_p95_ms']:>7.0f}ms "
+            f"{r['latency_p99_ms']:>7.0f}ms {r['cpu_ms_per_run']:>7.1f}ms "
+            f"{r['peak_rss_mb']:>6.1f}MB"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "commit": _git_commit(),
+                    "backend": "fakes",
+                    "params": vars(args),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=BENCH_DIR,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Cold start report for the agent graph module.
+
+Imports a module (``agent.graph`` by default) in fresh interpreters with
+``python -X importtime`` and reports the wall-clock import time, the
+cumulative import time per top-level package and the slowest individual
+imports, so regressions in what loads before the first request are visible.
+
+Usage:
+    python benchmarks/bench_startup.py [--module agent.graph] [--repeat 5]
+        [--top 15] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:  self [us] | cumulative | imported package"
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_once(module):
+    """Import ``module`` in a new interpreter; return wall seconds and importtime rows."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (os.path.join(BACKEND_DIR, "src"), env.get("PYTHONPATH")) if p
+    )
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us)))
+    return elapsed, rows
+
+
+def report(module, repeat, top):
+    """Import ``module`` ``repeat`` times and summarize the fastest run."""
+    runs = [import_once(module) for _ in range(repeat)]
+    walls = [elapsed for elapsed, _ in runs]
+    # The fastest run has the least noise from the page cache and scheduler
+    _, rows = min(runs, key=lambda run: run[0])
+
+    packages = {}
+    for name, self_us, _ in rows:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)
+    return {
+        "module": module,
+        "wall_ms_min": min(walls) * 1000,
+        "wall_ms_median": statistics.median(walls) * 1000,
+        "import_ms": sum(self_us for _, self_us, _ in rows) / 1000,
+        "modules": len(rows),
+        "packages_ms": {
+            name: us / 1000
+            for name, us in sorted(
+                packages.items(), key=lambda kv: kv[1], reverse=True
+            )[:top]
+        },
+        "slowest_ms": [
+            {"module": name, "self": s / 1000, "cumulative": c / 1000}
+            for name, s, c in slowest[:top]
+        ],
+    }
+
+
+def main():
+    """Print, and optionally save, the import time report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="agent.graph")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    r = report(args.module, args.repeat, args.top)
+    print(  # noqa: T201
+        f"{r['module']}: {r['wall_ms_min']:.0f}ms min / {r['wall_ms_median']:.0f}ms median "
+        f"interpreter wall time, {r['import_ms']:.0f}ms in {r['modules']} imports"
+    )
+    print(f"\n{'package':<32} {'self':>9}")  # noqa: T201
+    for name, ms in r["packages_ms"].items():
+        print(f"{name:<32} {ms:>7.1f}ms")  # noqa: T201
+    print(f"\n{'import':<48} {'self':>9} {'cumulative':>11}")  # noqa: T201
+    for row in r["slowest_ms"]:
+        print(  # noqa: T201
+            f"{row['module']:<48} {row['self']:>7.1f}ms {row['cumulative']:>9.1f}ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
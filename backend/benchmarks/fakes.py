@@ -0,0 +1,277 @@
+"""Deterministic stand-ins for the Gemini backends used by the graph.
+
+:class:`FakeGenaiClient` answers grounded searches and :class:`FakeChatModel`
+answers query generation, reflection, compaction and the final answer. Both
+sleep for a latency drawn from a log-normal distribution and produce
+responses whose size is drawn the same way, seeded from the prompt so a run
+is reproducible. Token usage is reported as roughly one token per four
+characters.
+
+:func:`install` patches them into ``agent.graph``.
+"""
+
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+WORDS = (
+    "market growth policy report analysis release update data trend forecast "
+    "revenue launch study survey results industry quarter model benchmark"
+).split()
+
+
+@dataclass
+class Distribution:
+    """Log-normal distribution given by its median and log-space sigma."""
+
+    median: float
+    sigma: float = 0.0
+
+    def draw(self, rng: random.Random) -> float:
+        """Draw one value with ``rng``; a non-positive median always gives 0."""
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0.0, self.sigma))
+
+
+@dataclass
+class FakeBackendConfig:
+    """Latency (seconds) and response size (characters) of the fake backends."""
+
+    search_latency: Distribution
+    llm_latency: Distribution
+    search_chars: Distribution
+    answer_chars: Distribution
+    sources_per_search: int = 4
+    follow_up_queries: int = 2
+    sufficient_rate: float = 0.0
+    seed: int = 0
+
+
+class _Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+
+def _rng(config: FakeBackendConfig, *parts: object) -> random.Random:
+    digest = hashlib.sha256(repr((config.seed,) + parts).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words, size = [], 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[: max(int(chars), 1)]
+
+
+def _query(rng: random.Random) -> str:
+    # Random terms, so query dedup never folds two fake queries together
+    return " ".join(f"term{rng.getrandbits(32):x}" for _ in range(5))
+
+
+def _tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+class _FakeModels:
+    def __init__(self, config: FakeBackendConfig, counter: _Counter, is_async: bool):
+        self._config = config
+        self._counter = counter
+        self._is_async = is_async
+
+    def _response(self, model: str, contents: str):
+        config = self._config
+        rng = _rng(config, "search", contents)
+        text = _text(rng, config.search_chars.draw(rng))
+        chunks = [
+            SimpleNamespace(
+                web=SimpleNamespace(
+                    uri=f"https://vertexaisearch.cloud.google.com/grounding/{rng.getrandbits(48):x}",
+                    title=f"source{i}.example.com",
+                )
+            )
+            for i in range(config.sources_per_search)
+        ]
+        supports = []
+        for i in range(config.sources_per_search):
+            end = rng.randrange(1, len(text) + 1)
+            supports.append(
+                SimpleNamespace(
+                    segment=SimpleNamespace(
+                        start_index=max(0, end - 40), end_index=end
+                    ),
+                    grounding_chunk_indices=[i],
+                )
+            )
+        metadata = SimpleNamespace(grounding_chunks=chunks, grounding_supports=supports)
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(grounding_metadata=metadata)],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=_tokens(contents),
+                candidates_token_count=_tokens(text),
+            ),
+        ), config.search_latency.draw(rng)
+
+    def generate_content(self, *, model: str, contents: str, config=None):
+        self._counter()
+        response, latency = self._response(model, contents)
+        if self._is_async:
+
+            async def respond():
+                await asyncio.sleep(latency)
+                return response
+
+            return respond()
+        time.sleep(latency)
+        return response
+
+
+class FakeGenaiClient:
+    """Stand-in for ``google.genai.Client`` answering grounded searches."""
+
+    def __init__(self, config: FakeBackendConfig):
+        """Serve searches shaped by ``config`` to sync and async callers."""
+        self.counter = _Counter()
+        self.models = _FakeModels(config, self.counter, is_async=False)
+        self.aio = SimpleNamespace(
+            models=_FakeModels(config, self.counter, is_async=True)
+        )
+
+
+class FakeChatModel:
+    """Stand-in for a pooled chat runnable, with or without structured output."""
+
+    def __init__(self, config: FakeBackendConfig, model: str, schema=None):
+        """Answer as ``model``, parsing into ``schema`` if given."""
+        self.config = config
+        self.model = model
+        self.schema = schema
+        self.counter = _Counter()
+
+    def _respond(self, prompt: str):
+        config = self.config
+        rng = _rng(config, self.model, self.schema and self.schema.__name__, prompt)
+        latency = config.llm_latency.draw(rng)
+        if self.schema is None:
+            text = _text(rng, config.answer_chars.draw(rng))
+            return text, latency
+        fields = self.schema.model_fields
+        if "query" in fields:
+            match = re.search(r"more than (\d+) queries", prompt)
+            count = int(match.group(1)) if match else 3
+            parsed = self.schema(
+                query=[_query(rng) for _ in range(count)], rationale=_text(rng, 80)
+            )
+        else:
+            sufficient = rng.random() < config.sufficient_rate
+            parsed = self.schema(
+                is_sufficient=sufficient,
+                knowledge_gap="" if sufficient else _text(rng, 80),
+                follow_up_queries=[]
+                if sufficient
+                else [_query(rng) for _ in range(config.follow_up_queries)],
+            )
+        return parsed, latency
+
+    def _message(self, prompt: str, content: str, cls=AIMessage):
+        usage = {
+            "input_tokens": _tokens(prompt),
+            "output_tokens": _tokens(content),
+            "total_tokens": _tokens(prompt) + _tokens(content),
+        }
+        return cls(content=content, usage_metadata=usage)
+
+    def _output(self, prompt: str, result):
+        if self.schema is None:
+            return self._message(prompt, result)
+        raw = self._message(prompt, result.model_dump_json())
+        return {"raw": raw, "parsed": result, "parsing_error": None}
+
+    def invoke(self, input: str, config=None, **kwargs):
+        """Sleep for the drawn latency, then return the whole response."""
+        self.counter()
+        result, latency = self._respond(input)
+        time.sleep(latency)
+        return self._output(input, result)
+
+    async def ainvoke(self, input: str, config=None, **kwargs):
+        """Async variant of :meth:`invoke`."""
+        self.counter()
+        result, latency = self._respond(input)
+        await asyncio.sleep(latency)
+        return self._output(input, result)
+
+    def _chunks(self, prompt: str, text: str, size: int = 64):
+        pieces = [text[i : i + size] for i in range(0, len(text), size)] or [""]
+        chunks = [AIMessageChunk(content=piece) for piece in pieces[:-1]]
+        chunks.append(self._message(prompt, pieces[-1], AIMessageChunk))
+        return chunks
+
+    def stream(self, input: str, config=None, **kwargs):
+        """Yield the response in chunks, spreading the drawn latency over them."""
+        self.counter()
+        text, latency = self._respond(input)
+        chunks = self._chunks(input, text)
+        for chunk in chunks:
+            time.sleep(latency / len(chunks))
+            yield chunk
+
+    async def astream(self, input: str, config=None, **kwargs):
+        """Async variant of :meth:`stream`."""
+        self.counter()
+        text, latency = self._respond(input)
+        chunks = self._chunks(input, text)
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+
+
+class FakeBackends:
+    """Fake genai client plus a registry of fake chat models."""
+
+    def __init__(self, config: FakeBackendConfig):
+        """Create the fake genai client; chat models are created on first use."""
+        self.config = config
+        self.genai_client = FakeGenaiClient(config)
+        self._models: dict = {}
+        self._lock = threading.Lock()
+
+    def get_chat_model(self, model: str, temperature: float, schema=None):
+        """Return the fake chat model for ``model`` and ``schema``, like the registry."""
+        with self._lock:
+            key = (model, schema)
+            if key not in self._models:
+                self._models[key] = FakeChatModel(self.config, model, schema)
+            return self._models[key]
+
+    def stats(self) -> dict:
+        """Return how many search and chat calls the graph made."""
+        return {
+            "search_calls": self.genai_client.counter.calls,
+            "llm_calls": sum(m.counter.calls for m in self._models.values()),
+        }
+
+
+def install(graph_module, config: FakeBackendConfig) -> FakeBackends:
+    """Point ``agent.graph`` at fake backends and return them."""
+    backends = FakeBackends(config)
+    graph_module.set_genai_client(backends.genai_client)
+    graph_module.get_chat_model = backends.get_chat_model
+    return backends
@@ -1,3 +1,11 @@
-from agent.graph import graph
-
 __all__ = ["graph"]
+
+
+def __getattr__(name):
+    # Import the graph lazily so light-weight submodules (e.g. agent.citations)
+    # can be used without pulling in the LangChain/Gemini stack.
+    if name == "graph":
+        from agent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,63 @@
+"""Cache of whole answers, checked before the graph does any research.
+
+Entries are keyed on the normalized research topic (the whole conversation,
+as built by ``get_research_topic``), the models and research depth that
+shape the answer, and the current date bucket. They expire when the date
+bucket rolls over, so a question like "what happened today" is never
+answered from a previous day, and at the latest after the configured TTL.
+
+The cache reuses the two-tier store of :mod:`agent.search_cache`: an
+in-memory LRU in front of a local SQLite file, configured from
+``AGENT_ANSWER_CACHE_*`` env vars. It is only consulted by runs that set
+``answer_cache_enabled``.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from agent.search_cache import TieredCache, build_tiered_cache, normalize_query
+
+
+def answer_cache_key(topic: str, models: tuple, depth: tuple, date_bucket: str) -> str:
+    """Return the cache key for ``topic`` answered with ``models`` and ``depth`` on ``date_bucket``.
+
+    Args:
+        topic: Research topic of the conversation.
+        models: Names of the models used to research and answer.
+        depth: Settings that bound how much research is done, e.g. the
+            number of initial queries and research loops.
+        date_bucket: The date the answer is valid for.
+    """
+    raw = "\x1f".join(
+        [*map(str, models), *map(str, depth), date_bucket, normalize_query(topic)]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def seconds_until_next_bucket(now: datetime | None = None) -> float:
+    """Return the seconds until the date bucket (the local calendar day) rolls over."""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max((midnight - now).total_seconds(), 1.0)
+
+
+_answer_cache: TieredCache | None = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> TieredCache:
+    """Return the process-wide answer cache, opening it on first use."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = build_tiered_cache(
+                    "answer_cache", default_ttl=24 * 3600, default_max_entries=256
+                )
+    return _answer_cache
+
+
+def answer_cache_stats() -> dict:
+    """Return hit/miss counters of the process-wide answer cache."""
+    return get_answer_cache().stats()
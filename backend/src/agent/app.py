@@ -1,13 +1,51 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import os
 import pathlib
 from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 import fastapi.exceptions
 
+from agent.answer_cache import answer_cache_stats
+from agent.breaker import circuit_breaker_stats
+from agent.cascade import cascade_stats
+from agent.hedging import hedging_stats
+from agent.ratelimit import rate_limiter_stats
+from agent.static_files import StaticManifest
+
 # Define the FastAPI app
 app = FastAPI()
 
 
+@app.get("/stats/rate-limits")
+async def rate_limits():
+    """Per-model concurrency limits and queue depths of the upstream rate limiter."""
+    return rate_limiter_stats()
+
+
+@app.get("/stats/answer-cache")
+async def answer_cache():
+    """Hit/miss counters of the whole-question answer cache."""
+    return answer_cache_stats()
+
+
+@app.get("/stats/reflection-cascade")
+async def reflection_cascade():
+    """How often the reflection cascade escalated to the reasoning model, and why."""
+    return cascade_stats()
+
+
+@app.get("/stats/hedging")
+async def hedging():
+    """Per-model hedge counts, hedge win rates and observed search latencies."""
+    return hedging_stats()
+
+
+@app.get("/stats/circuit-breakers")
+async def circuit_breakers():
+    """Per-model circuit breaker state; ``open`` means calls to the model fail fast."""
+    return circuit_breaker_stats()
+
+
 def create_frontend_router(build_dir="../frontend/dist"):
     """Creates a router to serve the React frontend.
 
@@ -38,6 +76,13 @@ def create_frontend_router(build_dir="../frontend/dist"):
 
     build_dir = pathlib.Path(build_dir)
 
+    if os.environ.get("AGENT_STATIC_MANIFEST", "true").lower() not in (
+        "0",
+        "false",
+        "no",
+    ):
+        return _manifest_router(StaticManifest(str(build_path)))
+
     react = FastAPI(openapi_url="")
     react.mount(
         "/assets", StaticFiles(directory=static_files_path), name="static_assets"
@@ -53,6 +98,34 @@ def create_frontend_router(build_dir="../frontend/dist"):
     return react
 
 
+def _manifest_router(manifest: StaticManifest):
+    """Serve a build from its in-memory manifest, see :mod:`agent.static_files`.
+
+    Unknown paths get ``index.html`` so client-side routes work, except under
+    ``assets/`` where a missing file is a 404.
+    """
+    react = FastAPI(openapi_url="")
+    index = manifest.lookup("index.html")
+
+    @react.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def handle_static(request: Request, path: str):
+        entry = manifest.lookup(path)
+        if entry is None:
+            if path.startswith("assets/"):
+                return Response(status_code=404)
+            entry = index
+        body, coding, etag = entry.select(request.headers.get("accept-encoding", ""))
+        headers = entry.headers(etag, coding)
+        if entry.not_modified(request.headers, etag):
+            return Response(status_code=304, headers=headers)
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=entry.media_type, headers=headers)
+
+    return react
+
+
 # Mount the frontend under /app to not conflict with the LangGraph API routes
 app.mount(
     "/app",
@@ -0,0 +1,271 @@
+"""Batch research over a JSONL file of questions.
+
+Runs the compiled research graph in-process over many questions with
+bounded concurrency. Every question shares the process-wide chat model
+registry, genai client, search cache, request coalescer and rate limiter, so
+overlapping questions reuse connections and, with ``search_cache_enabled``
+set in ``--config``, search results.
+
+Input lines are JSON objects with a ``question`` and optionally an ``id``
+(defaulting to a hash of the question) and a ``config`` dict of
+:class:`~agent.configuration.Configuration` overrides for that question.
+Ids must be unique, as results are matched to questions by id; a question
+asked twice needs an explicit id for each occurrence::
+
+    {"id": "q1", "question": "Who won the 2025 Tour de France?"}
+
+One output line is appended per question as soon as it finishes, holding the
+``answer``, the cited ``sources``, ``timings`` and ``token_usage``, or an
+``error``. Questions whose id already has a successful line in the output are
+skipped, so an interrupted batch resumes where it stopped; failed questions
+are retried.
+
+Usage:
+    python -m agent.batch questions.jsonl -o answers.jsonl [--concurrency 8]
+        [--config '{"max_research_loops": 1}']
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Iterator, TextIO
+
+from langchain_core.messages import HumanMessage
+
+logger = logging.getLogger(__name__)
+
+
+def question_id(item: dict) -> str:
+    """Return the id of an input item, hashing the question when it has none."""
+    if item.get("id") is not None:
+        return str(item["id"])
+    return hashlib.sha256(item["question"].encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path: str) -> Iterator[dict]:
+    """Yield the input items of a JSONL file, skipping blank lines.
+
+    Raises:
+        ValueError: If a line is not an object with a question, or repeats
+            the id of an earlier line.
+    """
+    seen: dict[str, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not isinstance(item, dict) or not item.get("question"):
+                raise ValueError(f"{path}:{number}: expected an object with a question")
+            qid = question_id(item)
+            if qid in seen:
+                raise ValueError(
+                    f"{path}:{number}: duplicate id {qid!r}, first used on line "
+                    f"{seen[qid]}"
+                )
+            seen[qid] = number
+            yield item
+
+
+def completed_ids(path: str) -> set:
+    """Return the ids that already have a successful result in ``path``.
+
+    A truncated last line, as left by a crash mid-write, is ignored, even if
+    it ends inside a multibyte character.
+    """
+    done: set = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(result, dict) and "id" in result and not result.get("error"):
+                done.add(result["id"])
+    return done
+
+
+def open_output(path: str) -> TextIO:
+    """Open ``path`` for appending, starting on a fresh line after a torn write.
+
+    The last byte is checked in binary mode: a write torn inside a multibyte
+    character cannot be decoded.
+    """
+    with open(path, "ab+") as raw:
+        if raw.tell() > 0:
+            raw.seek(-1, os.SEEK_END)
+            if raw.read(1) != b"\n":
+                raw.write(b"\n")
+    return open(path, "a", encoding="utf-8")
+
+
+def _cited_sources(state: dict) -> list:
+    return [
+        {"label": source["label"], "url": source["value"], "count": source["count"]}
+        for source in state.get("sources_gathered") or []
+        if source.get("cited")
+    ]
+
+
+async def research(graph: Any, item: dict, config: dict) -> dict:
+    """Run the graph for one input item and return its result line.
+
+    ``timings`` holds the total run time and, per node, the time from the
+    start of the run until the node last finished.
+    """
+    started = time.perf_counter()
+    configurable = {**config.get("configurable", {}), **item.get("config", {})}
+    run_config = {**config, "configurable": configurable}
+    state: dict = {}
+    node_done_ms: dict = {}
+    async for mode, chunk in graph.astream(
+        {"messages": [HumanMessage(content=item["question"])]},
+        run_config,
+        stream_mode=["updates", "values"],
+    ):
+        if mode == "values":
+            state = chunk
+        else:
+            elapsed_ms = round((time.perf_counter() - started) * 1000)
+            for node in chunk:
+                node_done_ms[node] = elapsed_ms
+    messages = state.get("messages") or []
+    return {
+        "id": question_id(item),
+        "question": item["question"],
+        "answer": messages[-1].content if messages else None,
+        "sources": _cited_sources(state),
+        "timings": {
+            "total_ms": round((time.perf_counter() - started) * 1000),
+            "node_done_ms": node_done_ms,
+        },
+        "token_usage": state.get("token_usage") or {},
+    }
+
+
+async def run_batch(
+    graph: Any,
+    items: Iterator[dict],
+    out: TextIO,
+    concurrency: int = 8,
+    config: dict | None = None,
+    skip: set | None = None,
+) -> dict:
+    """Research ``items`` with at most ``concurrency`` runs in flight.
+
+    Results are written to ``out`` one line at a time, in completion order.
+    Input is read lazily, so the batch may be larger than memory.
+
+    Returns:
+        Counts of ``completed``, ``failed`` and ``skipped`` questions.
+    """
+    config = config or {}
+    skip = skip or set()
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    def write(result: dict) -> None:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            qid = question_id(item)
+            try:
+                result = await research(graph, item, config)
+            except Exception as e:
+                logger.warning(f"问题 {qid} 研究失败: {e}")
+                result = {"id": qid, "question": item["question"], "error": repr(e)}
+                counts["failed"] += 1
+            else:
+                counts["completed"] += 1
+            write(result)
+            done = counts["completed"] + counts["failed"]
+            if done % 10 == 0:
+                logger.info(
+                    f"批处理进度: 已完成 {counts['completed']}，失败 {counts['failed']}"
+                )
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for item in items:
+            if question_id(item) in skip:
+                counts["skipped"] += 1
+                continue
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return counts
+
+
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    """Parse the command line of the batch CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file of questions.")
+    parser.add_argument(
+        "-o", "--output", required=True, help="JSONL file results are appended to."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Questions researched at once."
+    )
+    parser.add_argument(
+        "--config",
+        default="{}",
+        help="JSON object of configuration overrides for every question.",
+    )
+    parser.add_argument("--recursion-limit", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def main(argv: list | None = None) -> int:
+    """Run the batch CLI and return its exit status."""
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # Reject malformed lines and duplicate ids before researching anything
+    for _ in read_questions(args.input):
+        pass
+    from agent.graph import graph
+
+    skip = completed_ids(args.output)
+    if skip:
+        logger.info(f"跳过 {len(skip)} 个已完成的问题")
+    config = {
+        "configurable": json.loads(args.config),
+        "recursion_limit": args.recursion_limit,
+    }
+    with open_output(args.output) as out:
+        counts = asyncio.run(
+            run_batch(
+                graph,
+                read_questions(args.input),
+                out,
+                concurrency=args.concurrency,
+                config=config,
+                skip=skip,
+            )
+        )
+    logger.info(
+        f"批处理结束: 完成 {counts['completed']}，失败 {counts['failed']}，跳过 {counts['skipped']}"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""Per-model circuit breakers for upstream Gemini calls.
+
+Every model call, from every node and run, passes through the breaker of its
+model, so ``generate_query``, ``web_research``, ``reflection`` and
+``finalize_answer`` share one view of the model's health:
+
+* **closed**: calls go through. Outcomes are kept over a rolling window;
+  once at least ``min_calls`` calls in the window failed at a rate of
+  ``failure_rate`` or more, the breaker opens.
+* **open**: calls fail immediately with :class:`CircuitOpenError` instead of
+  waiting for retries and timeouts, for ``open_seconds`` (doubled after every
+  failed probe, up to ``max_open_seconds``).
+* **half-open**: up to ``half_open_probes`` calls go through as probes. A
+  successful probe closes the breaker, a failed one opens it again.
+
+Failures are upstream errors and timeouts. Errors that say nothing about the
+upstream's health are ignored: waiting for a local rate limiter slot or
+worker, cancellation, and 4xx client errors other than 408/429. A timeout only
+counts if the upstream call was given at least ``min_timeout`` seconds; a call
+whose timeout the run budget or queueing cut shorter ran out of the run's
+time, not the model's.
+
+In a run, a ``web_research`` branch whose model's breaker is open returns
+without a result and records the model in the run's ``degraded_models``;
+in any other node the :class:`CircuitOpenError` fails the run with a message
+naming the degraded model.
+
+Settings are given per model with the ``AGENT_CIRCUIT_BREAKERS`` environment
+variable, a JSON object mapping model name prefixes (longest prefix wins,
+``"*"`` for the default) to :class:`CircuitBreaker` keyword arguments.
+``AGENT_CIRCUIT_BREAKER_ENABLED=0`` turns the breakers off.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, Mapping, Tuple
+
+from agent.budget import MIN_CALL_TIMEOUT
+from agent.executor import WorkerTimeoutError
+from agent.ratelimit import QueueTimeoutError
+from agent.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    "failure_rate": 0.5,
+    "min_calls": 10,
+    "window": 30.0,
+    "open_seconds": 10.0,
+    "max_open_seconds": 120.0,
+    "half_open_probes": 1,
+    "min_timeout": 10.0,
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+    def __init__(self, model: str, retry_in: float):
+        """Name ``model`` and when its breaker lets a probe through."""
+        super().__init__(
+            f"Model {model} is degraded: its circuit breaker is open after repeated "
+            f"upstream failures. Failing fast; retry in {retry_in:.0f}s."
+        )
+        self.model = model
+        self.retry_in = retry_in
+
+
+@dataclass
+class GuardedCall:
+    """One call admitted by :meth:`CircuitBreakers.guard`.
+
+    Attributes:
+        timeout: Seconds the upstream call was given, set by the caller when
+            it makes the call; ``None`` while it has not reached the upstream.
+    """
+
+    timeout: float | None = None
+
+
+def is_failure(
+    error: BaseException,
+    timeout: float | None = None,
+    min_timeout: float = MIN_CALL_TIMEOUT,
+) -> bool:
+    """Whether ``error`` counts against the upstream's health.
+
+    Args:
+        error: The error the call raised.
+        timeout: Seconds the upstream call was given, ``None`` if it was never
+            made.
+        min_timeout: Shortest timeout a call must have been given for its
+            timing out to count.
+    """
+    if isinstance(error, (QueueTimeoutError, WorkerTimeoutError, CircuitOpenError)):
+        return False
+    if isinstance(error, TimeoutError) and (timeout is None or timeout < min_timeout):
+        return False
+    if not isinstance(error, Exception):
+        # Cancellation and interpreter shutdown
+        return False
+    for attr in ("code", "status_code"):
+        code = getattr(error, attr, None)
+        if isinstance(code, int) and 400 <= code < 500:
+            return code in (408, 429)
+    return True
+
+
+class CircuitBreaker:
+    """Circuit breaker of one model.
+
+    Args:
+        failure_rate: Failure rate over the window at which the breaker opens.
+        min_calls: Calls the window needs before the breaker may open.
+        window: Seconds of outcomes the failure rate is computed over.
+        open_seconds: How long the breaker stays open the first time.
+        max_open_seconds: Cap for the open time, doubled on failed probes.
+        half_open_probes: Concurrent probe calls allowed when half-open.
+        min_timeout: Shortest timeout, in seconds, a call must have been given
+            for its timing out to count as a failure.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        window: float = 30.0,
+        open_seconds: float = 10.0,
+        max_open_seconds: float = 120.0,
+        half_open_probes: int = 1,
+        min_timeout: float = 10.0,
+    ):
+        """Start closed, with an empty window."""
+        self.model = model
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+        self.min_timeout = max(min_timeout, MIN_CALL_TIMEOUT)
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._outcomes: Deque[Tuple[float, bool]] = collections.deque()
+        self._open_until = 0.0
+        self._open_for = open_seconds
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        # Called with the lock held
+        self.state = OPEN
+        self._open_until = now + self._open_for
+        self._outcomes.clear()
+        self.opened += 1
+        logger.error(f"模型 {self.model} 熔断器打开，{self._open_for:g} 秒内快速失败")
+
+    def before_call(self) -> bool:
+        """Admit a call or raise :class:`CircuitOpenError`.
+
+        Returns:
+            Whether the call is a half-open probe.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now >= self._open_until:
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"模型 {self.model} 熔断器半开，发送探测请求")
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            retry_in = max(self._open_until - now, 0.0)
+        raise CircuitOpenError(self.model, retry_in)
+
+    def after_call(
+        self,
+        probe: bool,
+        error: BaseException | None,
+        timeout: float | None = None,
+    ) -> None:
+        """Record the outcome of an admitted call given ``timeout`` seconds."""
+        now = time.monotonic()
+        failed = error is not None and is_failure(error, timeout, self.min_timeout)
+        with self._lock:
+            if probe:
+                self._probes -= 1
+                if self.state != HALF_OPEN or (error is not None and not failed):
+                    return
+                if failed:
+                    self._open_for = min(self._open_for * 2, self.max_open_seconds)
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._open_for = self.open_seconds
+                    logger.info(f"模型 {self.model} 熔断器关闭，恢复正常调用")
+                return
+            if self.state != CLOSED or (error is not None and not failed):
+                return
+            self._outcomes.append((now, failed))
+            self._prune(now)
+            if len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, f in self._outcomes if f)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def stats(self) -> dict:
+        """Return the state, the current window and the trip/reject counters."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, f in self._outcomes if f)
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "window_failure_rate": failures / calls if calls else 0.0,
+                "retry_in": max(self._open_until - now, 0.0)
+                if self.state == OPEN
+                else 0.0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class CircuitBreakers:
+    """Per-model :class:`CircuitBreaker` instances, created on first use.
+
+    Args:
+        settings: Mapping of model name prefix (``"*"`` for the default) to
+            :class:`CircuitBreaker` keyword arguments.
+        enabled: If false, :meth:`guard` never rejects or records calls.
+    """
+
+    def __init__(
+        self,
+        settings: Mapping[str, Mapping[str, Any]] | None = None,
+        enabled: bool = True,
+    ):
+        """Start without breakers; each model gets one on its first call."""
+        self.settings = dict(settings or {})
+        self.enabled = enabled
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _settings(self, model: str) -> dict:
+        matches = [
+            name for name in self.settings if name != "*" and model.startswith(name)
+        ]
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.settings.get("*", {}))
+        if matches:
+            settings.update(self.settings[max(matches, key=len)])
+        return settings
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """Return the breaker for ``model``, creating it on first use."""
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(
+                    model, **self._settings(model)
+                )
+            return breaker
+
+    @contextmanager
+    def guard(self, model: str) -> Iterator[GuardedCall]:
+        """Run one call to ``model`` through its breaker.
+
+        Yields:
+            The admitted call; set its ``timeout`` when making the upstream
+            call, so a timeout is only held against the model if it was long
+            enough.
+
+        Raises:
+            CircuitOpenError: Right away, if the breaker is open.
+        """
+        call = GuardedCall()
+        if not self.enabled:
+            yield call
+            return
+        breaker = self.breaker(model)
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError:
+            annotate(circuit_open=True)
+            raise
+        error = None
+        try:
+            yield call
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            breaker.after_call(probe, error, call.timeout)
+
+    def stats(self) -> dict:
+        """Return :meth:`CircuitBreaker.stats` for every model seen so far."""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {model: breaker.stats() for model, breaker in breakers.items()}
+
+
+def _breakers_from_env() -> CircuitBreakers:
+    raw = os.environ.get("AGENT_CIRCUIT_BREAKERS")
+    settings = json.loads(raw) if raw else {}
+    enabled = os.environ.get("AGENT_CIRCUIT_BREAKER_ENABLED", "1") != "0"
+    return CircuitBreakers(settings, enabled=enabled)
+
+
+_breakers: CircuitBreakers | None = None
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breakers() -> CircuitBreakers:
+    """Return the process-wide :class:`CircuitBreakers`, configured from the environment."""
+    global _breakers
+    if _breakers is None:
+        with _breakers_lock:
+            if _breakers is None:
+                _breakers = _breakers_from_env()
+    return _breakers
+
+
+def circuit_breaker_stats() -> dict:
+    """Return the state of every model's circuit breaker."""
+    return get_circuit_breakers().stats()
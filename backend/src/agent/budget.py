@@ -0,0 +1,89 @@
+"""Per-run latency budget shared by every node of the research graph.
+
+A run's deadline is an absolute wall-clock timestamp stored in the graph state,
+so it survives checkpoints and is visible to each ``Send`` branch. Nodes use it
+to shrink their per-call timeouts, and ``evaluate_research`` uses it to decide
+whether another research loop still fits.
+"""
+
+import time
+from typing import Any, Mapping
+
+from agent.configuration import Configuration
+
+# Never hand an upstream call less than this, even when the budget is spent.
+MIN_CALL_TIMEOUT = 1.0
+
+
+def start_budget(configurable: Configuration) -> dict:
+    """Return the state update that starts the run clock."""
+    now = time.time()
+    deadline = (
+        now + configurable.run_deadline_seconds
+        if configurable.run_deadline_seconds
+        else None
+    )
+    return {"run_started_at": now, "run_deadline": deadline}
+
+
+def remaining_seconds(state: Mapping[str, Any]) -> float | None:
+    """Seconds left before the run deadline, or ``None`` if the run is unbounded."""
+    deadline = state.get("run_deadline")
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def answer_reserve(configurable: Configuration) -> float:
+    """Seconds of the run budget kept back for the final answer.
+
+    ``answer_reserve_seconds``, capped at ``answer_reserve_fraction`` of the
+    run deadline: a 20s reserve out of a 24s budget would leave every earlier
+    call with the 1s floor.
+    """
+    reserve = configurable.answer_reserve_seconds
+    if configurable.run_deadline_seconds:
+        reserve = min(
+            reserve,
+            configurable.answer_reserve_fraction * configurable.run_deadline_seconds,
+        )
+    return reserve
+
+
+def call_timeout(
+    state: Mapping[str, Any], configurable: Configuration, reserve: float = 0.0
+) -> float:
+    """Timeout for one upstream call, shrunk to fit the remaining budget.
+
+    Args:
+        state: Graph state carrying ``run_deadline``.
+        configurable: Resolved run configuration.
+        reserve: Seconds to keep back for work that must still happen after
+            this call, e.g. the final answer.
+    """
+    timeout = configurable.llm_timeout_seconds
+    remaining = remaining_seconds(state)
+    if remaining is None:
+        return timeout
+    return max(min(timeout, remaining - reserve), MIN_CALL_TIMEOUT)
+
+
+def budget_exhausted(state: Mapping[str, Any], reserve: float = 0.0) -> bool:
+    """Whether less than ``reserve`` seconds are left in the run budget."""
+    remaining = remaining_seconds(state)
+    return remaining is not None and remaining <= reserve
+
+
+def can_afford_loop(state: Mapping[str, Any], configurable: Configuration) -> bool:
+    """Whether another research loop fits before the answer reserve.
+
+    The cost of a loop is estimated from the run so far: the time elapsed since
+    the run started divided by the loops already completed.
+    """
+    remaining = remaining_seconds(state)
+    if remaining is None:
+        return True
+    started_at = state.get("run_started_at") or time.time()
+    loops_done = max(state.get("research_loop_count") or 0, 1)
+    loop_estimate = (time.time() - started_at) / loops_done
+    return remaining - answer_reserve(configurable) >= loop_estimate
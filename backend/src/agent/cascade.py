@@ -0,0 +1,120 @@
+"""Escalation rules and metrics for the reflection model cascade.
+
+In cascade mode ``reflection`` asks a fast model first and only escalates to
+the reasoning model when the fast verdict looks unreliable. Which verdicts
+count as unreliable is configured as a comma-separated list of rules:
+
+* ``inconsistent``: the verdict contradicts itself, i.e. insufficient without
+  follow-up queries, or sufficient with some.
+* ``short_gap``: insufficient, but the knowledge gap is shorter than
+  ``min_gap_chars``, so the follow-up queries are likely unfocused.
+* ``insufficient``: any insufficient verdict, so only the reasoning model
+  decides to keep researching.
+* ``sufficient``: any sufficient verdict, so only the reasoning model decides
+  to stop.
+* ``disagreement``: two fast samples disagree on ``is_sufficient``.
+
+Every reflection adds its outcome to the run's ``reflection_cascade`` state
+key and to process-wide counters, so escalation rates are visible per run
+and per replica.
+"""
+
+import threading
+from typing import Any, Mapping, Sequence
+
+RULES = ("inconsistent", "short_gap", "insufficient", "sufficient", "disagreement")
+
+
+def parse_rules(rules: str) -> tuple:
+    """Split a comma-separated rule list, rejecting unknown rules."""
+    parsed = tuple(rule.strip() for rule in rules.split(",") if rule.strip())
+    unknown = [rule for rule in parsed if rule not in RULES]
+    if unknown:
+        raise ValueError(
+            f"Unknown reflection cascade rules {unknown}, expected {RULES}"
+        )
+    return parsed
+
+
+def samples_needed(rules: Sequence[str]) -> int:
+    """Return the number of fast-model samples the rules need."""
+    return 2 if "disagreement" in rules else 1
+
+
+def escalation_reasons(
+    samples: Sequence[Any], rules: Sequence[str], min_gap_chars: int = 40
+) -> list:
+    """Return the rules that fire for the fast-model ``samples``; empty keeps the first sample.
+
+    Args:
+        samples: ``Reflection`` results of the fast model.
+        rules: Rule names, see the module docstring.
+        min_gap_chars: Shortest knowledge gap ``short_gap`` accepts.
+    """
+    first = samples[0]
+    checks = {
+        "inconsistent": lambda: first.is_sufficient == bool(first.follow_up_queries),
+        "short_gap": lambda: (
+            not first.is_sufficient and len(first.knowledge_gap.strip()) < min_gap_chars
+        ),
+        "insufficient": lambda: not first.is_sufficient,
+        "sufficient": lambda: first.is_sufficient,
+        "disagreement": lambda: len({s.is_sufficient for s in samples}) > 1,
+    }
+    return [rule for rule in rules if checks[rule]()]
+
+
+def cascade_update(escalated: bool, reasons: Sequence[str]) -> dict:
+    """Record one reflection's outcome and return it as a ``reflection_cascade`` value."""
+    outcome = {
+        "reflections": 1,
+        "escalations": int(escalated),
+        "reasons": {reason: 1 for reason in reasons},
+    }
+    _stats.add(outcome)
+    return outcome
+
+
+def merge_cascade(left: Mapping | None, right: Mapping | None) -> dict:
+    """Reducer summing ``reflection_cascade`` updates."""
+    left, right = left or {}, right or {}
+    reasons = dict(left.get("reasons", {}))
+    for reason, count in right.get("reasons", {}).items():
+        reasons[reason] = reasons.get(reason, 0) + count
+    return {
+        "reflections": left.get("reflections", 0) + right.get("reflections", 0),
+        "escalations": left.get("escalations", 0) + right.get("escalations", 0),
+        "reasons": reasons,
+    }
+
+
+class CascadeStats:
+    """Process-wide escalation counters."""
+
+    def __init__(self):
+        """Start with every counter at zero."""
+        self._lock = threading.Lock()
+        self._totals: dict = {}
+
+    def add(self, outcome: Mapping) -> None:
+        """Add the counters of one reflection, see :func:`merge_cascade`."""
+        with self._lock:
+            self._totals = merge_cascade(self._totals, outcome)
+
+    def stats(self) -> dict:
+        """Return the counters and the escalation rate."""
+        with self._lock:
+            totals = merge_cascade(self._totals, {})
+        reflections = totals["reflections"]
+        totals["escalation_rate"] = (
+            totals["escalations"] / reflections if reflections else 0.0
+        )
+        return totals
+
+
+_stats = CascadeStats()
+
+
+def cascade_stats() -> dict:
+    """Return the process-wide reflection cascade counters."""
+    return _stats.stats()
@@ -0,0 +1,449 @@
+"""Record/replay layer for Gemini calls.
+
+With a cassette configured, every grounded search made through the genai
+client and every call to a pooled chat model is written to (or read from) a
+JSON-lines cassette file, so the whole graph can run without network access
+or an API key, e.g. in CI or on benchmark machines.
+
+The cassette is configured from the environment:
+
+* ``AGENT_CASSETTE``: path of the cassette file. Unset disables the layer.
+* ``AGENT_CASSETTE_MODE``: ``record`` (call Gemini and append every
+  interaction), ``replay`` (serve recorded interactions only and raise
+  :class:`CassetteMissError` for anything unrecorded) or ``auto`` (replay
+  when recorded, otherwise record). Defaults to ``auto``.
+* ``AGENT_CASSETTE_LATENCY``: synthetic latency on replay: ``recorded``
+  (the latency measured while recording, the default), a fixed number of
+  seconds, or a ``low-high`` range drawn uniformly per call.
+* ``AGENT_CASSETTE_LATENCY_SCALE``: factor applied to the replay latency.
+
+Interactions are keyed by call kind, model, temperature, output schema and
+prompt, with the current date masked out of the prompt so a cassette keeps
+replaying on later days. Repeated identical calls replay their recordings in
+order, wrapping around.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Type
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from pydantic import BaseModel
+
+from agent.search_cache import as_response, serialize_response
+from agent.usage import usage_from_genai
+
+logger = logging.getLogger(__name__)
+
+# Matches prompts.get_current_date(), e.g. "June 05, 2025"
+_DATE = re.compile(
+    r"\b(?:January|February|March|April|May|June|July|August|September|October"
+    r"|November|December) \d{2}, \d{4}\b"
+)
+
+MODES = ("record", "replay", "auto")
+
+
+class CassetteMissError(LookupError):
+    """Raised in ``replay`` mode for a call that was never recorded."""
+
+
+def _message_to_dict(message: Any) -> dict:
+    return {
+        "content": message.content,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+    }
+
+
+def _message_from_dict(data: dict, cls: type = AIMessage) -> Any:
+    kwargs = {"content": data["content"]}
+    if data.get("usage_metadata"):
+        kwargs["usage_metadata"] = data["usage_metadata"]
+    return cls(**kwargs)
+
+
+def _genai_to_dict(response: Any) -> dict:
+    return {**serialize_response(response), "usage": list(usage_from_genai(response))}
+
+
+def _genai_from_dict(data: dict) -> SimpleNamespace:
+    response = as_response(data)
+    input_tokens, output_tokens = data.get("usage") or (0, 0)
+    response.usage_metadata = SimpleNamespace(
+        prompt_token_count=input_tokens, candidates_token_count=output_tokens
+    )
+    return response
+
+
+class Cassette:
+    """One cassette file and its recorded interactions.
+
+    Args:
+        path: JSON-lines file holding one interaction per line.
+        mode: One of ``record``, ``replay`` or ``auto``.
+        latency: Replay latency: ``"recorded"``, seconds, or ``"low-high"``.
+        latency_scale: Factor applied to the replay latency.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "auto",
+        latency: str = "recorded",
+        latency_scale: float = 1.0,
+    ):
+        """Load the interactions already recorded at ``path``, if any.
+
+        Raises:
+            ValueError: If ``mode`` is unknown.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency = str(latency)
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self.hits = 0
+        self.recorded = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._interactions.setdefault(entry["key"], []).append(entry)
+
+    @property
+    def replay_only(self) -> bool:
+        """Whether a miss is an error instead of a live call to record."""
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(request: dict) -> str:
+        """Stable key of a request, with the current date masked out."""
+        canonical = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(_DATE.sub("<date>", canonical).encode()).hexdigest()
+
+    def _lookup(self, key: str) -> dict | None:
+        if self.mode == "record":
+            return None
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            self.hits += 1
+            return entries[index % len(entries)]
+
+    def _miss(self, request: dict) -> None:
+        if self.replay_only:
+            raise CassetteMissError(
+                f"No recorded {request['kind']} call for model {request.get('model')!r} "
+                f"in cassette {self.path}"
+            )
+
+    def _record(self, key: str, request: dict, response: Any, elapsed: float) -> None:
+        entry = {
+            "key": key,
+            "request": request,
+            "response": response,
+            "elapsed": round(elapsed, 4),
+        }
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            self._interactions.setdefault(key, []).append(entry)
+            self.recorded += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def delay(self, entry: dict) -> float:
+        """Synthetic latency in seconds for replaying ``entry``."""
+        if self.latency == "recorded":
+            seconds = entry.get("elapsed") or 0.0
+        elif "-" in self.latency.lstrip("-"):
+            low, high = self.latency.split("-", 1)
+            seconds = random.uniform(float(low), float(high))
+        else:
+            seconds = float(self.latency)
+        return max(0.0, seconds * self.latency_scale)
+
+    def play(
+        self,
+        request: dict,
+        call: Callable[[], Any],
+        dump: Callable[[Any], Any],
+        load: Callable[[Any], Any],
+    ) -> Any:
+        """Replay ``request`` if recorded, otherwise run ``call`` and record it.
+
+        Args:
+            request: JSON-serializable description of the call, used as key.
+            call: Zero-argument callable making the real call.
+            dump: Converts the real response to JSON-serializable data.
+            load: Rebuilds a response from recorded data.
+        """
+        key = self.key(request)
+        entry = self._lookup(key)
+        if entry is not None:
+            time.sleep(self.delay(entry))
+            return load(entry["response"])
+        self._miss(request)
+        started = time.perf_counter()
+        response = call()
+        self._record(key, request, dump(response), time.perf_counter() - started)
+        return response
+
+    async def aplay(
+        self,
+        request: dict,
+        call: Callable[[], Any],
+        dump: Callable[[Any], Any],
+        load: Callable[[Any], Any],
+    ) -> Any:
+        """Async variant of :meth:`play`; ``call`` returns an awaitable."""
+        key = self.key(request)
+        entry = self._lookup(key)
+        if entry is not None:
+            await asyncio.sleep(self.delay(entry))
+            return load(entry["response"])
+        self._miss(request)
+        started = time.perf_counter()
+        response = await call()
+        self._record(key, request, dump(response), time.perf_counter() - started)
+        return response
+
+    def stats(self) -> dict:
+        """Return replay hits and newly recorded interactions."""
+        with self._lock:
+            return {"hits": self.hits, "recorded": self.recorded, "mode": self.mode}
+
+
+class _CassetteModels:
+    def __init__(self, cassette: Cassette, models: Any, is_async: bool):
+        self._cassette = cassette
+        self._models = models
+        self._is_async = is_async
+
+    def _request(self, model: str, contents: Any, config: Any) -> dict:
+        return {"kind": "genai", "model": model, "contents": contents, "config": config}
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        request = self._request(model, contents, config)
+        call = lambda: self._models.generate_content(  # noqa: E731
+            model=model, contents=contents, config=config
+        )
+        if self._is_async:
+            return self._cassette.aplay(request, call, _genai_to_dict, _genai_from_dict)
+        return self._cassette.play(request, call, _genai_to_dict, _genai_from_dict)
+
+
+class CassetteGenaiClient:
+    """Stand-in for ``google.genai.Client`` serving ``generate_content`` from a cassette.
+
+    Only ``models.generate_content`` and ``aio.models.generate_content`` are
+    covered, which is all the graph uses. ``client`` may be ``None`` in
+    ``replay`` mode.
+    """
+
+    def __init__(self, client: Any, cassette: Cassette):
+        """Serve from ``cassette``, recording misses with the real ``client``."""
+        self.models = _CassetteModels(cassette, getattr(client, "models", None), False)
+        self.aio = SimpleNamespace(
+            models=_CassetteModels(
+                cassette, getattr(getattr(client, "aio", None), "models", None), True
+            )
+        )
+
+
+class CassetteChatModel:
+    """Stand-in for a pooled chat runnable that records or replays its calls.
+
+    Supports ``invoke``, ``ainvoke``, ``stream`` and ``astream`` on string
+    prompts, as used by the graph. The real runnable is only built when a
+    call has to be recorded, so ``replay`` needs no API key.
+
+    Args:
+        factory: Zero-argument callable building the real runnable.
+        cassette: Cassette to record to or replay from.
+        model: Model name, part of the key.
+        temperature: Sampling temperature, part of the key.
+        schema: Structured output schema, if any; responses are then the
+            ``include_raw`` dicts with ``raw``, ``parsed`` and ``parsing_error``.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        cassette: Cassette,
+        model: str,
+        temperature: float,
+        schema: Type[BaseModel] | None = None,
+    ):
+        """Defer building the real runnable until a call must be recorded."""
+        self._factory = factory
+        self._runnable = None
+        self._lock = threading.Lock()
+        self.cassette = cassette
+        self.model = model
+        self.temperature = temperature
+        self.schema = schema
+
+    @property
+    def runnable(self) -> Any:
+        """The real runnable, built on first use."""
+        with self._lock:
+            if self._runnable is None:
+                self._runnable = self._factory()
+            return self._runnable
+
+    def _request(self, kind: str, prompt: Any) -> dict:
+        return {
+            "kind": kind,
+            "model": self.model,
+            "temperature": self.temperature,
+            "schema": self.schema.__name__ if self.schema else None,
+            "prompt": prompt,
+        }
+
+    def _dump(self, output: Any) -> dict:
+        if self.schema is None:
+            return _message_to_dict(output)
+        if output.get("parsing_error") is not None or output.get("parsed") is None:
+            raise ValueError("Refusing to record a failed structured output")
+        return {
+            "raw": _message_to_dict(output["raw"]),
+            "parsed": output["parsed"].model_dump(),
+        }
+
+    def _load(self, data: dict) -> Any:
+        if self.schema is None:
+            return _message_from_dict(data)
+        return {
+            "raw": _message_from_dict(data["raw"]),
+            "parsed": self.schema.model_validate(data["parsed"]),
+            "parsing_error": None,
+        }
+
+    def invoke(self, input: Any, config: dict | None = None, **kwargs: Any) -> Any:
+        """Replay the recorded response to ``input``, or record a live one."""
+        return self.cassette.play(
+            self._request("chat", input),
+            lambda: self.runnable.invoke(input, config=config, **kwargs),
+            self._dump,
+            self._load,
+        )
+
+    async def ainvoke(
+        self, input: Any, config: dict | None = None, **kwargs: Any
+    ) -> Any:
+        """Async variant of :meth:`invoke`."""
+        return await self.cassette.aplay(
+            self._request("chat", input),
+            lambda: self.runnable.ainvoke(input, config=config, **kwargs),
+            self._dump,
+            self._load,
+        )
+
+    @staticmethod
+    def _dump_chunks(chunks: List[Any]) -> List[dict]:
+        return [_message_to_dict(chunk) for chunk in chunks]
+
+    @staticmethod
+    def _load_chunks(data: List[dict]) -> List[Any]:
+        return [_message_from_dict(chunk, AIMessageChunk) for chunk in data]
+
+    def stream(
+        self, input: Any, config: dict | None = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        """Replay the recorded chunks of the response to ``input``, or record them."""
+        # The whole stream is recorded as one interaction; on replay its
+        # latency is spread evenly over the chunks.
+        request = self._request("chat_stream", input)
+        entry = self.cassette._lookup(self.cassette.key(request))
+        if entry is None:
+            self.cassette._miss(request)
+            chunks = self.cassette.play(
+                request,
+                lambda: list(self.runnable.stream(input, config=config, **kwargs)),
+                self._dump_chunks,
+                self._load_chunks,
+            )
+            yield from chunks
+            return
+        chunks = self._load_chunks(entry["response"])
+        pause = self.cassette.delay(entry) / max(len(chunks), 1)
+        for chunk in chunks:
+            time.sleep(pause)
+            yield chunk
+
+    async def astream(self, input: Any, config: dict | None = None, **kwargs: Any):
+        """Async variant of :meth:`stream`."""
+        request = self._request("chat_stream", input)
+        entry = self.cassette._lookup(self.cassette.key(request))
+        if entry is None:
+            self.cassette._miss(request)
+
+            async def collect() -> List[Any]:
+                return [
+                    chunk
+                    async for chunk in self.runnable.astream(
+                        input, config=config, **kwargs
+                    )
+                ]
+
+            chunks = await self.cassette.aplay(
+                request, collect, self._dump_chunks, self._load_chunks
+            )
+            for chunk in chunks:
+                yield chunk
+            return
+        chunks = self._load_chunks(entry["response"])
+        pause = self.cassette.delay(entry) / max(len(chunks), 1)
+        for chunk in chunks:
+            await asyncio.sleep(pause)
+            yield chunk
+
+
+_cassette: Cassette | None = None
+_cassette_lock = threading.Lock()
+_cassette_loaded = False
+
+
+def get_cassette() -> Cassette | None:
+    """Return the process-wide cassette from ``AGENT_CASSETTE``, or ``None``."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        with _cassette_lock:
+            if not _cassette_loaded:
+                path = os.environ.get("AGENT_CASSETTE")
+                if path:
+                    _cassette = Cassette(
+                        path,
+                        mode=os.environ.get("AGENT_CASSETTE_MODE", "auto"),
+                        latency=os.environ.get("AGENT_CASSETTE_LATENCY", "recorded"),
+                        latency_scale=float(
+                            os.environ.get("AGENT_CASSETTE_LATENCY_SCALE", 1.0)
+                        ),
+                    )
+                    logger.info(f"使用录制文件 {path}，模式: {_cassette.mode}")
+                _cassette_loaded = True
+    return _cassette
+
+
+def set_cassette(cassette: Cassette | None) -> Cassette | None:
+    """Replace the process-wide cassette; ``None`` disables record/replay."""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        _cassette, _cassette_loaded = cassette, True
+    return cassette
@@ -0,0 +1,149 @@
+"""Single-pass citation rendering.
+
+Inserting citation markers and rewriting short urls both used to rebuild the
+answer once per citation or per source, which is quadratic in the answer
+length times the number of citations. The functions here do each job in one
+linear pass:
+
+* :func:`insert_citation_markers` walks the citations in text order and
+  joins the text slices and markers once.
+* :class:`ShortUrlRewriter` matches every short url with one trie-shaped regex,
+  so each position of the text is examined once no matter how many sources
+  there are.
+"""
+
+import re
+from typing import Dict, Iterable, List
+
+
+def insert_citation_markers(text: str, citations_list: List[dict]) -> str:
+    """Insert citation markers into a text string based on start and end indices.
+
+    Args:
+        text (str): The original text string.
+        citations_list (list): A list of dictionaries, where each dictionary
+                               contains 'start_index', 'end_index', and
+                               'segments' (the links to insert as markers).
+                               Indices are assumed to be for the original text.
+
+    Returns:
+        str: The text with citation markers inserted.
+    """
+    # Citations sharing an end index are emitted by ascending start index, and
+    # exact ties in reverse input order, matching the previous end-to-start
+    # insertion.
+    ordered = sorted(
+        enumerate(citations_list),
+        key=lambda item: (item[1]["end_index"], item[1]["start_index"], -item[0]),
+    )
+    pieces, pos = [], 0
+    for _, citation_info in ordered:
+        end_idx = citation_info["end_index"]
+        if end_idx > pos:
+            pieces.append(text[pos:end_idx])
+            pos = end_idx
+        for segment in citation_info["segments"]:
+            pieces.append(f" [{segment['label']}]({segment['short_url']})")
+    pieces.append(text[pos:])
+    return "".join(pieces)
+
+
+def _trie_regex(keys: Iterable[str]) -> str:
+    """Build a regex matching any of ``keys``, factored by common prefix.
+
+    Where one key is a prefix of another the longer branch is tried first, so
+    the longest key always wins.
+    """
+    trie: dict = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if terminal else body
+
+    return build(trie)
+
+
+class ShortUrlRewriter:
+    """Rewrites short urls to their original urls, in one pass or incrementally.
+
+    All short urls are matched by one compiled trie-shaped regex, so the text
+    is scanned once regardless of the number of sources. In streaming use,
+    text that could still be the beginning of a short url split across chunks
+    is held back until the next chunk settles it. A caller that gives up on
+    a stream calls :meth:`cancel`, so the producer stops at its next chunk.
+
+    Args:
+        url_map: Mapping of short url to original url.
+    """
+
+    def __init__(self, url_map: Dict[str, str]):
+        """Rewrite the short urls in ``url_map`` to their original urls."""
+        self.url_map = url_map
+        self.used: set = set()
+        # Chunks consumed so far; a stream that consumed none can be restarted
+        self.fed = 0
+        self.cancelled = False
+        self._buffer = ""
+        keys = [key for key in url_map if key]
+        self._pattern = re.compile(_trie_regex(keys)) if keys else None
+        self._hold = max(map(len, keys), default=1) - 1
+
+    def _sub(self, match: "re.Match") -> str:
+        self.used.add(match.group())
+        return self.url_map[match.group()]
+
+    def rewrite(self, text: str) -> str:
+        """Rewrite every short url in ``text``."""
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(self._sub, text)
+
+    def feed(self, chunk: str) -> str:
+        """Consume the next streamed ``chunk`` and return the text that is settled."""
+        self.fed += 1
+        self._buffer += chunk
+        if self._pattern is None:
+            text, self._buffer = self._buffer, ""
+            return text
+        # A short url starting before `limit` lies entirely inside the buffer
+        limit = len(self._buffer) - self._hold
+        out, pos = [], 0
+        for match in self._pattern.finditer(self._buffer):
+            if match.start() >= limit:
+                break
+            out.append(self._buffer[pos : match.start()])
+            out.append(self._sub(match))
+            pos = match.end()
+        emit_to = max(pos, limit)
+        out.append(self._buffer[pos:emit_to])
+        self._buffer = self._buffer[emit_to:]
+        return "".join(out)
+
+    def cancel(self) -> None:
+        """Tell the producer of the stream that nobody reads its output anymore."""
+        self.cancelled = True
+
+    def flush(self) -> str:
+        """Return whatever is still held back at the end of the stream."""
+        text, self._buffer = self.rewrite(self._buffer), ""
+        return text
+
+
+def rewrite_short_urls(text: str, url_map: Dict[str, str]) -> str:
+    """Rewrite every short url in ``text`` to its original url in one scan."""
+    return ShortUrlRewriter(url_map).rewrite(text)
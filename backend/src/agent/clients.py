@@ -0,0 +1,142 @@
+"""Shared registry of ready-to-use Gemini chat runnables.
+
+Building a ``ChatGoogleGenerativeAI`` sets up a new transport, and
+``with_structured_output`` re-converts the schema every time. The registry
+builds each (model, temperature, schema) combination once and hands the same
+runnable to every node and run, so connections are reused under load.
+
+When a cassette is configured (see :mod:`agent.cassette`) the registry hands
+out recording/replaying stand-ins instead.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Tuple, Type
+
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from agent.cassette import CassetteChatModel, get_cassette
+
+
+class ClientRegistry:
+    """Bounded LRU cache of chat runnables keyed by model, temperature and schema.
+
+    Args:
+        max_size: Maximum number of runnables kept alive. The least recently
+            used entry is evicted once the registry is full.
+    """
+
+    def __init__(self, max_size: int = 32):
+        """Start empty; runnables are built on first use."""
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Runnable] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self,
+        model: str,
+        temperature: float,
+        schema: Type[BaseModel] | None = None,
+    ) -> Runnable:
+        """Return the chat runnable for ``model``, building it on first use.
+
+        Args:
+            model: Gemini model name.
+            temperature: Sampling temperature.
+            schema: Optional pydantic model; if given the runnable returns
+                ``{"raw", "parsed", "parsing_error"}`` via
+                ``with_structured_output(include_raw=True)``, so callers keep
+                the raw message and its token usage.
+        """
+        api_key = os.getenv("GEMINI_API_KEY")
+        cassette = get_cassette()
+        key: Tuple[Hashable, ...] = (
+            model,
+            float(temperature),
+            schema,
+            api_key,
+            id(cassette),
+        )
+        with self._lock:
+            runnable = self._entries.get(key)
+            if runnable is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return runnable
+
+            self.misses += 1
+            if cassette is None:
+                runnable = self._build(model, temperature, schema, api_key)
+            else:
+                runnable = CassetteChatModel(
+                    lambda: self._build(model, temperature, schema, api_key),
+                    cassette,
+                    model,
+                    temperature,
+                    schema,
+                )
+            self._entries[key] = runnable
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return runnable
+
+    @staticmethod
+    def _build(
+        model: str,
+        temperature: float,
+        schema: Type[BaseModel] | None,
+        api_key: str | None,
+    ) -> Runnable:
+        # Imported on first use: it pulls in the whole Google client stack
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        llm = ChatGoogleGenerativeAI(
+            model=model,
+            temperature=temperature,
+            # Throttled calls are requeued with backoff by agent.ratelimit; client
+            # retries would hold the slot and hammer an overloaded upstream
+            max_retries=0,
+            api_key=api_key,
+        )
+        if schema is not None:
+            return llm.with_structured_output(schema, include_raw=True)
+        return llm
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and the current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Drop every cached runnable and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+_registry = ClientRegistry(max_size=int(os.environ.get("AGENT_CLIENT_POOL_SIZE", 32)))
+
+
+def get_chat_model(
+    model: str, temperature: float, schema: Type[BaseModel] | None = None
+) -> Runnable:
+    """Return a pooled chat runnable from the process-wide registry."""
+    return _registry.get(model, temperature, schema)
+
+
+def client_pool_stats() -> dict:
+    """Return hit/miss counters of the process-wide registry."""
+    return _registry.stats()
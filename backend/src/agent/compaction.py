@@ -0,0 +1,63 @@
+"""Token-budgeted compaction of accumulated web research results.
+
+``web_research_result`` only grows, so without compaction every reflection and
+the final answer re-send everything gathered so far. Once the summaries no
+longer fit the configured token budget, the oldest raw results are folded into
+a rolling digest with one cheap model call. Each result is folded exactly
+once: later calls only fold results that arrived since, and prompts use the
+digest followed by the newest raw results.
+"""
+
+from typing import List
+
+# Rough characters-per-token ratio for Gemini tokenizers on English text.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate that does not need a tokenizer round trip."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def results_to_fold(
+    results: List[str], digest: str, compacted_count: int, budget: int | None
+) -> int:
+    """Return how many of the oldest raw results should be folded into the digest.
+
+    Args:
+        results: All web research results so far.
+        digest: The current rolling digest.
+        compacted_count: How many leading ``results`` the digest already covers.
+        budget: Token budget for the summaries in a prompt, or ``None`` for no
+            compaction.
+
+    Returns:
+        ``0`` while the digest plus the raw results fit the budget. Otherwise
+        enough of the oldest raw results for the rest to fit in half the
+        budget, always keeping the newest result raw.
+    """
+    raw = results[compacted_count:]
+    raw_tokens = [estimate_tokens(r) for r in raw]
+    if budget is None or estimate_tokens(digest) + sum(raw_tokens) <= budget:
+        return 0
+    remaining = sum(raw_tokens)
+    count = 0
+    while count < len(raw) - 1 and remaining > budget // 2:
+        remaining -= raw_tokens[count]
+        count += 1
+    return count
+
+
+def prompt_summaries(
+    results: List[str], digest: str, compacted_count: int
+) -> List[str]:
+    """Return the summaries to show a model: the digest, then the uncompacted results."""
+    raw = list(results[compacted_count:])
+    return [digest, *raw] if digest else raw
+
+
+def tokens_saved(results: List[str], summaries: List[str]) -> int:
+    """Estimated prompt tokens saved by sending ``summaries`` instead of ``results``."""
+    return max(
+        sum(map(estimate_tokens, results)) - sum(map(estimate_tokens, summaries)), 0
+    )
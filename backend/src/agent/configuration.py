@@ -1,9 +1,12 @@
+import json
 import os
-from pydantic import BaseModel, Field
-from typing import Any, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any
 
 from langchain_core.runnables import RunnableConfig
 
+from agent.cascade import parse_rules
+
 
 class Configuration(BaseModel):
     """The configuration for the agent."""
@@ -29,6 +32,41 @@ class Configuration(BaseModel):
         },
     )
 
+    reasoning_model: str | None = Field(
+        default=None,
+        metadata={
+            "description": "The language model to use for reflection and the answer instead of reflection_model and answer_model, as picked per run in the UI. Unset to use those."
+        },
+    )
+
+    reflection_cascade: bool = Field(
+        default=False,
+        metadata={
+            "description": "Ask cascade_model for the reflection first and escalate to the reasoning model only when one of cascade_rules fires."
+        },
+    )
+
+    cascade_model: str | None = Field(
+        default=None,
+        metadata={
+            "description": "The fast language model tried first in the reflection cascade. Unset to use query_generator_model."
+        },
+    )
+
+    cascade_rules: str = Field(
+        default="inconsistent,short_gap",
+        metadata={
+            "description": "Comma-separated rules that escalate a fast reflection to the reasoning model: inconsistent, short_gap, insufficient, sufficient, disagreement."
+        },
+    )
+
+    cascade_min_gap_chars: int = Field(
+        default=40,
+        metadata={
+            "description": "Shortest knowledge gap, in characters, the short_gap cascade rule accepts."
+        },
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -39,9 +77,136 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    run_deadline_seconds: float | None = Field(
+        default=None,
+        metadata={
+            "description": "End-to-end latency budget for one run in seconds. Unbounded if unset."
+        },
+    )
+
+    llm_timeout_seconds: float = Field(
+        default=30,
+        metadata={
+            "description": "Timeout for a single upstream model call in seconds."
+        },
+    )
+
+    answer_reserve_seconds: float = Field(
+        default=20,
+        metadata={
+            "description": "Part of the run budget kept back for generating the final answer."
+        },
+    )
+
+    answer_reserve_fraction: float = Field(
+        default=0.25,
+        metadata={
+            "description": "Largest fraction of run_deadline_seconds kept back for the final answer, so a short deadline still leaves time for the research. The reserve is the smaller of this and answer_reserve_seconds."
+        },
+    )
+
+    query_dedup_threshold: float | None = Field(
+        default=None,
+        metadata={
+            "description": "Word-set Jaccard similarity at or above which a search query counts as a near-duplicate and is skipped, e.g. 0.75. Unset to keep every generated query."
+        },
+    )
+
+    summary_token_budget: int | None = Field(
+        default=None,
+        metadata={
+            "description": "Token budget for the research summaries sent to reflection and the final answer. Older results are folded into a rolling digest once it is exceeded. Unset to disable."
+        },
+    )
+
+    stream_answer: bool = Field(
+        default=False,
+        metadata={
+            "description": "Stream the final answer, with short urls rewritten, on the custom stream as it is generated."
+        },
+    )
+
+    search_cache_enabled: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether to reuse cached grounded search results for the same query on the same day. The cache persists across runs and restarts in AGENT_SEARCH_CACHE_PATH (default ~/.cache/agent/search_cache.sqlite; empty to keep it in memory)."
+        },
+    )
+
+    search_coalescing_enabled: bool = Field(
+        default=True,
+        metadata={
+            "description": "Whether concurrent identical searches share one upstream call, across replicas when REDIS_URI is set."
+        },
+    )
+
+    answer_cache_enabled: bool = Field(
+        default=False,
+        metadata={
+            "description": "Whether to answer a question asked again on the same day, with the same models and research depth, from the answer cache. The cache persists across runs and restarts in AGENT_ANSWER_CACHE_PATH (default ~/.cache/agent/answer_cache.sqlite; empty to keep it in memory)."
+        },
+    )
+
+    answer_cache_refresh: bool = Field(
+        default=False,
+        metadata={
+            "description": "Research the question again even if a cached answer exists, and replace the cached answer."
+        },
+    )
+
+    hedge_quantile: float | None = Field(
+        default=None,
+        metadata={
+            "description": "Latency quantile of recent grounded searches, e.g. 0.95, after which a duplicate search is started and the first response used. The hedge rate is capped process-wide by AGENT_HEDGE_MAX_RATE. Unset to disable."
+        },
+    )
+
+    straggler_timeout_seconds: float | None = Field(
+        default=None,
+        metadata={
+            "description": "Seconds after a research loop's searches are sent out after which reflection stops waiting for the slowest ones. Late results are folded into the next loop or the final answer. Unset to wait for every search."
+        },
+    )
+
+    search_quorum: float | None = Field(
+        default=None,
+        metadata={
+            "description": "Fraction of a research loop's searches that must finish before the remaining ones only get straggler_grace_seconds more. Unset to disable."
+        },
+    )
+
+    straggler_grace_seconds: float = Field(
+        default=2.0,
+        metadata={
+            "description": "Seconds the remaining searches of a loop get once search_quorum is reached."
+        },
+    )
+
+    model_pricing: dict[str, dict[str, float]] | None = Field(
+        default=None,
+        metadata={
+            "description": 'Per-model prices in USD per million tokens, e.g. {"gemini-2.5-flash": {"input": 0.3, "output": 2.5}}, matched by longest model name prefix. Unset to use the built-in rates.'
+        },
+    )
+
+    @field_validator("model_pricing", mode="before")
+    @classmethod
+    def _parse_model_pricing(cls, value: Any) -> Any:
+        """Accept the pricing table as a JSON string, as set in the environment."""
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    @field_validator("cascade_rules")
+    @classmethod
+    def _check_cascade_rules(cls, value: str) -> str:
+        """Reject unknown cascade rules when the configuration is resolved."""
+        parse_rules(value)
+        return value
+
     @classmethod
     def from_runnable_config(
-        cls, config: Optional[RunnableConfig] = None
+        cls, config: RunnableConfig | None = None
     ) -> "Configuration":
         """Create a Configuration instance from a RunnableConfig."""
         configurable = (
@@ -0,0 +1,71 @@
+"""Near-duplicate suppression for search queries.
+
+Queries are compared by the Jaccard similarity of their normalized word sets,
+ignoring a handful of stopwords. It is cheap enough to run on every fan-out,
+and a reworded query that scores above the threshold is dropped before it
+costs a grounded LLM call.
+"""
+
+from typing import Iterable, List, Tuple
+
+from agent.search_cache import normalize_query
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to was what when "
+    "where which who why with".split()
+)
+
+
+def _stem(word: str) -> str:
+    """Crude plural/possessive folding so "apple's" and "apples" match "apple"."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def query_terms(query: str) -> frozenset:
+    """Return the normalized, stopword-free word set of ``query``."""
+    words = normalize_query(query).split()
+    terms = frozenset(_stem(w) for w in words if w not in _STOPWORDS)
+    # A query made only of stopwords still needs something to compare
+    return terms or frozenset(_stem(w) for w in words)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two term sets."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def dedupe_queries(
+    queries: Iterable[str], seen: Iterable[str], threshold: float
+) -> Tuple[List[str], List[dict]]:
+    """Drop queries that are near-duplicates of already seen or earlier queries.
+
+    Args:
+        queries: Candidate queries, in priority order.
+        seen: Queries that already ran; candidates are compared against them.
+        threshold: Similarity at or above which a candidate is dropped.
+
+    Returns:
+        The kept queries and one record per dropped query with the
+        ``query``, the ``duplicate_of`` query it matched and the ``similarity``.
+    """
+    known = [(q, query_terms(q)) for q in seen]
+    kept, dropped = [], []
+    for query in queries:
+        terms = query_terms(query)
+        match, score = None, 0.0
+        for other, other_terms in known:
+            similarity = jaccard(terms, other_terms)
+            if similarity > score:
+                match, score = other, similarity
+        if match is not None and score >= threshold:
+            dropped.append(
+                {"query": query, "duplicate_of": match, "similarity": round(score, 3)}
+            )
+            continue
+        kept.append(query)
+        known.append((query, terms))
+    return kept, dropped
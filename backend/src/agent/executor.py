@@ -0,0 +1,242 @@
+"""Process-wide execution layer for blocking upstream calls.
+
+Blocking LLM calls run on one bounded, reused thread pool instead of a fresh
+``ThreadPoolExecutor`` per call. A call that exceeds its timeout returns
+control to the caller immediately; the abandoned call keeps running in the
+background until it finishes on its own.
+
+An abandoned call keeps holding its worker thread, so the pool only stays
+usable if abandoned calls can never take every worker: ``max_abandoned`` must
+be smaller than ``max_workers``. Calls still waiting for a worker count
+against the same limit, so a burst queues behind live calls only up to that
+limit and fails fast after it.
+
+A call's deadline starts when a worker picks it up, so queueing does not eat
+into the time the call itself gets. Waiting for a worker is bounded by the
+same timeout, so a caller waits at most twice the timeout in total: up to
+``timeout`` for a worker, then up to ``timeout`` for the call. The time each
+call waits for a free worker is recorded on the caller's tracing span as
+``queue_wait_ms``.
+"""
+
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Any, Callable, Set
+
+from agent.tracing import annotate
+
+
+class AbandonedCallError(TimeoutError):
+    """Raised when a call times out while it keeps running on a worker thread.
+
+    Attributes:
+        future: The running call, for callers that must hold a resource, such
+            as a rate limiter slot, until it really finishes.
+    """
+
+    def __init__(self, message: str, future: concurrent.futures.Future):
+        """Wrap the still running ``future``."""
+        super().__init__(message)
+        self.future = future
+
+
+class WorkerTimeoutError(TimeoutError):
+    """Raised when no worker picked a call up within its timeout; it never ran."""
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when too many calls are queued or timed out but still running."""
+
+
+class DeadlineExecutor:
+    """Bounded thread pool that enforces a wall-clock deadline per call.
+
+    Args:
+        max_workers: Number of worker threads shared by every caller.
+        max_abandoned: Number of calls allowed to be either timed out but still
+            running in the background, or waiting for a worker. Once reached,
+            new calls fail fast with :class:`ExecutorSaturatedError` instead of
+            queueing behind them. Must be smaller than ``max_workers``.
+
+    Raises:
+        ValueError: If ``max_abandoned`` is not smaller than ``max_workers``.
+    """
+
+    def __init__(self, max_workers: int = 32, max_abandoned: int = 16):
+        """Create the pool; its worker threads are started lazily."""
+        if not 0 < max_abandoned < max_workers:
+            raise ValueError(
+                f"max_abandoned ({max_abandoned}) must be positive and smaller than "
+                f"max_workers ({max_workers}), or hung calls can hold every worker"
+            )
+        self.max_workers = max_workers
+        self.max_abandoned = max_abandoned
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="agent-call"
+        )
+        self._lock = threading.Lock()
+        self._abandoned: Set[concurrent.futures.Future] = set()
+        self._queued = 0
+        self._timeouts = 0
+        self._rejected = 0
+
+    @property
+    def abandoned_count(self) -> int:
+        """Number of timed-out calls that are still running."""
+        with self._lock:
+            return len(self._abandoned)
+
+    def stats(self) -> dict:
+        """Return counters describing the executor's current load."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "abandoned": len(self._abandoned),
+                "max_abandoned": self.max_abandoned,
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+            }
+
+    def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        timeout: float | None = 30,
+        **kwargs: Any,
+    ) -> Any:
+        """Run ``func`` on the shared pool and wait at most ``timeout`` seconds for it.
+
+        The deadline starts once a worker picks the call up. Waiting for a
+        worker is bounded by ``timeout`` as well, so this returns or raises
+        within ``2 * timeout`` of being called.
+
+        Raises:
+            TimeoutError: If no worker picks ``func`` up within ``timeout``;
+                the call is cancelled.
+            AbandonedCallError: If ``func`` does not finish within ``timeout``.
+                The caller regains control right away; the call is abandoned
+                and keeps running in the background.
+            ExecutorSaturatedError: If too many calls are queued or abandoned.
+        """
+        self._admit()
+        submitted = time.perf_counter()
+        started = threading.Event()
+        started_at = []
+
+        def timed() -> Any:
+            with self._lock:
+                self._queued -= 1
+            started_at.append(time.perf_counter())
+            started.set()
+            return func(*args, **kwargs)
+
+        future = self._pool.submit(timed)
+        try:
+            if not started.wait(timeout) and future.cancel():
+                with self._lock:
+                    self._queued -= 1
+                    self._timeouts += 1
+                raise WorkerTimeoutError(
+                    f"Operation waited {timeout}s for a free worker and was cancelled"
+                )
+            # The call may have started between the wait and the cancel
+            started.wait()
+            remaining = None
+            if timeout is not None:
+                remaining = max(started_at[0] + timeout - time.perf_counter(), 0)
+            try:
+                return future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError as exc:
+                if future.done():
+                    # ``func`` itself raised a TimeoutError, or just finished
+                    return future.result()
+                self.abandon(future)
+                raise AbandonedCallError(
+                    f"Operation timed out after {timeout}s", future
+                ) from exc
+        finally:
+            # Time spent waiting for a free worker, reported on the caller's span
+            wait = (started_at[0] if started_at else time.perf_counter()) - submitted
+            annotate(queue_wait_ms=round(wait * 1000, 3))
+
+    def submit(
+        self, func: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> concurrent.futures.Future:
+        """Start ``func`` on the shared pool and return its future without waiting.
+
+        For callers that decide for themselves how long to wait. Until a
+        worker picks it up the call counts against ``max_abandoned`` like any
+        queued call. A running call the caller stops waiting for must be
+        handed to :meth:`abandon`, so hung calls still cannot take every worker.
+
+        Raises:
+            ExecutorSaturatedError: If too many calls are queued or abandoned.
+        """
+        self._admit()
+
+        def started() -> Any:
+            with self._lock:
+                self._queued -= 1
+            return func(*args, **kwargs)
+
+        try:
+            return self._pool.submit(started)
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def _admit(self) -> None:
+        """Count a new call as queued, or refuse it if the backlog is full."""
+        with self._lock:
+            backlog = self._queued + len(self._abandoned)
+            if backlog >= self.max_abandoned:
+                self._rejected += 1
+                raise ExecutorSaturatedError(
+                    f"{self._queued} calls are waiting for a worker and "
+                    f"{len(self._abandoned)} timed-out calls are still running; "
+                    "refusing new work"
+                )
+            self._queued += 1
+
+    def abandon(self, future: concurrent.futures.Future) -> None:
+        """Track a timed-out, running ``future`` until it completes in the background."""
+        with self._lock:
+            self._timeouts += 1
+            self._abandoned.add(future)
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._abandoned.discard(future)
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting work and release the worker threads."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor: DeadlineExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> DeadlineExecutor:
+    """Return the process-wide :class:`DeadlineExecutor`, creating it on first use.
+
+    The pool size and abandoned-call limit can be tuned with the
+    ``AGENT_EXECUTOR_MAX_WORKERS`` and ``AGENT_EXECUTOR_MAX_ABANDONED``
+    environment variables.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DeadlineExecutor(
+                    max_workers=int(os.environ.get("AGENT_EXECUTOR_MAX_WORKERS", 32)),
+                    max_abandoned=int(
+                        os.environ.get("AGENT_EXECUTOR_MAX_ABANDONED", 16)
+                    ),
+                )
+    return _executor
@@ -1,91 +1,392 @@
+import asyncio
+import contextlib
+import functools
+import inspect
 import os
 import logging
+import operator
+import threading
+import time
 
 from agent.tools_and_schemas import SearchQueryList, Reflection
-from dotenv import load_dotenv
-
-# 配置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
 from langchain_core.messages import AIMessage
 from langgraph.types import Send
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
-from langchain_core.runnables import RunnableConfig
-from google.genai import Client
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ensure_config, merge_configs
 
 from agent.state import (
+    merge_sources,
     OverallState,
     QueryGenerationState,
     ReflectionState,
     WebSearchState,
 )
 from agent.configuration import Configuration
+from agent.dedup import dedupe_queries
+from agent.budget import (
+    answer_reserve,
+    budget_exhausted,
+    call_timeout,
+    can_afford_loop,
+    start_budget,
+)
 from agent.prompts import (
     get_current_date,
     query_writer_instructions,
     web_searcher_instructions,
     reflection_instructions,
     answer_instructions,
+    compaction_instructions,
+)
+from agent.compaction import prompt_summaries, results_to_fold, tokens_saved
+from agent.clients import client_pool_stats, get_chat_model
+from agent.singleflight import get_coalescer
+from agent.search_cache import (
+    as_response,
+    get_search_cache,
+    search_cache_key,
+    serialize_response,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
 from agent.utils import (
     get_citations,
     get_research_topic,
-    insert_citation_markers,
     resolve_urls,
     run_with_timeout,
+    arun_with_timeout,
+)
+from agent.citations import ShortUrlRewriter, insert_citation_markers
+from agent.usage import merge_usage, record_usage, usage_from_genai, usage_from_message
+from agent.tracing import RetryCounter, annotate, get_tracer, traced_node
+from agent.cassette import CassetteGenaiClient, get_cassette
+from agent.ratelimit import get_rate_limiter, rate_limiter_stats
+from agent.pipeline import StragglerPolicy, get_stragglers
+from agent.hedging import get_hedger
+from agent.breaker import (
+    CircuitOpenError,
+    circuit_breaker_stats,
+    get_circuit_breakers,
+)
+from agent.cascade import (
+    cascade_update,
+    escalation_reasons,
+    parse_rules,
+    samples_needed,
 )
+from agent.answer_cache import (
+    answer_cache_key,
+    get_answer_cache,
+    seconds_until_next_bucket,
+)
+
+logger = logging.getLogger(__name__)
+
+# Importing this module only builds the graph. Loading ``.env``, configuring
+# logging and building the genai client happen on first use, so a server
+# starts (and ``langgraph dev`` reloads) without touching the Google stack,
+# and a missing API key fails the run instead of the process.
+_started = False
+_genai_client = None
+_genai_client_key = None
+_genai_client_overridden = False
+_startup_lock = threading.Lock()
 
-load_dotenv()
 
-# 检查必需的环境变量
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if gemini_api_key is None:
-    logger.error("GEMINI_API_KEY 环境变量未设置")
-    raise ValueError("GEMINI_API_KEY is not set")
-else:
-    logger.info("GEMINI_API_KEY 已正确设置")
+def _startup() -> None:
+    """Load ``.env`` and configure logging, once per process."""
+    global _started
+    if _started:
+        return
+    with _startup_lock:
+        if _started:
+            return
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        # 配置日志记录
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        )
+        _started = True
+
 
-# 检查 API 密钥格式
-if not gemini_api_key.startswith("AIza"):
-    logger.warning("GEMINI_API_KEY 格式可能不正确，应以 'AIza' 开头")
+def _build_genai_client(cassette):
+    """Build the genai client for the current API key and cassette."""
+    # Replaying a cassette needs neither the API key nor a real client
+    replaying = cassette is not None and cassette.replay_only
 
-# Used for Google Search API
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
+    # 检查必需的环境变量
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if gemini_api_key is None and not replaying:
+        logger.error("GEMINI_API_KEY 环境变量未设置")
+        raise ValueError("GEMINI_API_KEY is not set")
+    elif gemini_api_key is not None:
+        logger.info("GEMINI_API_KEY 已正确设置")
+
+        # 检查 API 密钥格式
+        if not gemini_api_key.startswith("AIza"):
+            logger.warning("GEMINI_API_KEY 格式可能不正确，应以 'AIza' 开头")
+
+    client = None
+    if not replaying:
+        from google.genai import Client
+
+        client = Client(api_key=gemini_api_key)
+    if cassette is not None:
+        client = CassetteGenaiClient(client, cassette)
+    return client
+
+
+def get_genai_client():
+    """Return the genai client used for Google Search, building it on first use.
+
+    The client is rebuilt when the API key or the cassette changes, like the
+    chat models in :mod:`agent.clients`.
+    """
+    global _genai_client, _genai_client_key
+    _startup()
+    if _genai_client_overridden:
+        return _genai_client
+    cassette = get_cassette()
+    key = (os.getenv("GEMINI_API_KEY"), id(cassette))
+    if _genai_client is None or _genai_client_key != key:
+        with _startup_lock:
+            if _genai_client is None or _genai_client_key != key:
+                _genai_client = _build_genai_client(cassette)
+                _genai_client_key = key
+    return _genai_client
+
+
+def set_genai_client(client) -> None:
+    """Use ``client`` for Google Search; ``None`` goes back to building one."""
+    global _genai_client, _genai_client_key, _genai_client_overridden
+    with _startup_lock:
+        _genai_client = client
+        _genai_client_key = None
+        _genai_client_overridden = client is not None
 
 
 # Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
-    """LangGraph node that generates a search queries based on the User's question.
+def _structured_result(output: dict):
+    """Unpack an ``include_raw`` structured output into ``(parsed, raw_message)``."""
+    if output.get("parsing_error") is not None:
+        raise output["parsing_error"]
+    if output.get("parsed") is None:
+        raise ValueError("Model returned no structured output")
+    return output["parsed"], output["raw"]
 
-    Uses Gemini 2.0 Flash to create an optimized search query for web research based on
-    the User's question.
+
+def _track_usage(node: str, model: str, tokens: tuple, config: RunnableConfig) -> dict:
+    """Price and log one model call and return it as a ``token_usage`` update."""
+    configurable = Configuration.from_runnable_config(config)
+    annotate(model=model, input_tokens=tokens[0], output_tokens=tokens[1])
+    return {
+        "token_usage": record_usage(node, model, *tokens, configurable.model_pricing)
+    }
+
+
+def _model_span(node: str, state: dict, **attributes):
+    """Tracing span around one upstream model call made by ``node``."""
+    return get_tracer().span(
+        f"llm.{node}",
+        node=node,
+        branch_id=state.get("id"),
+        loop=state.get("research_loop_count"),
+        **attributes,
+    )
+
+
+def _call_config(span, **config) -> dict:
+    """Runnable config for one model call, counting its retries on ``span``.
+
+    Built on the calling node's config, so the call keeps the run's callbacks,
+    tags and metadata even when it runs on an executor thread.
+    """
+    config = merge_configs(ensure_config(), config)
+    if span is not None:
+        config = merge_configs(config, {"callbacks": [RetryCounter(span)]})
+    return config
+
+
+def _call_upstream(model: str, timeout: float, call, retryable=None):
+    """Make one upstream call to ``model``: circuit breaker first, then rate limiter.
+
+    An open breaker fails the call right away, before it queues for a slot.
+    ``call`` receives the part of ``timeout`` left after queueing as
+    ``timeout``; a throttled call is requeued (see ``RateLimiter.call``).
+    The breaker is told that timeout, so it ignores calls cut short.
+    """
+    with get_circuit_breakers().guard(model) as guarded:
+
+        def attempt(timeout: float):
+            guarded.timeout = timeout
+            return call(timeout=timeout)
+
+        return get_rate_limiter().call(model, attempt, timeout, retryable)
+
+
+async def _acall_upstream(model: str, timeout: float, call, retryable=None):
+    """Async variant of :func:`_call_upstream`."""
+    with get_circuit_breakers().guard(model) as guarded:
+
+        async def attempt(timeout: float):
+            guarded.timeout = timeout
+            return await call(timeout=timeout)
+
+        return await get_rate_limiter().acall(model, attempt, timeout, retryable)
+
+
+# Keys that several parts of one node update may carry, with how they combine
+_UPDATE_REDUCERS = {
+    "token_usage": merge_usage,
+    "sources_gathered": merge_sources,
+    "web_research_result": operator.add,
+}
+
+
+def _combine_updates(*updates: dict) -> dict:
+    """Merge node state updates, combining keys that several of them carry."""
+    combined: dict = {}
+    for update in updates:
+        for key, value in update.items():
+            if key in _UPDATE_REDUCERS and key in combined:
+                value = _UPDATE_REDUCERS[key](combined[key], value)
+            combined[key] = value
+    return combined
+
+
+def _answer_cache_key(state: OverallState, config: RunnableConfig) -> str | None:
+    """Answer cache key of this run's question, or ``None`` if the cache is off."""
+    configurable = Configuration.from_runnable_config(config)
+    if not configurable.answer_cache_enabled:
+        return None
+    reasoning_model = state.get("reasoning_model") or configurable.reasoning_model
+    models = (
+        configurable.query_generator_model,
+        reasoning_model or configurable.reflection_model,
+        reasoning_model or configurable.answer_model,
+    )
+    depth = (
+        state.get("initial_search_query_count")
+        or configurable.number_of_initial_queries,
+        state.get("max_research_loops") or configurable.max_research_loops,
+    )
+    return answer_cache_key(
+        get_research_topic(state["messages"]), models, depth, get_current_date()
+    )
+
+
+def check_answer_cache(state: OverallState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that answers from the answer cache when it can.
+
+    A hit returns the cached answer and its cited sources, and the graph ends
+    without doing any research. ``answer_cache_refresh`` skips the lookup so
+    the question is researched again and its cached answer replaced.
 
     Args:
         state: Current graph state containing the User's question
-        config: Configuration for the runnable, including LLM provider settings
+        config: Configuration for the runnable, including cache settings
 
     Returns:
-        Dictionary with state update, including search_query key containing the generated query
+        Dictionary with state update, including answer_cache_hit and, on a
+        hit, the cached answer message and sources
     """
+    key = _answer_lookup_key(state, config)
+    cached = None if key is None else get_answer_cache().get(key)
+    return _answer_cache_update(cached, key, config)
+
+
+async def acheck_answer_cache(
+    state: OverallState, config: RunnableConfig
+) -> OverallState:
+    """Async variant of :func:`check_answer_cache`, reading the cache off the loop."""
+    key = _answer_lookup_key(state, config)
+    cached = None if key is None else await get_answer_cache().aget(key)
+    return _answer_cache_update(cached, key, config)
+
+
+def _answer_lookup_key(state: OverallState, config: RunnableConfig) -> str | None:
+    """Answer cache key to look up, or ``None`` if the lookup is disabled or skipped."""
+    key = _answer_cache_key(state, config)
+    if (
+        key is not None
+        and Configuration.from_runnable_config(config).answer_cache_refresh
+    ):
+        logger.info("强制刷新，忽略缓存的答案")
+        annotate(answer_cache="refresh")
+        return None
+    return key
+
+
+def _answer_cache_update(cached, key, config: RunnableConfig) -> OverallState:
+    """State update for the answer cache lookup of ``key`` that found ``cached``."""
+    if key is None:
+        return {"answer_cache_hit": False}
+    annotate(answer_cache="miss" if cached is None else "hit")
+    if cached is None:
+        return {"answer_cache_hit": False}
+    logger.info("命中答案缓存，跳过研究")
+    if Configuration.from_runnable_config(config).stream_answer:
+        _emit_answer_chunk(get_stream_writer(), cached["answer"])
+    return {
+        "messages": [AIMessage(content=cached["answer"])],
+        "sources_gathered": cached["sources"],
+        "answer_cache_hit": True,
+    }
+
+
+def route_answer_cache(state: OverallState) -> str:
+    """LangGraph routing function that ends the run on an answer cache hit."""
+    return END if state.get("answer_cache_hit") else "generate_query"
+
+
+def _answer_entry(update: dict) -> dict:
+    """Answer cache entry for a final answer: the answer and its cited sources."""
+    sources = [source for source in update["sources_gathered"] if source.get("cited")]
+    return {"answer": update["messages"][-1].content, "sources": sources}
+
+
+def _cache_answer(state: OverallState, config: RunnableConfig, update: dict) -> None:
+    """Store the final answer and its cited sources in the answer cache."""
+    key = _answer_cache_key(state, config)
+    if key is None:
+        return
+    # Valid for the rest of the date bucket the research was done in
+    get_answer_cache().put(
+        key, _answer_entry(update), ttl_seconds=seconds_until_next_bucket()
+    )
+
+
+async def _acache_answer(
+    state: OverallState, config: RunnableConfig, update: dict
+) -> None:
+    """Async variant of :func:`_cache_answer`, writing the cache off the loop."""
+    key = _answer_cache_key(state, config)
+    if key is None:
+        return
+    await get_answer_cache().aput(
+        key, _answer_entry(update), ttl_seconds=seconds_until_next_bucket()
+    )
+
+
+def _query_generation_inputs(state: OverallState, config: RunnableConfig):
+    """Build the structured query generator, its prompt, the run budget and model name."""
     configurable = Configuration.from_runnable_config(config)
+    budget = start_budget(configurable)
+    timeout = call_timeout(budget, configurable, reserve=answer_reserve(configurable))
 
     # check for custom initial search query count
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
 
-    # init Gemini 2.0 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=configurable.query_generator_model,
-        temperature=1.0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
+    # Gemini 2.0 Flash from the shared client registry
+    structured_llm = get_chat_model(
+        configurable.query_generator_model, temperature=1.0, schema=SearchQueryList
     )
-    structured_llm = llm.with_structured_output(SearchQueryList)
 
     # Format the prompt
     current_date = get_current_date()
@@ -94,12 +395,106 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
         research_topic=get_research_topic(state["messages"]),
         number_queries=state["initial_search_query_count"],
     )
+    return (
+        structured_llm,
+        formatted_prompt,
+        timeout,
+        budget,
+        configurable.query_generator_model,
+    )
+
+
+def _drop_duplicate_queries(
+    queries: list, seen: list, config: RunnableConfig
+) -> tuple[list, list]:
+    """Drop near-duplicate queries before they are fanned out to web_research."""
+    configurable = Configuration.from_runnable_config(config)
+    if configurable.query_dedup_threshold is None:
+        return list(queries), []
+    kept, dropped = dedupe_queries(
+        queries, seen, threshold=configurable.query_dedup_threshold
+    )
+    if dropped:
+        logger.info(f"跳过 {len(dropped)} 个相似查询: {[d['query'] for d in dropped]}")
+    return kept, dropped
+
+
+def _query_generation_update(
+    output: dict, budget: dict, config: RunnableConfig
+) -> dict:
+    """Turn the structured ``SearchQueryList`` output into the generate_query state update."""
+    result, raw = _structured_result(output)
+    logger.info(f"成功生成 {len(result.query)} 个搜索查询")
+    query_list, skipped = _drop_duplicate_queries(result.query, [], config)
+    model = Configuration.from_runnable_config(config).query_generator_model
+    return {
+        "query_list": query_list,
+        "skipped_queries": skipped,
+        **budget,
+        **_track_usage("generate_query", model, usage_from_message(raw), config),
+    }
+
+
+def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+    """LangGraph node that generates a search queries based on the User's question.
+
+    Uses Gemini 2.0 Flash to create an optimized search query for web research based on
+    the User's question.
+
+    Args:
+        state: Current graph state containing the User's question
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated query
+    """
+    structured_llm, formatted_prompt, timeout, budget, model = _query_generation_inputs(
+        state, config
+    )
     # Generate the search queries with a timeout to avoid hanging
     try:
         logger.info("开始生成搜索查询...")
-        result = run_with_timeout(structured_llm.invoke, formatted_prompt)
-        logger.info(f"成功生成 {len(result.query)} 个搜索查询")
-        return {"query_list": result.query}
+        with _model_span("generate_query", state, model=model) as span:
+            output = _call_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    run_with_timeout,
+                    structured_llm.invoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
+            )
+            return _query_generation_update(output, budget, config)
+    except TimeoutError as e:
+        logger.error(f"生成搜索查询超时: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"生成搜索查询时发生错误: {e}")
+        raise
+
+
+async def agenerate_query(
+    state: OverallState, config: RunnableConfig
+) -> QueryGenerationState:
+    """Async variant of :func:`generate_query` using ``ainvoke``."""
+    structured_llm, formatted_prompt, timeout, budget, model = _query_generation_inputs(
+        state, config
+    )
+    try:
+        logger.info("开始生成搜索查询...")
+        with _model_span("generate_query", state, model=model) as span:
+            output = await _acall_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    arun_with_timeout,
+                    structured_llm.ainvoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
+            )
+            return _query_generation_update(output, budget, config)
     except TimeoutError as e:
         logger.error(f"生成搜索查询超时: {e}")
         raise
@@ -113,12 +508,248 @@ def continue_to_web_research(state: QueryGenerationState):
 
     This is used to spawn n number of web research nodes, one for each search query.
     """
+    loop_started_at = time.time()
     return [
-        Send("web_research", {"search_query": search_query, "id": int(idx)})
+        Send(
+            "web_research",
+            {
+                "search_query": search_query,
+                "id": int(idx),
+                "run_deadline": state.get("run_deadline"),
+                "trace_id": state.get("trace_id"),
+                "loop_started_at": loop_started_at,
+                "fanout": len(state["query_list"]),
+            },
+        )
         for idx, search_query in enumerate(state["query_list"])
     ]
 
 
+def _web_research_request(state: WebSearchState, config: RunnableConfig):
+    """Build the grounded Google Search call arguments, its timeout and its keys.
+
+    Returns the genai request kwargs, the call timeout, the coalescing key
+    (``None`` when coalescing is disabled) and the cache key (``None`` when the
+    search cache is disabled). Both keys are the normalized search key.
+    """
+    configurable = Configuration.from_runnable_config(config)
+    current_date = get_current_date()
+    formatted_prompt = web_searcher_instructions.format(
+        current_date=current_date,
+        research_topic=state["search_query"],
+    )
+    request = {
+        "model": configurable.query_generator_model,
+        "contents": formatted_prompt,
+        "config": {
+            "tools": [{"google_search": {}}],
+            "temperature": 0,
+        },
+    }
+    timeout = call_timeout(state, configurable, reserve=answer_reserve(configurable))
+    search_key = search_cache_key(
+        state["search_query"], configurable.query_generator_model, current_date
+    )
+    return (
+        request,
+        timeout,
+        search_key if configurable.search_coalescing_enabled else None,
+        search_key if configurable.search_cache_enabled else None,
+    )
+
+
+def _search_attempt(request: dict, timeout: float):
+    """Make one grounded search call within ``timeout``, queueing for a rate limit slot."""
+    model = request["model"]
+
+    def search(timeout: float):
+        with get_hedger().timed(model):
+            return run_with_timeout(
+                get_genai_client().models.generate_content, **request, timeout=timeout
+            )
+
+    return _call_upstream(model, timeout, search)
+
+
+async def _asearch_attempt(request: dict, timeout: float):
+    """Async variant of :func:`_search_attempt`."""
+    model = request["model"]
+
+    async def search(timeout: float):
+        with get_hedger().timed(model):
+            return await arun_with_timeout(
+                get_genai_client().aio.models.generate_content,
+                **request,
+                timeout=timeout,
+            )
+
+    return await _acall_upstream(model, timeout, search)
+
+
+def _search(request: dict, timeout: float, config: RunnableConfig):
+    """Make the grounded search call, hedged when ``hedge_quantile`` is set."""
+    quantile = Configuration.from_runnable_config(config).hedge_quantile
+    if quantile is None:
+        return _search_attempt(request, timeout)
+    return get_hedger().run(
+        request["model"], functools.partial(_search_attempt, request), timeout, quantile
+    )
+
+
+async def _asearch(request: dict, timeout: float, config: RunnableConfig):
+    """Async variant of :func:`_search`."""
+    quantile = Configuration.from_runnable_config(config).hedge_quantile
+    if quantile is None:
+        return await _asearch_attempt(request, timeout)
+    return await get_hedger().arun(
+        request["model"],
+        functools.partial(_asearch_attempt, request),
+        timeout,
+        quantile,
+    )
+
+
+def _cached_search(cache_key) -> dict | None:
+    """Return the cached search payload for ``cache_key``, if any."""
+    if cache_key is None:
+        return None
+    payload = get_search_cache().get(cache_key)
+    if payload is not None:
+        logger.info("命中搜索缓存")
+    return payload
+
+
+async def _acached_search(cache_key) -> dict | None:
+    """Async variant of :func:`_cached_search`, reading the cache off the loop."""
+    if cache_key is None:
+        return None
+    payload = await get_search_cache().aget(cache_key)
+    if payload is not None:
+        logger.info("命中搜索缓存")
+    return payload
+
+
+def _remember_search(cache_key, response) -> dict:
+    """Serialize a live search response and store it in the search cache."""
+    payload = serialize_response(response)
+    if cache_key is not None and payload["text"]:
+        get_search_cache().put(cache_key, payload)
+    return payload
+
+
+async def _aremember_search(cache_key, response) -> dict:
+    """Async variant of :func:`_remember_search`, writing the cache off the loop."""
+    payload = serialize_response(response)
+    if cache_key is not None and payload["text"]:
+        await get_search_cache().aput(cache_key, payload)
+    return payload
+
+
+def _empty_search_update(state: WebSearchState) -> OverallState:
+    """State update for a search branch that returns without a result."""
+    return {
+        "sources_gathered": [],
+        "search_query": [state["search_query"]],
+        "web_research_result": [],
+    }
+
+
+def _skipped_search_update(state: WebSearchState) -> OverallState:
+    """State update for a search branch that ran out of run budget."""
+    logger.warning(f"运行预算不足，跳过搜索结果: {state['search_query']}")
+    return _empty_search_update(state)
+
+
+def _degraded_search_update(
+    state: WebSearchState, error: CircuitOpenError
+) -> OverallState:
+    """State update for a search branch whose model's circuit breaker is open.
+
+    The run goes on with the other branches' results and records the model
+    in ``degraded_models``.
+    """
+    logger.warning(f"模型 {error.model} 已熔断，跳过搜索: {state['search_query']}")
+    return {**_empty_search_update(state), "degraded_models": [error.model]}
+
+
+def _straggler_policy(config: RunnableConfig) -> StragglerPolicy | None:
+    """Return the configured straggler policy, or ``None`` to wait for every search."""
+    configurable = Configuration.from_runnable_config(config)
+    if (
+        configurable.straggler_timeout_seconds is None
+        and not configurable.search_quorum
+    ):
+        return None
+    return StragglerPolicy(
+        timeout=configurable.straggler_timeout_seconds,
+        quorum=configurable.search_quorum,
+        grace=configurable.straggler_grace_seconds,
+    )
+
+
+def _fold_late_results(
+    state: OverallState, config: RunnableConfig, final: bool = False
+) -> dict:
+    """Fold searches that finished after their branch stopped waiting into ``state``.
+
+    Their queries were already recorded by the branch; their results and
+    sources are added to ``state`` and returned as a state update.
+    """
+    late = get_stragglers().collect(state.get("trace_id"), final=final)
+    if not late:
+        return {}
+    updates = []
+    for (branch_state, model, usage), payload in late:
+        update = _web_research_update(branch_state, payload, model, usage, config)
+        update.pop("search_query")
+        updates.append(update)
+    update = _combine_updates(*updates)
+    logger.info(f"并入 {len(late)} 条迟到的搜索结果")
+    state["web_research_result"] = (
+        state["web_research_result"] + update["web_research_result"]
+    )
+    state["sources_gathered"] = merge_sources(
+        state["sources_gathered"], update["sources_gathered"]
+    )
+    return update
+
+
+def _web_research_update(
+    state: WebSearchState,
+    payload: dict,
+    model: str | None = None,
+    usage: list | None = None,
+    config: RunnableConfig | None = None,
+) -> OverallState:
+    """Turn a grounded search payload into the web_research state update.
+
+    Short urls are derived for this branch's ``id`` here, so cached payloads
+    get citations that are correct for the branch that reuses them. ``usage``
+    holds the token counts of the upstream call, if this branch made one.
+    """
+    response = as_response(payload)
+    # resolve the urls to short urls for saving tokens and time
+    resolved_urls = resolve_urls(
+        response.candidates[0].grounding_metadata.grounding_chunks, state["id"]
+    )
+    # Gets the citations and adds them to the generated text
+    citations = get_citations(response, resolved_urls)
+    modified_text = insert_citation_markers(response.text, citations)
+    # One entry per unique source, with a reference count, instead of one per segment
+    sources_gathered = merge_sources(
+        [], [item for citation in citations for item in citation["segments"]]
+    )
+
+    update = {
+        "sources_gathered": sources_gathered,
+        "search_query": [state["search_query"]],
+        "web_research_result": [modified_text],
+    }
+    if usage:
+        update.update(_track_usage("web_research", model, usage[0], config))
+    return update
+
+
 def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     """LangGraph node that performs web research using the native Google Search API tool.
 
@@ -131,94 +762,525 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     Returns:
         Dictionary with state update, including sources_gathered, research_loop_count, and web_research_results
     """
-    # Configure
-    configurable = Configuration.from_runnable_config(config)
-    formatted_prompt = web_searcher_instructions.format(
-        current_date=get_current_date(),
-        research_topic=state["search_query"],
-    )
+    request, timeout, flight_key, cache_key = _web_research_request(state, config)
+    policy = _straggler_policy(config)
+    payload = _cached_search(cache_key)
+    if payload is not None:
+        if policy is not None:
+            # Counts towards the loop's quorum like a finished search
+            get_stragglers().skip(state, policy)
+        return _web_research_update(state, payload)
+
+    # Token usage is only recorded by the caller that actually hit the API
+    usage: list = []
 
     # Uses the google genai client as the langchain client doesn't return grounding metadata
+    def search() -> dict:
+        # A concurrent leader may have filled the cache since the lookup above
+        cached = _cached_search(cache_key)
+        if cached is not None:
+            return cached
+        model = request["model"]
+        with _model_span("web_research", state, model=model) as span:
+            response = _search(request, timeout, config)
+            usage.append(usage_from_genai(response))
+            if span:
+                span.set(input_tokens=usage[0][0], output_tokens=usage[0][1])
+        return _remember_search(cache_key, response)
+
+    def fetch() -> dict:
+        if flight_key is None:
+            return search()
+        # Identical in-flight queries share one upstream call
+        return get_coalescer().do(flight_key, search, timeout=timeout)
+
     try:
         logger.info(f"开始网络搜索，查询: {state['search_query']}")
-        response = run_with_timeout(
-            genai_client.models.generate_content,
-            model=configurable.query_generator_model,
-            contents=formatted_prompt,
-            config={
-                "tools": [{"google_search": {}}],
-                "temperature": 0,
-            },
-        )
+        if policy is None:
+            payload = fetch()
+        else:
+            payload = get_stragglers().run(
+                state, fetch, policy, (state, request["model"], usage)
+            )
+            if payload is None:
+                # Still running; a later step folds the result in
+                return _empty_search_update(state)
         logger.info("网络搜索完成")
+    except CircuitOpenError as e:
+        return _degraded_search_update(state, e)
     except TimeoutError as e:
         logger.error(f"网络搜索超时: {e}")
+        # Under a run deadline a late branch is dropped instead of failing the run
+        if state.get("run_deadline") is not None:
+            return _skipped_search_update(state)
         raise
     except Exception as e:
         logger.error(f"网络搜索时发生错误: {e}")
         raise
-    # resolve the urls to short urls for saving tokens and time
-    resolved_urls = resolve_urls(
-        response.candidates[0].grounding_metadata.grounding_chunks, state["id"]
+    return _web_research_update(state, payload, request["model"], usage, config)
+
+
+async def aweb_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """Async variant of :func:`web_research` using the async genai client.
+
+    Every ``Send`` branch runs as a coroutine on the same event loop, so the
+    fan-out does not hold one worker thread per in-flight search.
+    """
+    request, timeout, flight_key, cache_key = _web_research_request(state, config)
+    policy = _straggler_policy(config)
+    payload = await _acached_search(cache_key)
+    if payload is not None:
+        if policy is not None:
+            get_stragglers().skip(state, policy)
+        return _web_research_update(state, payload)
+
+    usage: list = []
+
+    async def search() -> dict:
+        cached = await _acached_search(cache_key)
+        if cached is not None:
+            return cached
+        model = request["model"]
+        with _model_span("web_research", state, model=model) as span:
+            response = await _asearch(request, timeout, config)
+            usage.append(usage_from_genai(response))
+            if span:
+                span.set(input_tokens=usage[0][0], output_tokens=usage[0][1])
+        return await _aremember_search(cache_key, response)
+
+    async def fetch() -> dict:
+        if flight_key is None:
+            return await search()
+        return await get_coalescer().ado(flight_key, search, timeout=timeout)
+
+    try:
+        logger.info(f"开始网络搜索，查询: {state['search_query']}")
+        if policy is None:
+            payload = await fetch()
+        else:
+            payload = await get_stragglers().arun(
+                state, fetch, policy, (state, request["model"], usage)
+            )
+            if payload is None:
+                return _empty_search_update(state)
+        logger.info("网络搜索完成")
+    except CircuitOpenError as e:
+        return _degraded_search_update(state, e)
+    except TimeoutError as e:
+        logger.error(f"网络搜索超时: {e}")
+        if state.get("run_deadline") is not None:
+            return _skipped_search_update(state)
+        raise
+    except Exception as e:
+        logger.error(f"网络搜索时发生错误: {e}")
+        raise
+    return _web_research_update(state, payload, request["model"], usage, config)
+
+
+def _compaction_inputs(state: OverallState, config: RunnableConfig):
+    """Return the compaction call to make, or ``None`` if the summaries fit the budget."""
+    configurable = Configuration.from_runnable_config(config)
+    if budget_exhausted(state, reserve=answer_reserve(configurable)):
+        return None
+    results = state["web_research_result"]
+    digest = state.get("research_digest") or ""
+    compacted_count = state.get("compacted_count") or 0
+    count = results_to_fold(
+        results, digest, compacted_count, configurable.summary_token_budget
     )
-    # Gets the citations and adds them to the generated text
-    citations = get_citations(response, resolved_urls)
-    modified_text = insert_citation_markers(response.text, citations)
-    sources_gathered = [item for citation in citations for item in citation["segments"]]
+    if not count:
+        return None
+    formatted_prompt = compaction_instructions.format(
+        research_topic=get_research_topic(state["messages"]),
+        digest=digest or "(none)",
+        notes="\n\n---\n\n".join(results[compacted_count : compacted_count + count]),
+    )
+    model = configurable.query_generator_model
+    llm = get_chat_model(model, temperature=0)
+    timeout = call_timeout(state, configurable, reserve=answer_reserve(configurable))
+    return llm, formatted_prompt, timeout, compacted_count + count, model
 
+
+def _compaction_update(
+    state: OverallState, result, compacted_count: int, config: RunnableConfig
+) -> dict:
+    """Record the new digest in ``state`` and return the matching state update."""
+    logger.info(f"已将前 {compacted_count} 条搜索结果压缩为摘要")
+    state["research_digest"] = result.content
+    state["compacted_count"] = compacted_count
+    model = Configuration.from_runnable_config(config).query_generator_model
     return {
-        "sources_gathered": sources_gathered,
-        "search_query": [state["search_query"]],
-        "web_research_result": [modified_text],
+        "research_digest": result.content,
+        "compacted_count": compacted_count,
+        **_track_usage("compaction", model, usage_from_message(result), config),
     }
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
-    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+def _compact_summaries(state: OverallState, config: RunnableConfig) -> dict:
+    """Fold the oldest research results into the digest once they exceed the budget.
 
-    Analyzes the current summary to identify areas for further research and generates
-    potential follow-up queries. Uses structured output to extract
-    the follow-up query in JSON format.
+    A failed compaction only costs prompt tokens, so errors are logged and the
+    raw results are used instead.
+    """
+    inputs = _compaction_inputs(state, config)
+    if inputs is None:
+        return {}
+    llm, formatted_prompt, timeout, compacted_count, model = inputs
+    with _model_span("compaction", state, model=model) as span:
+        try:
+            result = _call_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    run_with_timeout,
+                    llm.invoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
+            )
+        except Exception as e:
+            logger.warning(f"压缩搜索结果失败，使用原始结果: {e}")
+            return {}
+        return _compaction_update(state, result, compacted_count, config)
 
-    Args:
-        state: Current graph state containing the running summary and research topic
-        config: Configuration for the runnable, including LLM provider settings
 
-    Returns:
-        Dictionary with state update, including search_query key containing the generated follow-up query
-    """
+async def _acompact_summaries(state: OverallState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`_compact_summaries`."""
+    inputs = _compaction_inputs(state, config)
+    if inputs is None:
+        return {}
+    llm, formatted_prompt, timeout, compacted_count, model = inputs
+    with _model_span("compaction", state, model=model) as span:
+        try:
+            result = await _acall_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    arun_with_timeout,
+                    llm.ainvoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
+            )
+        except Exception as e:
+            logger.warning(f"压缩搜索结果失败，使用原始结果: {e}")
+            return {}
+        return _compaction_update(state, result, compacted_count, config)
+
+
+def _summaries(state: OverallState) -> tuple[list, int]:
+    """Summaries for a prompt (digest plus newest raw results) and the tokens saved."""
+    results = state["web_research_result"]
+    summaries = prompt_summaries(
+        results, state.get("research_digest") or "", state.get("compacted_count") or 0
+    )
+    return summaries, tokens_saved(results, summaries)
+
+
+def _reflection_timeout(state: OverallState, config: RunnableConfig) -> float:
+    """Timeout for one reflection call, keeping the answer reserve back."""
+    configurable = Configuration.from_runnable_config(config)
+    return call_timeout(state, configurable, reserve=answer_reserve(configurable))
+
+
+def _reflection_inputs(state: OverallState, config: RunnableConfig):
+    """Build the structured reflection model, its prompt, its timeout, tokens saved and model name."""
     configurable = Configuration.from_runnable_config(config)
+    timeout = _reflection_timeout(state, config)
     # Increment the research loop count and get the reasoning model
     state["research_loop_count"] = state.get("research_loop_count", 0) + 1
-    reasoning_model = state.get("reasoning_model") or configurable.reasoning_model
+    reasoning_model = state.get("reasoning_model") or (
+        configurable.reasoning_model or configurable.reflection_model
+    )
 
     # Format the prompt
     current_date = get_current_date()
+    summaries, saved = _summaries(state)
     formatted_prompt = reflection_instructions.format(
         current_date=current_date,
         research_topic=get_research_topic(state["messages"]),
-        summaries="\n\n---\n\n".join(state["web_research_result"]),
-    )
-    # init Reasoning Model
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=1.0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-    result = run_with_timeout(
-        llm.with_structured_output(Reflection).invoke, formatted_prompt
+        summaries="\n\n---\n\n".join(summaries),
     )
+    # Reasoning Model from the shared client registry
+    structured_llm = get_chat_model(reasoning_model, temperature=1.0, schema=Reflection)
+    return structured_llm, formatted_prompt, timeout, saved, reasoning_model
+
 
+def _reflection_update(
+    state: OverallState, result: Reflection, config: RunnableConfig
+) -> ReflectionState:
+    """Turn a ``Reflection`` into the reflection state update.
+
+    Follow-up queries that merely reword a query that already ran are dropped
+    here, before ``evaluate_research`` fans them out.
+    """
+    follow_up_queries, skipped = _drop_duplicate_queries(
+        result.follow_up_queries, state["search_query"], config
+    )
     return {
         "is_sufficient": result.is_sufficient,
         "knowledge_gap": result.knowledge_gap,
-        "follow_up_queries": result.follow_up_queries,
+        "follow_up_queries": follow_up_queries,
+        "skipped_queries": skipped,
         "research_loop_count": state["research_loop_count"],
         "number_of_ran_queries": len(state["search_query"]),
     }
 
 
+def _out_of_budget_reflection() -> Reflection:
+    """Reflection used when the run budget leaves no room for another loop."""
+    logger.warning("运行预算不足，跳过反思直接生成答案")
+    return Reflection(is_sufficient=True, knowledge_gap="", follow_up_queries=[])
+
+
+def _reflect(
+    state: OverallState,
+    structured_llm,
+    formatted_prompt: str,
+    model: str,
+    timeout: float,
+    config: RunnableConfig,
+    node: str = "reflection",
+):
+    """Call one reflection model and return the ``Reflection`` and its usage update."""
+    with _model_span(node, state, model=model) as span:
+        output = _call_upstream(
+            model,
+            timeout,
+            functools.partial(
+                run_with_timeout,
+                structured_llm.invoke,
+                formatted_prompt,
+                config=_call_config(span),
+            ),
+        )
+        result, raw = _structured_result(output)
+        return result, _track_usage(node, model, usage_from_message(raw), config)
+
+
+async def _areflect(
+    state: OverallState,
+    structured_llm,
+    formatted_prompt: str,
+    model: str,
+    timeout: float,
+    config: RunnableConfig,
+    node: str = "reflection",
+):
+    """Async variant of :func:`_reflect`."""
+    with _model_span(node, state, model=model) as span:
+        output = await _acall_upstream(
+            model,
+            timeout,
+            functools.partial(
+                arun_with_timeout,
+                structured_llm.ainvoke,
+                formatted_prompt,
+                config=_call_config(span),
+            ),
+        )
+        result, raw = _structured_result(output)
+        return result, _track_usage(node, model, usage_from_message(raw), config)
+
+
+def _cascade_inputs(config: RunnableConfig):
+    """Return the fast reflection model, its name, the escalation rules and minimum gap, or ``None``."""
+    configurable = Configuration.from_runnable_config(config)
+    if not configurable.reflection_cascade:
+        return None
+    model = configurable.cascade_model or configurable.query_generator_model
+    structured_llm = get_chat_model(model, temperature=1.0, schema=Reflection)
+    rules = parse_rules(configurable.cascade_rules)
+    return structured_llm, model, rules, configurable.cascade_min_gap_chars
+
+
+def _cascade_outcome(samples: list, error, rules: tuple, min_gap_chars: int) -> list:
+    """Escalation reasons for the fast samples, or for the error that stopped them."""
+    if error is not None:
+        logger.warning(f"快速反思模型调用失败，升级到推理模型: {error}")
+        return ["error"]
+    reasons = escalation_reasons(samples, rules, min_gap_chars)
+    if reasons:
+        logger.info(f"快速反思结果不可靠，升级到推理模型，原因: {reasons}")
+    return reasons
+
+
+def _cascade_update(escalated: bool, reasons: list, usages: list) -> dict:
+    """State update recording the cascade outcome and the usage of its calls."""
+    annotate(cascade_escalated=escalated, cascade_reasons=",".join(reasons))
+    return _combine_updates(
+        *usages, {"reflection_cascade": cascade_update(escalated, reasons)}
+    )
+
+
+def _run_reflection(
+    state: OverallState,
+    config: RunnableConfig,
+    structured_llm,
+    formatted_prompt: str,
+    timeout: float,
+    model: str,
+):
+    """Reflect with the reasoning model, or through the cascade when it is enabled.
+
+    Returns:
+        The ``Reflection`` and the usage (and cascade) state update.
+    """
+    cascade = _cascade_inputs(config)
+    if cascade is None:
+        return _reflect(state, structured_llm, formatted_prompt, model, timeout, config)
+    fast_llm, fast_model, rules, min_gap_chars = cascade
+    samples, usages, error = [], [], None
+    try:
+        for _ in range(samples_needed(rules)):
+            sample, usage = _reflect(
+                state,
+                fast_llm,
+                formatted_prompt,
+                fast_model,
+                timeout,
+                config,
+                node="reflection_fast",
+            )
+            samples.append(sample)
+            usages.append(usage)
+    except TimeoutError:
+        raise
+    except Exception as e:
+        error = e
+    reasons = _cascade_outcome(samples, error, rules, min_gap_chars)
+    if not reasons:
+        return samples[0], _cascade_update(False, reasons, usages)
+    timeout = _reflection_timeout(state, config)
+    result, usage = _reflect(
+        state, structured_llm, formatted_prompt, model, timeout, config
+    )
+    return result, _cascade_update(True, reasons, usages + [usage])
+
+
+async def _arun_reflection(
+    state: OverallState,
+    config: RunnableConfig,
+    structured_llm,
+    formatted_prompt: str,
+    timeout: float,
+    model: str,
+):
+    """Async variant of :func:`_run_reflection`; fast samples run concurrently."""
+    cascade = _cascade_inputs(config)
+    if cascade is None:
+        return await _areflect(
+            state, structured_llm, formatted_prompt, model, timeout, config
+        )
+    fast_llm, fast_model, rules, min_gap_chars = cascade
+    samples, usages, error = [], [], None
+    try:
+        outputs = await asyncio.gather(
+            *(
+                _areflect(
+                    state,
+                    fast_llm,
+                    formatted_prompt,
+                    fast_model,
+                    timeout,
+                    config,
+                    node="reflection_fast",
+                )
+                for _ in range(samples_needed(rules))
+            )
+        )
+        samples = [sample for sample, _ in outputs]
+        usages = [usage for _, usage in outputs]
+    except TimeoutError:
+        raise
+    except Exception as e:
+        error = e
+    reasons = _cascade_outcome(samples, error, rules, min_gap_chars)
+    if not reasons:
+        return samples[0], _cascade_update(False, reasons, usages)
+    timeout = _reflection_timeout(state, config)
+    result, usage = await _areflect(
+        state, structured_llm, formatted_prompt, model, timeout, config
+    )
+    return result, _cascade_update(True, reasons, usages + [usage])
+
+
+def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+
+    Analyzes the current summary to identify areas for further research and generates
+    potential follow-up queries. Uses structured output to extract
+    the follow-up query in JSON format.
+
+    Args:
+        state: Current graph state containing the running summary and research topic
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated follow-up query
+    """
+    late = _fold_late_results(state, config)
+    compaction = _compact_summaries(state, config)
+    structured_llm, formatted_prompt, timeout, saved, model = _reflection_inputs(
+        state, config
+    )
+    if budget_exhausted(state):
+        return _combine_updates(
+            late,
+            _reflection_update(state, _out_of_budget_reflection(), config),
+            compaction,
+            {"tokens_saved": saved},
+        )
+    usage = {}
+    try:
+        result, usage = _run_reflection(
+            state, config, structured_llm, formatted_prompt, timeout, model
+        )
+    except TimeoutError:
+        if state.get("run_deadline") is None:
+            raise
+        result = _out_of_budget_reflection()
+    return _combine_updates(
+        late,
+        _reflection_update(state, result, config),
+        compaction,
+        usage,
+        {"tokens_saved": saved},
+    )
+
+
+async def areflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """Async variant of :func:`reflection` using ``ainvoke``."""
+    late = _fold_late_results(state, config)
+    compaction = await _acompact_summaries(state, config)
+    structured_llm, formatted_prompt, timeout, saved, model = _reflection_inputs(
+        state, config
+    )
+    if budget_exhausted(state):
+        return _combine_updates(
+            late,
+            _reflection_update(state, _out_of_budget_reflection(), config),
+            compaction,
+            {"tokens_saved": saved},
+        )
+    usage = {}
+    try:
+        result, usage = await _arun_reflection(
+            state, config, structured_llm, formatted_prompt, timeout, model
+        )
+    except TimeoutError:
+        if state.get("run_deadline") is None:
+            raise
+        result = _out_of_budget_reflection()
+    return _combine_updates(
+        late,
+        _reflection_update(state, result, config),
+        compaction,
+        usage,
+        {"tokens_saved": saved},
+    )
+
+
 def evaluate_research(
     state: ReflectionState,
     config: RunnableConfig,
@@ -226,7 +1288,8 @@ def evaluate_research(
     """LangGraph routing function that determines the next step in the research flow.
 
     Controls the research loop by deciding whether to continue gathering information
-    or to finalize the summary based on the configured maximum number of research loops.
+    or to finalize the summary based on the configured maximum number of research loops
+    and on whether the remaining run budget can still cover another loop.
 
     Args:
         state: Current graph state containing the research loop count
@@ -243,19 +1306,171 @@ def evaluate_research(
     )
     if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
         return "finalize_answer"
+    elif not state["follow_up_queries"]:
+        # Every follow-up was a near-duplicate of a query that already ran
+        return "finalize_answer"
+    elif not can_afford_loop(state, configurable):
+        logger.info("剩余运行预算不足以进行下一轮研究，直接生成答案")
+        return "finalize_answer"
     else:
+        loop_started_at = time.time()
         return [
             Send(
                 "web_research",
                 {
                     "search_query": follow_up_query,
                     "id": state["number_of_ran_queries"] + int(idx),
+                    "run_deadline": state.get("run_deadline"),
+                    "trace_id": state.get("trace_id"),
+                    "loop_started_at": loop_started_at,
+                    "fanout": len(state["follow_up_queries"]),
                 },
             )
             for idx, follow_up_query in enumerate(state["follow_up_queries"])
         ]
 
 
+def _answer_inputs(state: OverallState, config: RunnableConfig):
+    """Build the answer model, its prompt, its timeout, the streaming flag, tokens saved and model name."""
+    configurable = Configuration.from_runnable_config(config)
+    timeout = call_timeout(state, configurable)
+    reasoning_model = state.get("reasoning_model") or (
+        configurable.reasoning_model or configurable.answer_model
+    )
+
+    # Format the prompt
+    current_date = get_current_date()
+    summaries, saved = _summaries(state)
+    formatted_prompt = answer_instructions.format(
+        current_date=current_date,
+        research_topic=get_research_topic(state["messages"]),
+        summaries="\n---\n\n".join(summaries),
+    )
+
+    # Reasoning Model from the shared client registry, default to Gemini 2.5 Flash
+    llm = get_chat_model(reasoning_model, temperature=0)
+    return (
+        llm,
+        formatted_prompt,
+        timeout,
+        configurable.stream_answer,
+        saved,
+        reasoning_model,
+    )
+
+
+def _short_urls(source: dict) -> list:
+    """Every short url a registry entry was cited under."""
+    return [source["short_url"], *source.get("aliases", [])]
+
+
+def _source_rewriter(state: OverallState) -> ShortUrlRewriter:
+    """Build the short url rewriter for every source gathered so far."""
+    url_map = {}
+    for source in state["sources_gathered"]:
+        for short_url in _short_urls(source):
+            if short_url:
+                url_map.setdefault(short_url, source["value"])
+    return ShortUrlRewriter(url_map)
+
+
+def _answer_update(
+    state: OverallState, answer: str, rewriter: ShortUrlRewriter, saved: int
+) -> OverallState:
+    """Build the final state update from the rewritten answer and its sources."""
+    # Mark the sources used in the answer as cited; a zero count leaves the
+    # registry's reference counts untouched
+    unique_sources = [
+        {**source, "count": 0, "cited": True}
+        for source in state["sources_gathered"]
+        if any(short_url in rewriter.used for short_url in _short_urls(source))
+    ]
+
+    logger.debug(f"客户端池统计: {client_pool_stats()}")
+    logger.debug(f"限流器统计: {rate_limiter_stats()}")
+    logger.debug(f"熔断器状态: {circuit_breaker_stats()}")
+    logger.info(
+        f"本次运行摘要压缩节省约 {(state.get('tokens_saved') or 0) + saved} 个 token"
+    )
+    return {
+        "messages": [AIMessage(content=answer)],
+        "sources_gathered": unique_sources,
+        "tokens_saved": saved,
+    }
+
+
+def _log_run_usage(state: OverallState, update: dict) -> None:
+    """Log the token usage and cost of the whole run, this node included."""
+    total = merge_usage(state.get("token_usage"), update["token_usage"])["total"]
+    logger.info(
+        f"本次运行共 {total['calls']} 次模型调用，输入 {total['input_tokens']} / "
+        f"输出 {total['output_tokens']} 个 token，费用约 ${total['cost_usd']:.4f}"
+    )
+    cascade = state.get("reflection_cascade")
+    if cascade and cascade.get("reflections"):
+        logger.info(
+            f"反思级联: {cascade['reflections']} 次反思中 {cascade['escalations']} 次升级到推理模型"
+        )
+
+
+def _chunk_text(chunk) -> str:
+    """Return the text of a streamed message chunk."""
+    return chunk.content if isinstance(chunk.content, str) else ""
+
+
+def _emit_answer_chunk(writer, text: str) -> None:
+    """Push an already rewritten piece of the answer to ``custom`` stream consumers."""
+    if text:
+        writer({"answer_chunk": text})
+
+
+def _stream_answer(
+    llm, formatted_prompt: str, rewriter: ShortUrlRewriter, writer, config: dict
+):
+    """Stream the answer, emitting rewritten chunks.
+
+    Runs on an executor thread that outlives a timeout, so it stops reading
+    and emitting as soon as the caller cancels ``rewriter``.
+
+    Returns:
+        The full answer and the ``(input_tokens, output_tokens)`` summed over
+        the chunks.
+    """
+    parts, input_tokens, output_tokens = [], 0, 0
+    with contextlib.closing(llm.stream(formatted_prompt, config=config)) as stream:
+        for chunk in stream:
+            if rewriter.cancelled:
+                # Closing the stream drops the upstream connection
+                return "".join(parts), (input_tokens, output_tokens)
+            text = rewriter.feed(_chunk_text(chunk))
+            _emit_answer_chunk(writer, text)
+            parts.append(text)
+            chunk_in, chunk_out = usage_from_message(chunk)
+            input_tokens += chunk_in
+            output_tokens += chunk_out
+    text = rewriter.flush()
+    _emit_answer_chunk(writer, text)
+    parts.append(text)
+    return "".join(parts), (input_tokens, output_tokens)
+
+
+async def _astream_answer(
+    llm, formatted_prompt: str, rewriter: ShortUrlRewriter, writer, config: dict
+):
+    """Async variant of :func:`_stream_answer`."""
+    parts, input_tokens, output_tokens = [], 0, 0
+    async for chunk in llm.astream(formatted_prompt, config=config):
+        text = rewriter.feed(_chunk_text(chunk))
+        _emit_answer_chunk(writer, text)
+        parts.append(text)
+        chunk_in, chunk_out = usage_from_message(chunk)
+        input_tokens, output_tokens = input_tokens + chunk_in, output_tokens + chunk_out
+    text = rewriter.flush()
+    _emit_answer_chunk(writer, text)
+    parts.append(text)
+    return "".join(parts), (input_tokens, output_tokens)
+
+
 def finalize_answer(state: OverallState, config: RunnableConfig):
     """LangGraph node that finalizes the research summary.
 
@@ -263,59 +1478,199 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     combining them with the running summary to create a well-structured
     research report with proper citations.
 
+    With ``stream_answer`` enabled the answer is streamed instead: each chunk,
+    with its short urls already rewritten, is emitted on the ``custom`` stream
+    as ``{"answer_chunk": ...}``. The final state update is identical in both
+    modes.
+
     Args:
         state: Current graph state containing the running summary and sources gathered
 
     Returns:
         Dictionary with state update, including running_summary key containing the formatted final summary with sources
     """
-    configurable = Configuration.from_runnable_config(config)
-    reasoning_model = state.get("reasoning_model") or configurable.reasoning_model
-
-    # Format the prompt
-    current_date = get_current_date()
-    formatted_prompt = answer_instructions.format(
-        current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n---\n\n".join(state["web_research_result"]),
+    late = _fold_late_results(state, config, final=True)
+    compaction = _compact_summaries(state, config)
+    llm, formatted_prompt, timeout, stream, saved, model = _answer_inputs(state, config)
+    rewriter = _source_rewriter(state)
+    with _model_span("finalize_answer", state, model=model) as span:
+        if stream:
+            # Raw tokens still contain short urls, keep them off the messages stream
+            try:
+                answer, tokens = _call_upstream(
+                    model,
+                    timeout,
+                    functools.partial(
+                        run_with_timeout,
+                        _stream_answer,
+                        llm,
+                        formatted_prompt,
+                        rewriter,
+                        get_stream_writer(),
+                        _call_config(span, tags=[TAG_NOSTREAM]),
+                    ),
+                    # Only a stream that produced nothing yet can start over
+                    retryable=lambda: not rewriter.fed,
+                )
+            except BaseException:
+                # A timed-out stream keeps running on its worker thread
+                rewriter.cancel()
+                raise
+        else:
+            result = _call_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    run_with_timeout,
+                    llm.invoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
+            )
+            answer = rewriter.rewrite(result.content)
+            tokens = usage_from_message(result)
+        usage = _track_usage("finalize_answer", model, tokens, config)
+    update = _combine_updates(
+        late, _answer_update(state, answer, rewriter, saved), compaction, usage
     )
+    _log_run_usage(state, update)
+    _cache_answer(state, config, update)
+    return update
 
-    # init Reasoning Model, default to Gemini 2.5 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-    result = run_with_timeout(llm.invoke, formatted_prompt)
 
-    # Replace the short urls with the original urls and add all used urls to the sources_gathered
-    unique_sources = []
-    for source in state["sources_gathered"]:
-        if source["short_url"] in result.content:
-            result.content = result.content.replace(
-                source["short_url"], source["value"]
+async def afinalize_answer(state: OverallState, config: RunnableConfig):
+    """Async variant of :func:`finalize_answer` using ``ainvoke``/``astream``."""
+    late = _fold_late_results(state, config, final=True)
+    compaction = await _acompact_summaries(state, config)
+    llm, formatted_prompt, timeout, stream, saved, model = _answer_inputs(state, config)
+    rewriter = _source_rewriter(state)
+    with _model_span("finalize_answer", state, model=model) as span:
+        if stream:
+            # Raw tokens still contain short urls, keep them off the messages stream
+            answer, tokens = await _acall_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    arun_with_timeout,
+                    _astream_answer,
+                    llm,
+                    formatted_prompt,
+                    rewriter,
+                    get_stream_writer(),
+                    _call_config(span, tags=[TAG_NOSTREAM]),
+                ),
+                retryable=lambda: not rewriter.fed,
+            )
+        else:
+            result = await _acall_upstream(
+                model,
+                timeout,
+                functools.partial(
+                    arun_with_timeout,
+                    llm.ainvoke,
+                    formatted_prompt,
+                    config=_call_config(span),
+                ),
             )
-            unique_sources.append(source)
+            answer = rewriter.rewrite(result.content)
+            tokens = usage_from_message(result)
+        usage = _track_usage("finalize_answer", model, tokens, config)
+    update = _combine_updates(
+        late, _answer_update(state, answer, rewriter, saved), compaction, usage
+    )
+    _log_run_usage(state, update)
+    await _acache_answer(state, config, update)
+    return update
 
-    return {
-        "messages": [AIMessage(content=result.content)],
-        "sources_gathered": unique_sources,
-    }
+
+def _started_first(func):
+    """Wrap a node so the process is set up (see ``_startup``) before it runs."""
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            _startup()
+            return await func(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _startup()
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _forgets_run_on_error(func):
+    """Wrap a node so a failing run drops its straggler state (see ``agent.pipeline``).
+
+    A failed run never reaches ``finalize_answer``, which would otherwise
+    collect its parked searches and loop progress.
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(state, config):
+            try:
+                return await func(state, config)
+            except BaseException:
+                get_stragglers().forget(state.get("trace_id"))
+                raise
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(state, config):
+            try:
+                return func(state, config)
+            except BaseException:
+                get_stragglers().forget(state.get("trace_id"))
+                raise
+
+    return wrapper
+
+
+def _traced(name: str, func, afunc, new_trace: bool = False) -> RunnableLambda:
+    """Node runnable whose sync and async executions each run in a tracing span."""
+    return RunnableLambda(
+        _started_first(_forgets_run_on_error(traced_node(name, func, new_trace))),
+        afunc=_started_first(
+            _forgets_run_on_error(traced_node(name, afunc, new_trace))
+        ),
+        name=name,
+    )
 
 
 # Create our Agent Graph
 builder = StateGraph(OverallState, config_schema=Configuration)
 
-# Define the nodes we will cycle between
-builder.add_node("generate_query", generate_query)
-builder.add_node("web_research", web_research)
-builder.add_node("reflection", reflection)
-builder.add_node("finalize_answer", finalize_answer)
+# Define the nodes we will cycle between. Each node carries both a sync and an
+# async implementation: ``graph.invoke`` keeps the blocking path while
+# ``graph.ainvoke``/``astream`` (used by the LangGraph API server) runs the
+# ``Send`` fan-out as concurrent coroutines on one event loop.
+builder.add_node(
+    "check_answer_cache",
+    _traced(
+        "check_answer_cache", check_answer_cache, acheck_answer_cache, new_trace=True
+    ),
+)
+builder.add_node(
+    "generate_query", _traced("generate_query", generate_query, agenerate_query)
+)
+builder.add_node("web_research", _traced("web_research", web_research, aweb_research))
+builder.add_node("reflection", _traced("reflection", reflection, areflection))
+builder.add_node(
+    "finalize_answer", _traced("finalize_answer", finalize_answer, afinalize_answer)
+)
 
-# Set the entrypoint as `generate_query`
+# Set the entrypoint as `check_answer_cache`
 # This means that this node is the first one called
-builder.add_edge(START, "generate_query")
+builder.add_edge(START, "check_answer_cache")
+# Answer from the cache, or research the question
+builder.add_conditional_edges(
+    "check_answer_cache", route_answer_cache, ["generate_query", END]
+)
 # Add conditional edge to continue with search queries in a parallel branch
 builder.add_conditional_edges(
     "generate_query", continue_to_web_research, ["web_research"]
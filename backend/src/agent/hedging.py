@@ -0,0 +1,334 @@
+"""Hedged upstream requests driven by rolling per-model latency histograms.
+
+A hedged call starts the request, waits for the model's observed latency
+quantile (e.g. p95), and if no response has arrived by then starts one
+duplicate. The first successful response wins; the other is cancelled
+(coroutines) or left to finish as an abandoned call of the shared
+:mod:`agent.executor` pool (threads), which sync attempts run on. Only tail requests get a duplicate, so
+tail latency drops for a few percent of extra calls.
+
+Latencies are kept per model in a histogram with log-spaced buckets over a
+rolling window, so the hedge delay follows the upstream as it speeds up or
+slows down. Hedging only starts once a model has ``min_samples`` latencies
+in the window.
+
+The number of duplicates is capped with a hedge budget: every request earns
+``max_rate`` of a hedge and a hedge spends a whole one, so at most about
+``max_rate`` of all requests are hedged, however slow the upstream gets.
+
+Process-wide settings come from ``AGENT_HEDGE_MAX_RATE`` (default 0.05),
+``AGENT_HEDGE_MIN_SAMPLES`` (default 20) and ``AGENT_HEDGE_WINDOW_SECONDS``
+(default 60). Which quantile triggers a hedge is set per run, see
+``Configuration.hedge_quantile``.
+"""
+
+import asyncio
+import bisect
+import concurrent.futures
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List
+
+from agent.executor import DeadlineExecutor, ExecutorSaturatedError, get_executor
+from agent.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds: 1ms to about 5 minutes, 10% apart
+_BOUNDS = [0.001 * 1.1**i for i in range(int(math.log(300_000) / math.log(1.1)) + 1)]
+# A model can bank this many hedges while it is fast
+_MAX_CREDITS = 5.0
+
+
+class LatencyHistogram:
+    """Latencies of one model over a rolling window, in log-spaced buckets.
+
+    The window is split into ``slots`` sub-windows; the oldest one is dropped
+    as time moves on, so old latencies age out in steps of
+    ``window / slots`` seconds.
+    """
+
+    def __init__(self, window: float = 60.0, slots: int = 6):
+        """Keep ``window`` seconds of latencies in ``slots`` sub-windows."""
+        self.slot_seconds = window / slots
+        self.slots = slots
+        self._counts: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, now: float) -> Dict[int, List[int]]:
+        current = int(now // self.slot_seconds)
+        for slot in [s for s in self._counts if s <= current - self.slots]:
+            del self._counts[slot]
+        return self._counts
+
+    def record(self, seconds: float) -> None:
+        """Add one observed latency."""
+        bucket = min(bisect.bisect_left(_BOUNDS, seconds), len(_BOUNDS) - 1)
+        now = time.time()
+        with self._lock:
+            counts = self._live(now).setdefault(
+                int(now // self.slot_seconds), [0] * len(_BOUNDS)
+            )
+            counts[bucket] += 1
+
+    def _merged(self) -> List[int]:
+        with self._lock:
+            slots = list(self._live(time.time()).values())
+        return [sum(column) for column in zip(*slots)] if slots else []
+
+    def count(self) -> int:
+        """Return the number of latencies in the window."""
+        return sum(self._merged())
+
+    def quantile(self, q: float) -> float | None:
+        """Return the upper bound of the bucket holding quantile ``q``, or ``None`` if empty."""
+        merged = self._merged()
+        total = sum(merged)
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for bucket, count in enumerate(merged):
+            seen += count
+            if seen >= rank:
+                return _BOUNDS[bucket]
+        return _BOUNDS[-1]
+
+
+class _ModelHedging:
+    """Histogram, hedge budget and counters of one model."""
+
+    def __init__(self, window: float):
+        self.histogram = LatencyHistogram(window)
+        self.credits = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+
+class Hedger:
+    """Per-model hedging state shared by every run in the process.
+
+    Args:
+        max_rate: Long-run fraction of requests that may be hedged.
+        min_samples: Latencies a model needs in the window before hedging.
+        window: Seconds of latency history the hedge delay is based on.
+        executor: Pool sync attempts run on, the process-wide one if ``None``.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = 0.05,
+        min_samples: int = 20,
+        window: float = 60.0,
+        executor: DeadlineExecutor | None = None,
+    ):
+        """Start without any model state; models are added as they are searched."""
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.executor = executor
+        self._models: Dict[str, _ModelHedging] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str) -> _ModelHedging:
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                state = self._models[model] = _ModelHedging(self.window)
+            return state
+
+    @contextmanager
+    def timed(self, model: str) -> Iterator[None]:
+        """Record how long the block takes as a latency of ``model``, if it succeeds.
+
+        Wrap only the upstream call itself, not time spent queueing for it,
+        so congestion in this process does not trigger hedges. A call that
+        times out or is cancelled, such as a losing attempt, records the time
+        it ran so far, so the slow calls cut short still count towards the
+        tail.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        except (TimeoutError, asyncio.CancelledError):
+            self._model(model).histogram.record(time.monotonic() - started)
+            raise
+        self._model(model).histogram.record(time.monotonic() - started)
+
+    def delay(self, model: str, quantile: float) -> float | None:
+        """Return how long to wait before hedging a call to ``model``, or ``None`` not to hedge.
+
+        Also counts the call as a request, which earns hedge budget.
+        """
+        state = self._model(model)
+        with self._lock:
+            state.requests += 1
+            state.credits = min(state.credits + self.max_rate, _MAX_CREDITS)
+        if state.histogram.count() < self.min_samples:
+            return None
+        return state.histogram.quantile(quantile)
+
+    def _take_credit(self, model: str) -> bool:
+        state = self._model(model)
+        with self._lock:
+            if state.credits < 1.0:
+                state.denied += 1
+                return False
+            state.credits -= 1.0
+            state.hedges += 1
+        return True
+
+    def _refund_credit(self, model: str) -> None:
+        state = self._model(model)
+        with self._lock:
+            state.credits += 1.0
+            state.hedges -= 1
+
+    def _won(self, model: str, hedge_won: bool) -> None:
+        if hedge_won:
+            state = self._model(model)
+            with self._lock:
+                state.hedge_wins += 1
+        annotate(hedge_won=hedge_won)
+
+    def run(
+        self,
+        model: str,
+        attempt: Callable[[float], Any],
+        timeout: float,
+        quantile: float,
+    ) -> Any:
+        """Call ``attempt(timeout)``, hedging it once it is slower than ``quantile``.
+
+        ``attempt`` receives the time it may take and must be safe to call
+        twice concurrently. A losing attempt keeps running in the background
+        and its result is dropped. While the executor is saturated, calls are
+        not hedged.
+        """
+        delay = self.delay(model, quantile)
+        if delay is None or delay >= timeout:
+            return attempt(timeout)
+        executor = self.executor or get_executor()
+        started = time.monotonic()
+        try:
+            primary = executor.submit(contextvars.copy_context().run, attempt, timeout)
+        except ExecutorSaturatedError:
+            return attempt(timeout)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self._take_credit(model):
+            return primary.result()
+        remaining = max(timeout - (time.monotonic() - started), 0.001)
+        try:
+            hedge = executor.submit(contextvars.copy_context().run, attempt, remaining)
+        except ExecutorSaturatedError:
+            self._refund_credit(model)
+            return primary.result()
+        annotate(hedged=True)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    self._won(model, future is hedge)
+                    for loser in pending:
+                        executor.abandon(loser)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def arun(
+        self,
+        model: str,
+        attempt: Callable[[float], Awaitable[Any]],
+        timeout: float,
+        quantile: float,
+    ) -> Any:
+        """Async variant of :meth:`run`; the losing attempt is cancelled."""
+        delay = self.delay(model, quantile)
+        if delay is None or delay >= timeout:
+            return await attempt(timeout)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(attempt(timeout))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._take_credit(model):
+                return await primary
+            remaining = max(timeout - (time.monotonic() - started), 0.001)
+            hedge = asyncio.ensure_future(attempt(remaining))
+            annotate(hedged=True)
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self._won(model, task is hedge)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        """Return per-model hedge counts, win rates and current latency quantiles."""
+        with self._lock:
+            models = dict(self._models)
+        stats = {}
+        for model, state in models.items():
+            p50 = state.histogram.quantile(0.5)
+            p95 = state.histogram.quantile(0.95)
+            with self._lock:
+                stats[model] = {
+                    "requests": state.requests,
+                    "hedges": state.hedges,
+                    "hedge_wins": state.hedge_wins,
+                    "denied": state.denied,
+                    "hedge_rate": state.hedges / state.requests
+                    if state.requests
+                    else 0.0,
+                    "hedge_win_rate": state.hedge_wins / state.hedges
+                    if state.hedges
+                    else 0.0,
+                    "samples": state.histogram.count(),
+                    "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                    "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                }
+        return stats
+
+
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    """Return the process-wide :class:`Hedger`, configured from the environment."""
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(
+                    max_rate=float(os.environ.get("AGENT_HEDGE_MAX_RATE", 0.05)),
+                    min_samples=int(os.environ.get("AGENT_HEDGE_MIN_SAMPLES", 20)),
+                    window=float(os.environ.get("AGENT_HEDGE_WINDOW_SECONDS", 60)),
+                )
+    return _hedger
+
+
+def hedging_stats() -> dict:
+    """Return per-model hedge counts and win rates of the process-wide hedger."""
+    return get_hedger().stats()
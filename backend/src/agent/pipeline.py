@@ -0,0 +1,288 @@
+"""Straggler handling for the web_research fan-out.
+
+Reflection runs once every ``web_research`` branch of a loop has returned,
+so a single slow grounded search holds up the whole loop. In pipelined mode
+a branch stops waiting for its search once
+
+* ``straggler_timeout`` seconds have passed since the loop's searches were
+  sent out, or
+* a ``quorum`` fraction of the loop's branches has finished and ``grace``
+  more seconds have passed,
+
+and returns without a result. Its search keeps running in the background,
+on the shared :mod:`agent.executor` pool for the sync graph, where it counts
+as an abandoned call until it finishes.
+When it finishes, the result is parked here under the run's trace id until
+the next ``reflection`` or ``finalize_answer`` folds it into the state, so
+late results are used instead of dropped.
+
+If the shared pool has no room for another call, a sync branch waits for its
+search on its own thread instead.
+
+Branches that return without searching, such as search cache hits, must be
+counted with :meth:`Stragglers.skip`, or the quorum is never reached. A run's
+loop progress and parked results are dropped when its final answer collects
+them, or with :meth:`Stragglers.forget` when the run fails. Runs that vanish
+without either, e.g. cancelled by the client, are dropped once they have been
+idle for ``max_idle`` seconds.
+
+Loop progress and parked results live in this process: the branches of one
+run always execute in the same process.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from agent.executor import DeadlineExecutor, ExecutorSaturatedError, get_executor
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting branch re-checks the quorum
+_POLL_SECONDS = 0.05
+
+
+@dataclass(frozen=True)
+class StragglerPolicy:
+    """When a web_research branch stops waiting for its search.
+
+    Attributes:
+        timeout: Seconds after the loop's fan-out to give up, or ``None``.
+        quorum: Fraction of the loop's branches that must finish before the
+            remaining ones get ``grace`` more seconds, or ``None``.
+        grace: Seconds stragglers get once the quorum is reached.
+    """
+
+    timeout: float | None = None
+    quorum: float | None = None
+    grace: float = 2.0
+
+
+class _LoopProgress:
+    """Completion count of the branches of one research loop."""
+
+    def __init__(self, total: int, quorum: float | None):
+        self.total = total
+        self.needed = math.ceil(total * quorum) if quorum else None
+        self.finished = 0
+        self.quorum_at: float | None = None
+
+    def finish(self) -> None:
+        self.finished += 1
+        if self.needed is not None and self.quorum_at is None:
+            if self.finished >= self.needed:
+                self.quorum_at = time.time()
+
+
+def _retrieve_exception(handle: Any) -> None:
+    if not getattr(handle, "cancelled", lambda: False)():
+        handle.exception()
+
+
+class Stragglers:
+    """Per-run loop progress and parked late search results.
+
+    Args:
+        executor: Pool the searches of the sync graph run on while their
+            branch waits, the process-wide one if ``None``.
+        max_idle: Seconds after which the state of a run that neither
+            finished nor failed is dropped.
+    """
+
+    def __init__(
+        self, executor: DeadlineExecutor | None = None, max_idle: float = 3600.0
+    ):
+        """Start without any run state."""
+        self.executor = executor
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._loops: Dict[Tuple[str, float], _LoopProgress] = {}
+        self._late: Dict[str, List[Tuple[Any, Any]]] = {}
+        # Last time each run started a loop or parked a search
+        self._active: Dict[str, float] = {}
+        self.deferred = 0
+        self.folded = 0
+
+    def _progress(
+        self, state: dict, policy: StragglerPolicy
+    ) -> Tuple[tuple, _LoopProgress]:
+        key = (state.get("trace_id") or "", state.get("loop_started_at") or 0.0)
+        with self._lock:
+            progress = self._loops.get(key)
+            if progress is None:
+                self._sweep()
+                progress = self._loops[key] = _LoopProgress(
+                    state.get("fanout") or 1, policy.quorum
+                )
+                self._active[key[0]] = time.time()
+            return key, progress
+
+    def _sweep(self) -> None:
+        # Called with the lock held
+        idle_since = time.time() - self.max_idle
+        for trace_id in [t for t, at in self._active.items() if at < idle_since]:
+            self._drop(trace_id)
+
+    def _finished(self, key: tuple, progress: _LoopProgress) -> None:
+        with self._lock:
+            progress.finish()
+            if progress.finished >= progress.total:
+                self._loops.pop(key, None)
+
+    def skip(self, state: dict, policy: StragglerPolicy) -> None:
+        """Count a branch that returned without a search, e.g. on a cache hit, as finished."""
+        key, progress = self._progress(state, policy)
+        self._finished(key, progress)
+
+    def _deadline(
+        self, state: dict, policy: StragglerPolicy, progress: _LoopProgress
+    ) -> float:
+        started = state.get("loop_started_at") or time.time()
+        deadline = started + policy.timeout if policy.timeout is not None else math.inf
+        with self._lock:
+            quorum_at = progress.quorum_at
+        if quorum_at is not None:
+            deadline = min(deadline, quorum_at + policy.grace)
+        return deadline
+
+    def _park(self, state: dict, handle: Any, context: Any) -> None:
+        trace_id = state.get("trace_id") or ""
+        # Searches that finish after the run ended are never collected
+        handle.add_done_callback(_retrieve_exception)
+        with self._lock:
+            self._late.setdefault(trace_id, []).append((handle, context))
+            self._active[trace_id] = time.time()
+            self.deferred += 1
+        logger.info(
+            f"搜索耗时过长，结果将在后续步骤中并入: {state.get('search_query')}"
+        )
+
+    def run(
+        self,
+        state: dict,
+        fetch: Callable[[], Any],
+        policy: StragglerPolicy,
+        context: Any = None,
+    ) -> Any | None:
+        """Run ``fetch`` for a branch and wait for it as long as ``policy`` allows.
+
+        Returns:
+            The result of ``fetch``, or ``None`` if the branch gave up; the
+            result is then parked with ``context`` for :meth:`collect`.
+        """
+        key, progress = self._progress(state, policy)
+        executor = self.executor or get_executor()
+        try:
+            future = executor.submit(contextvars.copy_context().run, fetch)
+        except ExecutorSaturatedError:
+            logger.warning("执行器已满，分支将等待搜索完成")
+            try:
+                return fetch()
+            finally:
+                self._finished(key, progress)
+        future.add_done_callback(lambda _: self._finished(key, progress))
+        while True:
+            remaining = self._deadline(state, policy, progress) - time.time()
+            if remaining <= 0:
+                break
+            try:
+                return future.result(timeout=min(remaining, _POLL_SECONDS))
+            except concurrent.futures.TimeoutError:
+                continue
+        if future.done():
+            return future.result()
+        executor.abandon(future)
+        self._park(state, future, context)
+        return None
+
+    async def arun(
+        self,
+        state: dict,
+        fetch: Callable[[], Awaitable[Any]],
+        policy: StragglerPolicy,
+        context: Any = None,
+    ) -> Any | None:
+        """Async variant of :meth:`run`; the search keeps running as a task."""
+        key, progress = self._progress(state, policy)
+        task = asyncio.ensure_future(fetch())
+        task.add_done_callback(lambda _: self._finished(key, progress))
+        while not task.done():
+            remaining = self._deadline(state, policy, progress) - time.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait({task}, timeout=min(remaining, _POLL_SECONDS))
+        if task.done():
+            return task.result()
+        self._park(state, task, context)
+        return None
+
+    def collect(
+        self, trace_id: str | None, final: bool = False
+    ) -> List[Tuple[Any, Any]]:
+        """Return ``(context, result)`` for every parked search that has finished.
+
+        Failed searches are logged and skipped. With ``final`` the run is over:
+        searches still running are forgotten (they still fill the search cache).
+        """
+        with self._lock:
+            parked = self._late.pop(trace_id or "", [])
+            done = [(h, c) for h, c in parked if h.done()]
+            pending = [(h, c) for h, c in parked if not h.done()]
+            if pending and not final:
+                self._late[trace_id or ""] = pending
+            if final:
+                self._drop(trace_id or "")
+        results = []
+        for handle, context in done:
+            if getattr(handle, "cancelled", lambda: False)():
+                continue
+            error = handle.exception()
+            if error is not None:
+                logger.warning(f"迟到的搜索失败，已忽略: {error}")
+                continue
+            results.append((context, handle.result()))
+        with self._lock:
+            self.folded += len(results)
+        return results
+
+    def _drop(self, trace_id: str) -> None:
+        # Called with the lock held
+        self._late.pop(trace_id, None)
+        self._active.pop(trace_id, None)
+        for key in [key for key in self._loops if key[0] == trace_id]:
+            del self._loops[key]
+
+    def forget(self, trace_id: str | None) -> None:
+        """Drop the loop progress and parked searches of a run that ended without an answer."""
+        with self._lock:
+            self._drop(trace_id or "")
+
+    def stats(self) -> dict:
+        """Return how many searches were deferred and how many were folded in later."""
+        with self._lock:
+            return {
+                "deferred": self.deferred,
+                "folded": self.folded,
+                "parked": sum(len(v) for v in self._late.values()),
+                "loops": len(self._loops),
+            }
+
+
+_stragglers: Stragglers | None = None
+_stragglers_lock = threading.Lock()
+
+
+def get_stragglers() -> Stragglers:
+    """Return the process-wide :class:`Stragglers`, creating it on first use."""
+    global _stragglers
+    if _stragglers is None:
+        with _stragglers_lock:
+            if _stragglers is None:
+                _stragglers = Stragglers()
+    return _stragglers
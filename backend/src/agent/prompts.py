@@ -94,3 +94,18 @@ User Context:
 
 Summaries:
 {summaries}"""
+
+compaction_instructions = """Condense research notes about "{research_topic}" into a single digest that a later step will use instead of the original notes.
+
+Instructions:
+- Start from the existing digest and merge in the new notes; do not drop facts already in the digest.
+- Keep every concrete fact, number, date and name that is relevant to the research topic.
+- Keep the citation markdown links exactly as written, e.g. [source](https://vertexaisearch.cloud.google.com/id/1-2), next to the facts they support.
+- Remove repetition, filler and facts unrelated to the research topic.
+- Output only the digest.
+
+Existing digest:
+{digest}
+
+New notes:
+{notes}"""
@@ -0,0 +1,591 @@
+"""Process-wide adaptive rate limiting for upstream Gemini calls.
+
+Every model call, from every run, takes a slot from the limiter of its model
+before it is made. Each model's limiter combines:
+
+* a token bucket capping the request rate (``rps`` with ``burst`` capacity),
+  if configured;
+* an AIMD concurrency limit: every successful call raises the limit by
+  ``1 / limit`` (about +1 per round of calls), every 429/503 response halves
+  it, at most once per ``cooldown`` seconds.
+
+Callers over the limit queue in FIFO order, threads and coroutines alike,
+instead of piling more requests onto an upstream that is already throttling.
+A caller gives up with ``QueueTimeoutError`` once its call timeout is spent in
+the queue, or once so little of it is left that the call would be doomed
+(less than ``MIN_CALL_TIMEOUT``, or half the timeout for shorter ones).
+
+:meth:`RateLimiter.call` also puts a call that was throttled back in the
+queue after an exponential backoff with jitter, for up to ``max_requeues``
+times and as long as its deadline leaves room for another attempt, so a 429
+costs a short wait instead of the whole run.
+
+A sync call that times out keeps running on its worker thread (see
+:mod:`agent.executor`); its slot is held until it really finishes, so the
+concurrency limit bounds the calls in flight upstream.
+
+Limits are set per model with the ``AGENT_RATE_LIMITS`` environment variable,
+a JSON object mapping model name prefixes (longest prefix wins, ``"*"`` for
+the default) to ``rps``, ``burst``, ``initial_concurrency``,
+``min_concurrency``, ``max_concurrency``, ``requeue_backoff``,
+``max_requeue_backoff`` and ``max_requeues``. ``AGENT_RATE_LIMIT_ENABLED=0``
+turns limiting off.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    Mapping,
+)
+
+from agent.budget import MIN_CALL_TIMEOUT
+from agent.executor import AbandonedCallError
+from agent.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS: Dict[str, Any] = {
+    "rps": None,
+    "burst": None,
+    "initial_concurrency": 32,
+    "min_concurrency": 1,
+    "max_concurrency": 64,
+    "requeue_backoff": 0.5,
+    "max_requeue_backoff": 8.0,
+    "max_requeues": 5,
+}
+
+_OVERLOAD_MARKERS = (
+    "429",
+    "503",
+    "RESOURCE_EXHAUSTED",
+    "UNAVAILABLE",
+    "Too Many Requests",
+)
+
+
+class QueueTimeoutError(TimeoutError):
+    """Raised when a call's timeout runs out while it waits for a slot or rate token."""
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether ``error`` means the upstream is throttling us (HTTP 429/503)."""
+    for attr in ("code", "status_code"):
+        code = getattr(error, attr, None)
+        if callable(code):
+            continue
+        if code in (429, 503):
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in (429, 503):
+        return True
+    message = f"{type(error).__name__}: {error}"
+    return any(marker in message for marker in _OVERLOAD_MARKERS)
+
+
+class TokenBucket:
+    """Reservation-style token bucket: callers are told how long to wait."""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        """Refill at ``rate`` tokens per second up to ``burst``, starting full."""
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, max_wait: float | None) -> float | None:
+        """Take one token and return the seconds to wait before using it.
+
+        Returns ``None`` (taking nothing) if the wait would exceed ``max_wait``.
+        Not thread-safe; the owning limiter holds its lock.
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        wait = max(0.0, (1.0 - self._tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return None
+        self._tokens -= 1.0
+        return wait
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+def _resolve(future: "asyncio.Future") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ModelLimiter:
+    """Token bucket plus AIMD concurrency limit for one model.
+
+    Args:
+        rps: Sustained requests per second, or ``None`` for no rate cap.
+        burst: Token bucket capacity; defaults to ``rps``.
+        initial_concurrency: Starting concurrency limit.
+        min_concurrency: Floor the limit never drops below.
+        max_concurrency: Ceiling the limit never grows past.
+        decrease_factor: Multiplier applied to the limit on overload.
+        cooldown: Minimum seconds between two decreases, so a burst of 429s
+            from calls already in flight counts once.
+        requeue_backoff: Seconds a throttled call waits before it queues
+            again, doubled on every further 429/503.
+        max_requeue_backoff: Cap for the requeue backoff.
+        max_requeues: How often one call is requeued before its overload
+            error is raised.
+    """
+
+    def __init__(
+        self,
+        rps: float | None = None,
+        burst: float | None = None,
+        initial_concurrency: float = 32,
+        min_concurrency: float = 1,
+        max_concurrency: float = 64,
+        decrease_factor: float = 0.5,
+        cooldown: float = 1.0,
+        requeue_backoff: float = 0.5,
+        max_requeue_backoff: float = 8.0,
+        max_requeues: int = 5,
+    ):
+        """Start at ``initial_concurrency`` with nobody queued."""
+        self.bucket = TokenBucket(rps, burst) if rps else None
+        self.requeue_backoff = requeue_backoff
+        self.max_requeue_backoff = max_requeue_backoff
+        self.max_requeues = max_requeues
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(
+            min(max(initial_concurrency, min_concurrency), max_concurrency)
+        )
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = collections.deque()
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.acquired = 0
+        self.throttled = 0
+        self.requeued = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def capacity(self) -> int:
+        """Number of calls allowed in flight at the current limit."""
+        return max(1, math.floor(self.limit))
+
+    def _grant(self) -> None:
+        # Called with the lock held
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Take a slot right away if possible, otherwise queue ``waiter``."""
+        with self._lock:
+            if not self._waiters and self.in_flight < self.capacity:
+                self.in_flight += 1
+                return True
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Withdraw a waiter that gave up, returning its slot if it was granted."""
+        with self._lock:
+            self.timeouts += 1
+            if waiter.granted:
+                self.in_flight -= 1
+                self._grant()
+            else:
+                self._waiters.remove(waiter)
+
+    def _reserve_token(self, deadline: float | None) -> float:
+        """Reserve a rate token once a slot is held; returns the wait in seconds."""
+        if self.bucket is None:
+            return 0.0
+        max_wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+        with self._lock:
+            wait = self.bucket.reserve(max_wait)
+        if wait is None:
+            with self._lock:
+                self.timeouts += 1
+                self.in_flight -= 1
+                self._grant()
+            raise QueueTimeoutError("Rate limit wait exceeds the call timeout")
+        return wait
+
+    def acquire(self, timeout: float | None = None) -> float:
+        """Block until a slot and a rate token are available.
+
+        Returns:
+            The seconds spent waiting.
+
+        Raises:
+            QueueTimeoutError: If no slot or token is available within ``timeout``.
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        waiter = _Waiter(event=threading.Event())
+        if not self._enqueue(waiter) and not waiter.event.wait(timeout):
+            with self._lock:
+                granted = waiter.granted
+            if not granted:
+                self._abandon(waiter)
+                raise QueueTimeoutError(f"Rate limiter queue wait exceeded {timeout}s")
+        time.sleep(self._reserve_token(deadline))
+        return self._waited(started)
+
+    async def aacquire(self, timeout: float | None = None) -> float:
+        """Async variant of :meth:`acquire`; waits without blocking the event loop."""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop=loop, future=loop.create_future())
+        if not self._enqueue(waiter):
+            try:
+                await asyncio.wait_for(waiter.future, timeout)
+            except BaseException as e:
+                with self._lock:
+                    granted = waiter.granted
+                if isinstance(e, asyncio.TimeoutError) and granted:
+                    pass  # Granted just as the wait timed out, keep the slot
+                else:
+                    self._abandon(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise QueueTimeoutError(
+                            f"Rate limiter queue wait exceeded {timeout}s"
+                        ) from e
+                    raise
+        await asyncio.sleep(self._reserve_token(deadline))
+        return self._waited(started)
+
+    def _waited(self, started: float) -> float:
+        waited = time.monotonic() - started
+        with self._lock:
+            self.acquired += 1
+            self.wait_seconds += waited
+        return waited
+
+    def release(self, error: BaseException | None = None) -> None:
+        """Return a slot and adapt the limit to the call's outcome."""
+        with self._lock:
+            self.in_flight -= 1
+            if error is None:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            elif is_overload_error(error):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(
+                        self.min_concurrency, self.limit * self.decrease_factor
+                    )
+                    self.throttled += 1
+                    logger.warning(f"上游限流，并发上限降至 {self.capacity}")
+            self._grant()
+
+    def release_unused(self) -> None:
+        """Return a slot whose call was never made, without adapting the limit."""
+        with self._lock:
+            self.in_flight -= 1
+            self.timeouts += 1
+            self._grant()
+
+    def release_when_done(self, future: concurrent.futures.Future) -> None:
+        """Return a slot once the abandoned call running in ``future`` finishes."""
+
+        def release(done: concurrent.futures.Future) -> None:
+            self.release(None if done.cancelled() else done.exception())
+
+        future.add_done_callback(release)
+
+    def requeue_delay(
+        self, error: BaseException, attempt: int, deadline: float | None
+    ) -> float | None:
+        """Backoff before requeueing a call that failed with ``error``, or ``None`` to raise.
+
+        Args:
+            error: Error of the failed attempt; only overload errors are requeued.
+            attempt: Number of requeues of this call so far.
+            deadline: ``time.monotonic()`` deadline of the call, if any.
+        """
+        if attempt >= self.max_requeues or not is_overload_error(error):
+            return None
+        delay = min(self.requeue_backoff * 2**attempt, self.max_requeue_backoff)
+        # Jitter, so calls throttled together do not come back together
+        delay *= random.uniform(0.5, 1.0)
+        if (
+            deadline is not None
+            and deadline - time.monotonic() - delay < MIN_CALL_TIMEOUT
+        ):
+            return None
+        with self._lock:
+            self.requeued += 1
+        return delay
+
+    def stats(self) -> dict:
+        """Return the current limit, load and queue counters."""
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "requeued": self.requeued,
+                "timeouts": self.timeouts,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+class RateLimiter:
+    """Per-model :class:`ModelLimiter` instances, created on first use.
+
+    Args:
+        limits: Mapping of model name prefix (``"*"`` for the default) to
+            :class:`ModelLimiter` keyword arguments.
+        enabled: If false, :meth:`slot` and :meth:`aslot` never wait.
+    """
+
+    def __init__(
+        self,
+        limits: Mapping[str, Mapping[str, Any]] | None = None,
+        enabled: bool = True,
+    ):
+        """Start without limiters; each model gets one on its first call."""
+        self.limits = dict(limits or {})
+        self.enabled = enabled
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _settings(self, model: str) -> dict:
+        matches = [
+            name for name in self.limits if name != "*" and model.startswith(name)
+        ]
+        settings = dict(DEFAULT_LIMITS)
+        settings.update(self.limits.get("*", {}))
+        if matches:
+            settings.update(self.limits[max(matches, key=len)])
+        return settings
+
+    def limiter(self, model: str) -> ModelLimiter:
+        """Return the limiter for ``model``, creating it on first use."""
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                limiter = self._models[model] = ModelLimiter(**self._settings(model))
+            return limiter
+
+    @staticmethod
+    def _remaining(
+        limiter: ModelLimiter, timeout: float | None, waited: float
+    ) -> float | None:
+        """Return the part of ``timeout`` left after queueing, refusing doomed calls."""
+        if timeout is None:
+            return None
+        remaining = timeout - waited
+        if remaining < min(MIN_CALL_TIMEOUT, timeout / 2):
+            limiter.release_unused()
+            raise QueueTimeoutError(
+                f"Only {max(remaining, 0.0):.3f}s of the {timeout}s call timeout "
+                "left after queueing for a rate limit slot"
+            )
+        return remaining
+
+    @contextmanager
+    def slot(self, model: str, timeout: float | None = None) -> Iterator[float | None]:
+        """Hold a slot for one call to ``model``.
+
+        Yields the part of ``timeout`` left after queueing, to be used as the
+        call's own timeout. An overload error raised inside the block lowers
+        the model's concurrency limit. If the block raises
+        :class:`~agent.executor.AbandonedCallError`, the slot is held until
+        the abandoned call finishes.
+
+        Raises:
+            QueueTimeoutError: If the slot is not granted in time, or too
+                little of ``timeout`` is left for the call.
+        """
+        if not self.enabled:
+            yield timeout
+            return
+        limiter = self.limiter(model)
+        waited = limiter.acquire(timeout)
+        _annotate_wait(waited)
+        remaining = self._remaining(limiter, timeout, waited)
+        try:
+            yield remaining
+        except AbandonedCallError as e:
+            limiter.release_when_done(e.future)
+            raise
+        except BaseException as e:
+            limiter.release(e)
+            raise
+        else:
+            limiter.release()
+
+    @asynccontextmanager
+    async def aslot(
+        self, model: str, timeout: float | None = None
+    ) -> AsyncIterator[float | None]:
+        """Async variant of :meth:`slot`."""
+        if not self.enabled:
+            yield timeout
+            return
+        limiter = self.limiter(model)
+        waited = await limiter.aacquire(timeout)
+        _annotate_wait(waited)
+        remaining = self._remaining(limiter, timeout, waited)
+        try:
+            yield remaining
+        except AbandonedCallError as e:
+            limiter.release_when_done(e.future)
+            raise
+        except BaseException as e:
+            limiter.release(e)
+            raise
+        else:
+            limiter.release()
+
+    def _requeue_delay(
+        self,
+        model: str,
+        error: Exception,
+        attempt: int,
+        deadline: float | None,
+        retryable: Callable[[], bool] | None,
+    ) -> float | None:
+        if not self.enabled or (retryable is not None and not retryable()):
+            return None
+        delay = self.limiter(model).requeue_delay(error, attempt, deadline)
+        if delay is not None:
+            logger.warning(f"模型 {model} 被上游限流，{delay:.1f} 秒后重新排队")
+            annotate(requeues=attempt + 1)
+        return delay
+
+    def call(
+        self,
+        model: str,
+        func: Callable[..., Any],
+        timeout: float | None = None,
+        retryable: Callable[[], bool] | None = None,
+    ) -> Any:
+        """Call ``func(timeout=...)`` in a slot of ``model``, requeueing it when throttled.
+
+        ``func`` gets the part of ``timeout`` left after queueing. A call that
+        fails with a 429/503 is put back in the queue after a backoff (see
+        :meth:`ModelLimiter.requeue_delay`), within the same ``timeout``.
+
+        Args:
+            model: Model the call goes to.
+            func: The call; receives its own timeout as ``timeout``.
+            timeout: Seconds for the whole call, queueing and requeues included.
+            retryable: Asked before every requeue; return ``False`` once a
+                failed attempt had effects that must not repeat, e.g. answer
+                chunks that were already streamed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt, left = 0, timeout
+        while True:
+            try:
+                with self.slot(model, left) as remaining:
+                    return func(timeout=remaining)
+            except Exception as e:
+                delay = self._requeue_delay(model, e, attempt, deadline, retryable)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+            left = None if deadline is None else deadline - time.monotonic()
+
+    async def acall(
+        self,
+        model: str,
+        func: Callable[..., Awaitable[Any]],
+        timeout: float | None = None,
+        retryable: Callable[[], bool] | None = None,
+    ) -> Any:
+        """Async variant of :meth:`call`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt, left = 0, timeout
+        while True:
+            try:
+                async with self.aslot(model, left) as remaining:
+                    return await func(timeout=remaining)
+            except Exception as e:
+                delay = self._requeue_delay(model, e, attempt, deadline, retryable)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            left = None if deadline is None else deadline - time.monotonic()
+
+    def stats(self) -> dict:
+        """Return :meth:`ModelLimiter.stats` for every model seen so far."""
+        with self._lock:
+            models = dict(self._models)
+        return {model: limiter.stats() for model, limiter in models.items()}
+
+
+def _annotate_wait(waited: float) -> None:
+    annotate(rate_limit_wait_ms=round(waited * 1000, 3))
+
+
+def _rate_limiter_from_env() -> RateLimiter:
+    raw = os.environ.get("AGENT_RATE_LIMITS")
+    limits = json.loads(raw) if raw else {}
+    enabled = os.environ.get("AGENT_RATE_LIMIT_ENABLED", "1") != "0"
+    return RateLimiter(limits, enabled=enabled)
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide :class:`RateLimiter`, configured from the environment."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = _rate_limiter_from_env()
+    return _rate_limiter
+
+
+def rate_limiter_stats() -> dict:
+    """Return per-model limits and queue depths of the process-wide limiter."""
+    return get_rate_limiter().stats()
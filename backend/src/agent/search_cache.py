@@ -0,0 +1,376 @@
+"""Cache for grounded Google Search responses used by ``web_research``.
+
+Entries are keyed on the normalized query, the model and the current date
+bucket, and hold only what ``web_research`` needs: the response text, the
+grounding chunks and the grounding supports. Short URLs are *not* cached; they
+are derived from the chunks for the requesting branch ``id`` on every hit, so
+citations stay correct.
+
+The cache is off unless a run sets ``search_cache_enabled``, as cached
+results outlive the run and the process.
+
+Two tiers are used: an in-memory LRU in front of a local SQLite file. Both
+tiers honour a TTL, and the SQLite tier is bounded by payload size. Async
+callers use ``aget``/``aput``, which touch the SQLite tier on a worker thread
+so a slow disk never blocks the event loop.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_APOSTROPHES = re.compile(r"['\u2019]")
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a key."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = _APOSTROPHES.sub("", query)
+    query = _PUNCTUATION.sub(" ", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def search_cache_key(query: str, model: str, date_bucket: str) -> str:
+    """Return the cache key for ``query`` searched with ``model`` on ``date_bucket``."""
+    raw = f"{model}\x1f{date_bucket}\x1f{normalize_query(query)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def serialize_response(response: Any) -> dict:
+    """Extract the text and grounding metadata of a Gemini response as plain data."""
+    chunks, supports = [], []
+    candidate = response.candidates[0] if response.candidates else None
+    metadata = getattr(candidate, "grounding_metadata", None)
+    if metadata is not None:
+        for chunk in metadata.grounding_chunks or []:
+            web = getattr(chunk, "web", None)
+            chunks.append(
+                {
+                    "uri": getattr(web, "uri", None),
+                    "title": getattr(web, "title", None),
+                }
+            )
+        for support in metadata.grounding_supports or []:
+            segment = getattr(support, "segment", None)
+            supports.append(
+                {
+                    "start_index": getattr(segment, "start_index", None),
+                    "end_index": getattr(segment, "end_index", None),
+                    "grounding_chunk_indices": list(
+                        getattr(support, "grounding_chunk_indices", None) or []
+                    ),
+                }
+            )
+    return {"text": response.text or "", "chunks": chunks, "supports": supports}
+
+
+def as_response(payload: dict) -> SimpleNamespace:
+    """Rebuild a response-shaped object from :func:`serialize_response` output.
+
+    The result exposes the attributes ``resolve_urls`` and ``get_citations``
+    read, so cached and live responses go through the same code path.
+    """
+    chunks = [
+        SimpleNamespace(web=SimpleNamespace(uri=chunk["uri"], title=chunk["title"]))
+        for chunk in payload["chunks"]
+    ]
+    supports = [
+        SimpleNamespace(
+            segment=SimpleNamespace(
+                start_index=support["start_index"], end_index=support["end_index"]
+            ),
+            grounding_chunk_indices=support["grounding_chunk_indices"],
+        )
+        for support in payload["supports"]
+    ]
+    metadata = SimpleNamespace(grounding_chunks=chunks, grounding_supports=supports)
+    return SimpleNamespace(
+        text=payload["text"],
+        candidates=[SimpleNamespace(grounding_metadata=metadata)],
+    )
+
+
+class MemoryLRU:
+    """Thread-safe in-memory LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 512):
+        """Hold at most ``max_entries`` entries."""
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        """Return the live value for ``key`` and mark it recently used, else ``None``."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, expires_at: float) -> None:
+        """Store ``value`` until ``expires_at``, evicting the least recently used."""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteStore:
+    """Persistent JSON store in a single SQLite file, bounded by payload bytes."""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        """Open or create the SQLite file at ``path`` and its directory."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> tuple | None:
+        """Return ``(value, expires_at)`` for a live entry, else ``None``."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, expires_at = row
+            with self._conn:
+                if expires_at <= now:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+        return json.loads(payload), expires_at
+
+    def put(self, key: str, value: Any, expires_at: float) -> None:
+        """Store ``value`` as JSON until ``expires_at``, then evict down to ``max_bytes``."""
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), expires_at, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the store fits again
+        excess = total - self.max_bytes
+        freed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at"
+        ).fetchall():
+            if freed >= excess:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            freed += size
+
+    def clear(self) -> None:
+        """Delete every entry."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+
+
+class TieredCache:
+    """Memory LRU in front of an optional SQLite store, with a shared TTL.
+
+    Args:
+        ttl_seconds: Lifetime of an entry.
+        memory: In-memory tier.
+        disk: Optional persistent tier. Disk hits are promoted to memory.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        memory: MemoryLRU,
+        disk: SQLiteStore | None = None,
+    ):
+        """Start with zeroed hit/miss counters."""
+        self.ttl_seconds = ttl_seconds
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_disk(self, key: str) -> Any | None:
+        try:
+            found = self.disk.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"读取搜索缓存失败: {e}")
+            return None
+        if found is None:
+            return None
+        value, expires_at = found
+        self.memory.put(key, value, expires_at)
+        return value
+
+    def _write_disk(self, key: str, value: Any, expires_at: float) -> None:
+        try:
+            self.disk.put(key, value, expires_at)
+        except sqlite3.Error as e:
+            logger.warning(f"写入搜索缓存失败: {e}")
+
+    def _count(self, value: Any | None) -> Any | None:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _expires_at(self, ttl_seconds: float | None) -> float:
+        ttl = (
+            self.ttl_seconds
+            if ttl_seconds is None
+            else min(ttl_seconds, self.ttl_seconds)
+        )
+        return time.time() + ttl
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for ``key`` or ``None``."""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self._read_disk(key)
+        return self._count(value)
+
+    async def aget(self, key: str) -> Any | None:
+        """Async variant of :meth:`get`, reading the SQLite tier on a worker thread."""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self._read_disk, key)
+        return self._count(value)
+
+    def put(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        """Store ``value`` under ``key`` in every tier.
+
+        Args:
+            ttl_seconds: Lifetime of this entry, capped at the cache's TTL.
+        """
+        expires_at = self._expires_at(ttl_seconds)
+        self.memory.put(key, value, expires_at)
+        if self.disk is not None:
+            self._write_disk(key, value, expires_at)
+
+    async def aput(
+        self, key: str, value: Any, ttl_seconds: float | None = None
+    ) -> None:
+        """Async variant of :meth:`put`, writing the SQLite tier on a worker thread."""
+        expires_at = self._expires_at(ttl_seconds)
+        self.memory.put(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Drop every entry in every tier."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def build_tiered_cache(
+    name: str,
+    default_ttl: float,
+    default_max_entries: int = 512,
+    default_max_bytes: int = 64 * 1024 * 1024,
+) -> TieredCache:
+    """Build a :class:`TieredCache` configured from ``AGENT_<NAME>_*`` env vars.
+
+    ``AGENT_<NAME>_PATH`` sets the SQLite file (an empty value keeps the cache
+    in memory only), ``AGENT_<NAME>_TTL`` the TTL in seconds,
+    ``AGENT_<NAME>_MAX_ENTRIES`` the memory tier size and
+    ``AGENT_<NAME>_MAX_BYTES`` the disk tier size.
+    """
+    prefix = f"AGENT_{name.upper()}"
+    default_path = os.path.join(
+        os.path.expanduser("~"), ".cache", "agent", f"{name.lower()}.sqlite"
+    )
+    path = os.environ.get(f"{prefix}_PATH", default_path)
+    memory = MemoryLRU(
+        max_entries=int(os.environ.get(f"{prefix}_MAX_ENTRIES", default_max_entries))
+    )
+    disk = None
+    if path:
+        try:
+            disk = SQLiteStore(
+                path,
+                max_bytes=int(os.environ.get(f"{prefix}_MAX_BYTES", default_max_bytes)),
+            )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"无法打开缓存文件 {path}，仅使用内存缓存: {e}")
+    return TieredCache(
+        ttl_seconds=float(os.environ.get(f"{prefix}_TTL", default_ttl)),
+        memory=memory,
+        disk=disk,
+    )
+
+
+_search_cache: TieredCache | None = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> TieredCache:
+    """Return the process-wide search cache, opening it on first use."""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = build_tiered_cache("search_cache", default_ttl=6 * 3600)
+    return _search_cache
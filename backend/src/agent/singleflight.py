@@ -0,0 +1,354 @@
+"""Request coalescing for identical in-flight upstream calls.
+
+When many runs issue the same search at the same moment, only one of them
+should reach Gemini; the others wait for that call and share its result.
+Coalescing happens at two levels:
+
+* :class:`SingleFlight` coalesces callers inside one process (threads and
+  coroutines).
+* :class:`RedisFlight` coalesces the per-process leaders across API replicas
+  through Redis. One replica takes a short-lived lock and publishes the result
+  under a result key; the others poll for it. If the lock disappears without a
+  result (the leader crashed or failed), a follower runs the call itself.
+
+Results shared through Redis must be JSON-serializable. An asyncio Redis
+client is bound to the event loop it was first used on, so one is created per
+event loop.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A single in-flight call shared by every thread waiting on its key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """In-process coalescing of concurrent calls that share a key."""
+
+    def __init__(self):
+        """Start with no call in flight."""
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(
+        self, key: str, func: Callable[[], Any], timeout: float | None = None
+    ) -> Any:
+        """Run ``func`` once for all concurrent callers with the same ``key``.
+
+        Args:
+            key: Coalescing key.
+            func: Zero-argument callable performing the upstream call.
+            timeout: Maximum time a follower waits for the leader.
+
+        Raises:
+            TimeoutError: If a follower waits longer than ``timeout``.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.followers += 1
+                self.shared += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Coalesced call timed out after {timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        timeout: float | None = None,
+    ) -> Any:
+        """Async variant of :meth:`do` for coroutines on the same event loop.
+
+        The shared task is shielded, so a follower giving up (or being
+        cancelled) never cancels the call other callers are waiting on.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = asyncio.ensure_future(func())
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda t: self._finish(task_key, t))
+                self.leaders += 1
+            else:
+                self.shared += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except TimeoutError as exc:
+            raise TimeoutError(f"Coalesced call timed out after {timeout}s") from exc
+
+    def _finish(self, task_key: tuple, task: asyncio.Task) -> None:
+        with self._lock:
+            self._tasks.pop(task_key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter gave up
+            task.exception()
+
+    def stats(self) -> dict:
+        """Return how many calls led and how many were served by a leader."""
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared}
+
+
+class RedisFlight:
+    """Cross-replica coalescing through a Redis lock and result key.
+
+    Args:
+        client: Synchronous ``redis.Redis``-compatible client, or ``None``.
+        aclient_factory: Zero-argument callable creating a
+            ``redis.asyncio.Redis``-compatible client, or ``None``. It is
+            called once per event loop.
+        lock_ttl: Seconds a leader may hold the lock before it expires.
+        result_ttl: Seconds a published result stays readable for followers.
+        poll_interval: Seconds between follower polls.
+        prefix: Namespace for the Redis keys.
+        errors: Exception types that mean Redis itself is unavailable. On
+            these the caller falls back to running the call directly.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        aclient_factory: Callable[[], Any] | None = None,
+        lock_ttl: float = 60.0,
+        result_ttl: float = 30.0,
+        poll_interval: float = 0.05,
+        prefix: str = "agent:singleflight",
+        errors: tuple = (ConnectionError,),
+    ):
+        """Keep the clients; async ones are only created when a loop needs one."""
+        self.client = client
+        self.aclient_factory = aclient_factory
+        self._aclients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._aclients_lock = threading.Lock()
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.errors = errors
+
+    def _aclient(self) -> Any:
+        """Return the asyncio client of the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        with self._aclients_lock:
+            client = self._aclients.get(loop)
+            if client is None:
+                client = self._aclients[loop] = self.aclient_factory()
+            return client
+
+    def _keys(self, key: str) -> tuple:
+        return f"{self.prefix}:lock:{key}", f"{self.prefix}:result:{key}"
+
+    @staticmethod
+    def _decode(raw: Any) -> Any:
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        return json.loads(raw)
+
+    def do(
+        self, key: str, func: Callable[[], Any], timeout: float | None = None
+    ) -> Any:
+        """Run ``func`` on one replica and share its JSON result with the others."""
+        lock_key, result_key = self._keys(key)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        token = uuid.uuid4().hex
+        while True:
+            cached = self.client.get(result_key)
+            if cached is not None:
+                return self._decode(cached)
+            if self.client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                try:
+                    result = func()
+                    self.client.set(
+                        result_key, json.dumps(result), px=int(self.result_ttl * 1000)
+                    )
+                    return result
+                finally:
+                    if self._decode_token(self.client.get(lock_key)) == token:
+                        self.client.delete(lock_key)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Coalesced call timed out after {timeout}s")
+            time.sleep(self.poll_interval)
+
+    async def ado(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        timeout: float | None = None,
+    ) -> Any:
+        """Async variant of :meth:`do` using the asyncio Redis client."""
+        lock_key, result_key = self._keys(key)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        token = uuid.uuid4().hex
+        aclient = self._aclient()
+        while True:
+            cached = await aclient.get(result_key)
+            if cached is not None:
+                return self._decode(cached)
+            if await aclient.set(
+                lock_key, token, nx=True, px=int(self.lock_ttl * 1000)
+            ):
+                try:
+                    result = await func()
+                    await aclient.set(
+                        result_key, json.dumps(result), px=int(self.result_ttl * 1000)
+                    )
+                    return result
+                finally:
+                    if self._decode_token(await aclient.get(lock_key)) == token:
+                        await aclient.delete(lock_key)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Coalesced call timed out after {timeout}s")
+            await asyncio.sleep(self.poll_interval)
+
+    @staticmethod
+    def _decode_token(raw: Any) -> str | None:
+        if isinstance(raw, bytes):
+            return raw.decode("utf-8")
+        return raw
+
+
+class Coalescer:
+    """In-process :class:`SingleFlight` in front of an optional :class:`RedisFlight`.
+
+    Only the local leader talks to Redis, so a replica contributes at most one
+    waiter per key to the cross-replica protocol.
+    """
+
+    def __init__(self, local: SingleFlight, remote: RedisFlight | None = None):
+        """Coalesce through ``local``, then across replicas through ``remote``."""
+        self.local = local
+        self.remote = remote
+
+    def do(
+        self, key: str, func: Callable[[], Any], timeout: float | None = None
+    ) -> Any:
+        """Coalesce ``func`` locally and, if configured, across replicas."""
+        if self.remote is None or self.remote.client is None:
+            return self.local.do(key, func, timeout=timeout)
+        return self.local.do(
+            key, lambda: self._remote_do(key, func, timeout), timeout=timeout
+        )
+
+    async def ado(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        timeout: float | None = None,
+    ) -> Any:
+        """Async variant of :meth:`do`."""
+        if self.remote is None or self.remote.aclient_factory is None:
+            return await self.local.ado(key, func, timeout=timeout)
+        return await self.local.ado(
+            key, lambda: self._remote_ado(key, func, timeout), timeout=timeout
+        )
+
+    def _remote_do(self, key, func, timeout):
+        failed = []
+
+        def guarded():
+            try:
+                return func()
+            except BaseException:
+                failed.append(True)
+                raise
+
+        try:
+            return self.remote.do(key, guarded, timeout=timeout)
+        except self.remote.errors as e:
+            if failed:
+                raise
+            logger.warning(f"Redis 合并请求不可用，直接调用: {e}")
+            return func()
+
+    async def _remote_ado(self, key, func, timeout):
+        failed = []
+
+        async def guarded():
+            try:
+                return await func()
+            except BaseException:
+                failed.append(True)
+                raise
+
+        try:
+            return await self.remote.ado(key, guarded, timeout=timeout)
+        except self.remote.errors as e:
+            if failed:
+                raise
+            logger.warning(f"Redis 合并请求不可用，直接调用: {e}")
+            return await func()
+
+
+def _redis_flight_from_env() -> RedisFlight | None:
+    """Build a :class:`RedisFlight` from ``REDIS_URI`` if Redis is available."""
+    url = os.environ.get("REDIS_URI")
+    if not url or os.environ.get("AGENT_SINGLEFLIGHT_REDIS", "1") == "0":
+        return None
+    try:
+        import redis
+        import redis.asyncio
+    except ImportError:
+        logger.warning("未安装 redis 包，仅在进程内合并请求")
+        return None
+    return RedisFlight(
+        client=redis.Redis.from_url(url),
+        aclient_factory=lambda: redis.asyncio.Redis.from_url(url),
+        errors=(redis.RedisError,),
+    )
+
+
+_coalescer: Coalescer | None = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> Coalescer:
+    """Return the process-wide :class:`Coalescer`, creating it on first use."""
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = Coalescer(SingleFlight(), _redis_flight_from_env())
+    return _coalescer
@@ -6,29 +6,86 @@ from typing import TypedDict
 from langgraph.graph import add_messages
 from typing_extensions import Annotated
 
+from agent.cascade import merge_cascade
+from agent.usage import merge_usage
+
 
 import operator
 from dataclasses import dataclass, field
 from typing_extensions import Annotated
 
 
+def merge_sources(left: list | None, right: list | None) -> list:
+    """Reducer that keeps one registry entry per unique source url.
+
+    Entries are keyed by the original url (``value``). Each holds the first
+    short url seen for it, any other short urls it was cited under
+    (``aliases``), a reference ``count`` and whether the final answer ``cited``
+    it. Neither input is mutated, and plain per-citation lists (as stored by
+    older checkpoints) are folded in the same way.
+    """
+    registry: dict = {}
+    for source in (left or []) + (right or []):
+        url = source["value"]
+        entry = registry.get(url)
+        if entry is None:
+            entry = registry[url] = {
+                "label": source["label"],
+                "short_url": source["short_url"],
+                "value": url,
+                "count": 0,
+            }
+        entry["count"] += source.get("count", 1)
+        aliases = [source["short_url"], *source.get("aliases", [])]
+        for alias in aliases:
+            if alias and alias != entry["short_url"]:
+                entry.setdefault("aliases", [])
+                if alias not in entry["aliases"]:
+                    entry["aliases"].append(alias)
+        if source.get("cited"):
+            entry["cited"] = True
+    return list(registry.values())
+
+
+def merge_unique(left: list | None, right: list | None) -> list:
+    """Reducer that appends the new items of ``right`` to ``left``, keeping order."""
+    return list(dict.fromkeys((left or []) + (right or [])))
+
+
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
-    sources_gathered: Annotated[list, operator.add]
+    sources_gathered: Annotated[list, merge_sources]
+    skipped_queries: Annotated[list, operator.add]
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
     reasoning_model: str
+    run_started_at: float
+    run_deadline: float | None
+    research_digest: str
+    compacted_count: int
+    tokens_saved: Annotated[int, operator.add]
+    token_usage: Annotated[dict, merge_usage]
+    trace_id: str
+    answer_cache_hit: bool
+    reflection_cascade: Annotated[dict, merge_cascade]
+    # Models whose circuit breaker was open when the run called them
+    degraded_models: Annotated[list, merge_unique]
 
 
 class ReflectionState(TypedDict):
     is_sufficient: bool
     knowledge_gap: str
-    follow_up_queries: Annotated[list, operator.add]
+    follow_up_queries: list
     research_loop_count: int
     number_of_ran_queries: int
+    # evaluate_research only sees the keys declared here
+    max_research_loops: int
+    run_started_at: float
+    run_deadline: float | None
+    trace_id: str
 
 
 class Query(TypedDict):
@@ -38,11 +95,17 @@ class Query(TypedDict):
 
 class QueryGenerationState(TypedDict):
     query_list: list[Query]
+    run_deadline: float | None
+    trace_id: str
 
 
 class WebSearchState(TypedDict):
     search_query: str
     id: str
+    run_deadline: float | None
+    trace_id: str
+    loop_started_at: float
+    fanout: int
 
 
 @dataclass(kw_only=True)
@@ -0,0 +1,212 @@
+"""In-memory manifest of the frontend build for serving it without disk access.
+
+The build directory is walked once at startup. Every file is kept in memory
+together with its content type, a strong ETag, its modification time and
+its compressed variants: ``.br``/``.gz`` siblings emitted by the build are
+used when present, otherwise compressible files are gzipped (and brotli
+compressed when the optional ``brotli`` package is installed) up front.
+Requests are then answered from the manifest alone: no ``stat`` or ``open``
+per request, content negotiation on ``Accept-Encoding``, ``immutable``
+caching for Vite's content-hashed assets and ``304 Not Modified`` for
+conditional requests.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite names bundled assets like ``index-4f9a1c2b.js``: an 8-digit hex content
+# hash (``hashCharacters: "hex"`` in vite.config.ts)
+_HASHED_NAME = re.compile(r"-[0-9a-f]{8}\.[A-Za-z0-9]+$")
+_COMPRESSIBLE = re.compile(
+    r"^(text/|application/(javascript|json|xml|manifest\+json|wasm)|image/svg\+xml)"
+)
+# Compressing tiny files costs more in headers than it saves
+_MIN_COMPRESS_BYTES = 1024
+_PRECOMPRESSED = {".br": "br", ".gz": "gzip"}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class StaticEntry:
+    """One file of the build with its compressed variants.
+
+    Attributes:
+        content: Uncompressed file content.
+        media_type: Content type sent with every variant.
+        etag: Strong ETag of the uncompressed content, quoted.
+        last_modified: File modification time as an HTTP date.
+        mtime: File modification time in seconds since the epoch.
+        cache_control: ``Cache-Control`` value for this file.
+        variants: Compressed content by content coding, e.g. ``"br"``.
+    """
+
+    content: bytes
+    media_type: str
+    etag: str
+    last_modified: str
+    mtime: float
+    cache_control: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def select(self, accept_encoding: str) -> Tuple[bytes, str | None, str]:
+        """Pick the representation for an ``Accept-Encoding`` header.
+
+        Returns:
+            The body, its content coding (``None`` for identity) and its ETag.
+            Each coding gets its own strong ETag, as the bytes differ.
+        """
+        accepted = _accepted_codings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if (
+                coding in self.variants
+                and accepted.get(coding, accepted.get("*", 0)) > 0
+            ):
+                return self.variants[coding], coding, f'{self.etag[:-1]}-{coding}"'
+        return self.content, None, self.etag
+
+    def headers(self, etag: str, coding: str | None) -> Dict[str, str]:
+        """Response headers for the representation ``etag``/``coding``."""
+        headers = {
+            "ETag": etag,
+            "Last-Modified": self.last_modified,
+            "Cache-Control": self.cache_control,
+        }
+        if self.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if coding is not None:
+            headers["Content-Encoding"] = coding
+        return headers
+
+    def not_modified(self, request_headers: Mapping[str, str], etag: str) -> bool:
+        """Whether a conditional request can be answered with ``304``.
+
+        ``If-None-Match`` wins over ``If-Modified-Since``; ETags are compared
+        weakly, as RFC 9110 requires for ``If-None-Match``.
+        """
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            candidates = {
+                tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+            }
+            return etag in candidates
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.mtime) <= since
+        return False
+
+
+def _accepted_codings(accept_encoding: str) -> Dict[str, float]:
+    """Parse ``Accept-Encoding`` into quality values by coding."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def _compress(content: bytes, media_type: str, variants: Dict[str, bytes]) -> None:
+    """Add the codings missing from ``variants`` when they make ``content`` smaller."""
+    if len(content) < _MIN_COMPRESS_BYTES or not _COMPRESSIBLE.match(media_type):
+        return
+    if "gzip" not in variants:
+        # Fixed mtime so the bytes, and so the ETag, are stable across restarts
+        variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+    if "br" not in variants and brotli is not None:
+        variants["br"] = brotli.compress(content)
+    for coding in list(variants):
+        if len(variants[coding]) >= len(content):
+            del variants[coding]
+
+
+class StaticManifest:
+    """Every file of a build directory, by URL path.
+
+    Args:
+        root: Build directory, e.g. ``frontend/dist``.
+        compress: Whether to compress files the build did not precompress.
+    """
+
+    def __init__(self, root: str, compress: bool = True):
+        """Read, hash and compress every file under ``root`` once."""
+        self.root = root
+        self.entries: Dict[str, StaticEntry] = {}
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                stem, extension = os.path.splitext(path)
+                if extension in _PRECOMPRESSED and os.path.isfile(stem):
+                    # A precompressed sibling, loaded with its original below
+                    continue
+                url_path = os.path.relpath(path, root).replace(os.sep, "/")
+                self.entries[url_path] = self._load(path, url_path, compress)
+        self.bytes = sum(
+            len(e.content) + sum(map(len, e.variants.values()))
+            for e in self.entries.values()
+        )
+        logger.info(
+            f"静态文件清单已加载: {len(self.entries)} 个文件，共 {self.bytes} 字节"
+        )
+
+    @staticmethod
+    def _load(path: str, url_path: str, compress: bool) -> StaticEntry:
+        with open(path, "rb") as f:
+            content = f.read()
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        variants = {}
+        for extension, coding in _PRECOMPRESSED.items():
+            if os.path.isfile(path + extension):
+                with open(path + extension, "rb") as f:
+                    variants[coding] = f.read()
+        if compress:
+            _compress(content, media_type, variants)
+        mtime = os.path.getmtime(path)
+        hashed = url_path.startswith("assets/") and _HASHED_NAME.search(url_path)
+        return StaticEntry(
+            content=content,
+            media_type=media_type,
+            etag=f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+            last_modified=formatdate(mtime, usegmt=True),
+            mtime=mtime,
+            cache_control=IMMUTABLE_CACHE_CONTROL
+            if hashed
+            else REVALIDATE_CACHE_CONTROL,
+            variants=variants,
+        )
+
+    def lookup(self, path: str) -> StaticEntry | None:
+        """Return the entry for a request path, or ``None``."""
+        return self.entries.get(path.lstrip("/"))
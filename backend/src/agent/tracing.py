@@ -0,0 +1,408 @@
+"""Lightweight tracing for graph nodes and upstream model calls.
+
+Every node execution and every upstream call opens a :class:`Span` that
+records its wall time and attributes such as the branch ``id``, the research
+loop, the time a call spent queued in the
+:class:`agent.executor.DeadlineExecutor` and how many times it was retried.
+Spans nest through a context variable, so a model call becomes the child of
+the node that made it, in threads and coroutines alike.
+
+Finished spans go to the configured exporters:
+
+* ``AGENT_TRACE_FILE``: one JSON object per span appended to a local file.
+* ``OTEL_EXPORTER_OTLP_ENDPOINT`` (or ``OTEL_EXPORTER_OTLP_TRACES_ENDPOINT``):
+  batches posted as OTLP/HTTP JSON to a collector.
+
+Without either, spans are not recorded at all.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "agent_current_span", default=None
+)
+
+
+class Span:
+    """One timed operation, with its trace and parent ids and attributes."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_time",
+        "end_time",
+        "attributes",
+        "status",
+        "_started",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None = None,
+        attributes: Dict[str, Any] | None = None,
+    ):
+        """Start the span's clock; it gets a fresh random span id."""
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self.end_time: float | None = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self._started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        """Set attributes, skipping ``None`` values."""
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def add(self, name: str, amount: float = 1) -> None:
+        """Increment a numeric attribute."""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def finish(self, error: BaseException | None = None) -> None:
+        """Stop the clock and record ``error``, if any, as the span's status."""
+        self.end_time = self.start_time + (time.perf_counter() - self._started)
+        self.attributes["duration_ms"] = round(
+            (self.end_time - self.start_time) * 1000, 3
+        )
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        """Return the span as a JSON-serializable dict."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class JsonLinesExporter:
+    """Append each finished span as one JSON line to ``path``."""
+
+    def __init__(self, path: str):
+        """Write to ``path``, creating it on the first export."""
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        """Append ``span`` to the file."""
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def shutdown(self) -> None:
+        """Do nothing: every span is written as soon as it is exported."""
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter:
+    """Batch spans and post them to an OTLP/HTTP collector as JSON.
+
+    Spans are queued and flushed by a daemon thread every ``interval`` seconds
+    or once ``batch_size`` spans are waiting, so exporting never blocks a
+    node. Failed posts are logged and dropped.
+
+    Args:
+        endpoint: Traces endpoint, e.g. ``http://localhost:4318/v1/traces``.
+        service_name: ``service.name`` resource attribute.
+        interval: Seconds between flushes.
+        batch_size: Number of queued spans that triggers an early flush.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str = "research-agent",
+        interval: float = 2.0,
+        batch_size: int = 256,
+    ):
+        """Start the daemon thread that flushes the queue."""
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.interval = interval
+        self.batch_size = batch_size
+        self._queue: List[Span] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="agent-otlp-export", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        """Queue ``span`` for the next flush."""
+        with self._lock:
+            self._queue.append(span)
+            full = len(self._queue) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Post every queued span to the collector in one request."""
+        with self._lock:
+            batch, self._queue = self._queue, []
+        if not batch:
+            return
+        body = json.dumps(self._payload(batch)).encode("utf-8")
+        request = urllib.request.Request(
+            self.endpoint,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+        except Exception as e:
+            logger.warning(f"导出 {len(batch)} 个追踪 span 失败: {e}")
+
+    def _payload(self, batch: List[Span]) -> dict:
+        spans = []
+        for span in batch:
+            record = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                "endTimeUnixNano": str(int(span.end_time * 1e9)),
+                "attributes": [
+                    {"key": k, "value": _otlp_value(v)}
+                    for k, v in span.attributes.items()
+                ],
+                "status": {"code": 2 if span.status == "error" else 1},
+            }
+            if span.parent_id:
+                record["parentSpanId"] = span.parent_id
+            spans.append(record)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "agent"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def shutdown(self) -> None:
+        """Stop the flush thread and post the spans still queued."""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to its exporters."""
+
+    def __init__(self, exporters: List[Any] | None = None):
+        """Export to ``exporters``; without any, tracing is disabled."""
+        self.exporters = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are recorded at all."""
+        return bool(self.exporters)
+
+    @contextmanager
+    def span(
+        self, name: str, trace_id: str | None = None, **attributes: Any
+    ) -> Iterator[Span | None]:
+        """Open a span as the child of the current one.
+
+        Yields ``None`` when tracing is disabled, so callers guard attribute
+        updates with ``if span``.
+        """
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id or (parent.trace_id if parent else uuid.uuid4().hex),
+            parent.span_id if parent else None,
+        )
+        span.set(**attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish(error)
+            self._export(span)
+
+    def _export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"追踪 span 导出失败: {e}")
+
+    def shutdown(self) -> None:
+        """Shut every exporter down, flushing what they still hold."""
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+def current_span() -> Span | None:
+    """Return the innermost open span in this context, if any."""
+    return _current_span.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span; a no-op when none is open."""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+class RetryCounter(BaseCallbackHandler):
+    """LangChain callback counting retries on the span of the call it is passed to."""
+
+    def __init__(self, span: Span):
+        """Count retries on ``span``."""
+        self.span = span
+
+    def on_retry(self, retry_state: Any, **kwargs: Any) -> None:
+        """Add one to the span's ``retries`` attribute."""
+        self.span.add("retries")
+
+
+def traced_node(name: str, func: Callable, new_trace: bool = False) -> Callable:
+    """Wrap a LangGraph node so each execution runs in a ``node.<name>`` span.
+
+    The span records the branch ``id`` and research loop from the node's
+    state. The run's trace id travels in the ``trace_id`` state key: the
+    entry node (``new_trace``) starts a fresh one for every run and returns it
+    with its update, later nodes and ``Send`` branches reuse it.
+    """
+
+    def open_span(state: dict):
+        trace_id = None if new_trace else state.get("trace_id")
+        trace_id = trace_id or uuid.uuid4().hex
+        return trace_id, get_tracer().span(
+            f"node.{name}",
+            trace_id=trace_id,
+            node=name,
+            branch_id=state.get("id"),
+            loop=state.get("research_loop_count"),
+        )
+
+    def with_trace_id(state: dict, trace_id: str, update: Any) -> Any:
+        if isinstance(update, dict) and state.get("trace_id") != trace_id:
+            update = {**update, "trace_id": trace_id}
+        return update
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def awrapper(state, config):
+            trace_id, span = open_span(state)
+            with span:
+                update = await func(state, config)
+            return with_trace_id(state, trace_id, update)
+
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(state, config):
+        trace_id, span = open_span(state)
+        with span:
+            update = func(state, config)
+        return with_trace_id(state, trace_id, update)
+
+    return wrapper
+
+
+def _tracer_from_env() -> Tracer:
+    exporters: List[Any] = []
+    path = os.environ.get("AGENT_TRACE_FILE")
+    if path:
+        exporters.append(JsonLinesExporter(path))
+    endpoint = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+    if not endpoint and os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        endpoint = os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"].rstrip("/") + "/v1/traces"
+    if endpoint:
+        exporters.append(
+            OtlpHttpExporter(
+                endpoint,
+                service_name=os.environ.get("OTEL_SERVICE_NAME", "research-agent"),
+            )
+        )
+    return Tracer(exporters)
+
+
+_tracer: Tracer | None = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide :class:`Tracer`, configured from the environment on first use."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = _tracer_from_env()
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """Replace the process-wide tracer, e.g. to export to a custom backend."""
+    global _tracer
+    with _tracer_lock:
+        _tracer = tracer
+    return tracer
@@ -0,0 +1,114 @@
+"""Token and cost accounting for upstream model calls.
+
+Every model call reports its input/output tokens. Calls are summed per node
+and per model into the ``token_usage`` state field (via :func:`merge_usage`),
+priced with a per-model rate table, and written as one structured log record
+per call to the ``agent.usage`` logger.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Mapping
+
+usage_logger = logging.getLogger("agent.usage")
+
+# USD per one million tokens. Model names are matched by longest prefix, so
+# dated preview names share the rate of their family.
+DEFAULT_MODEL_PRICING: Dict[str, Dict[str, float]] = {
+    "gemini-2.0-flash-lite": {"input": 0.075, "output": 0.30},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+    "gemini-2.5-flash-lite": {"input": 0.10, "output": 0.40},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+}
+
+_COUNTERS = ("calls", "input_tokens", "output_tokens", "cost_usd")
+
+
+def usage_from_genai(response: Any) -> tuple[int, int]:
+    """Return ``(input_tokens, output_tokens)`` from a google-genai response."""
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return 0, 0
+    return (
+        getattr(metadata, "prompt_token_count", None) or 0,
+        getattr(metadata, "candidates_token_count", None) or 0,
+    )
+
+
+def usage_from_message(message: Any) -> tuple[int, int]:
+    """Return ``(input_tokens, output_tokens)`` from a LangChain message or chunk."""
+    metadata = getattr(message, "usage_metadata", None) or {}
+    return metadata.get("input_tokens") or 0, metadata.get("output_tokens") or 0
+
+
+def price_for(
+    model: str, pricing: Mapping[str, Mapping[str, float]] | None = None
+) -> Mapping[str, float] | None:
+    """Return the rate entry for ``model`` by longest prefix match, if any."""
+    pricing = DEFAULT_MODEL_PRICING if pricing is None else pricing
+    matches = [name for name in pricing if model.startswith(name)]
+    if not matches:
+        return None
+    return pricing[max(matches, key=len)]
+
+
+def call_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    pricing: Mapping[str, Mapping[str, float]] | None = None,
+) -> float:
+    """Cost of one call in USD, ``0.0`` for models missing from the rate table."""
+    rate = price_for(model, pricing)
+    if rate is None:
+        return 0.0
+    return (
+        input_tokens * rate.get("input", 0.0) + output_tokens * rate.get("output", 0.0)
+    ) / 1_000_000
+
+
+def record_usage(
+    node: str,
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    pricing: Mapping[str, Mapping[str, float]] | None = None,
+) -> dict:
+    """Log one call and return it as a ``token_usage`` state update."""
+    cost = call_cost(model, input_tokens, output_tokens, pricing)
+    record = {
+        "node": node,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round(cost, 8),
+    }
+    usage_logger.info(json.dumps(record), extra={"token_usage": record})
+    counters = {
+        "calls": 1,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": cost,
+    }
+    return {
+        "total": dict(counters),
+        "by_node": {node: dict(counters)},
+        "by_model": {model: dict(counters)},
+    }
+
+
+def _add_counters(left: Mapping[str, Any], right: Mapping[str, Any]) -> dict:
+    return {name: left.get(name, 0) + right.get(name, 0) for name in _COUNTERS}
+
+
+def merge_usage(left: dict | None, right: dict | None) -> dict:
+    """Reducer summing ``token_usage`` updates in total, per node and per model."""
+    left, right = left or {}, right or {}
+    merged = {"total": _add_counters(left.get("total", {}), right.get("total", {}))}
+    for group in ("by_node", "by_model"):
+        combined = dict(left.get(group, {}))
+        for key, counters in right.get(group, {}).items():
+            combined[key] = _add_counters(combined.get(key, {}), counters)
+        merged[group] = combined
+    return merged
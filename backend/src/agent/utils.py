@@ -1,13 +1,25 @@
-from typing import Any, Dict, List, Callable, Any as TypingAny
+from typing import Any, Awaitable, Dict, List, Callable, Any as TypingAny
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
-import concurrent.futures
+import asyncio
+
+from agent.citations import insert_citation_markers  # noqa: F401 - re-exported
+from agent.executor import get_executor
 
 
 def run_with_timeout(
-    func: Callable[..., TypingAny], *args: TypingAny, timeout: int = 30, **kwargs: TypingAny
+    func: Callable[..., TypingAny],
+    *args: TypingAny,
+    timeout: int = 30,
+    **kwargs: TypingAny,
 ) -> TypingAny:
     """Execute ``func`` and raise ``TimeoutError`` if it takes too long.
 
+    The call runs on the shared :class:`agent.executor.DeadlineExecutor`, so
+    control returns to the caller as soon as ``timeout`` elapses; the
+    abandoned call finishes in the background. ``timeout`` starts once a
+    worker picks the call up, and waiting for one is bounded by ``timeout``
+    too, so the caller waits at most ``2 * timeout``.
+
     Parameters
     ----------
     func : Callable
@@ -26,13 +38,39 @@ def run_with_timeout(
     ------
     TimeoutError
         If ``func`` does not finish within ``timeout`` seconds.
+    ExecutorSaturatedError
+        If too many timed-out calls are still running in the background.
     """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(func, *args, **kwargs)
-        try:
-            return future.result(timeout=timeout)
-        except concurrent.futures.TimeoutError as exc:  # pragma: no cover - network failures
-            raise TimeoutError(f"Operation timed out after {timeout}s") from exc
+    return get_executor().run(func, *args, timeout=timeout, **kwargs)
+
+
+async def arun_with_timeout(
+    func: Callable[..., Awaitable[TypingAny]],
+    *args: TypingAny,
+    timeout: int = 30,
+    **kwargs: TypingAny,
+) -> TypingAny:
+    """Await ``func`` and raise ``TimeoutError`` if it takes too long.
+
+    Unlike :func:`run_with_timeout` no worker thread is used: the coroutine runs
+    on the caller's event loop and is cancelled once ``timeout`` elapses.
+
+    Args:
+        func: The coroutine function to await.
+        *args: Positional arguments forwarded to ``func``.
+        timeout: Timeout in seconds.
+        **kwargs: Keyword arguments forwarded to ``func``.
+
+    Returns:
+        The result of ``func``.
+
+    Raises:
+        TimeoutError: If ``func`` does not finish within ``timeout`` seconds.
+    """
+    try:
+        return await asyncio.wait_for(func(*args, **kwargs), timeout=timeout)
+    except TimeoutError as exc:  # pragma: no cover - network failures
+        raise TimeoutError(f"Operation timed out after {timeout}s") from exc
 
 
 def get_research_topic(messages: List[AnyMessage]) -> str:
@@ -69,45 +107,6 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     return resolved_map
 
 
-def insert_citation_markers(text, citations_list):
-    """
-    Inserts citation markers into a text string based on start and end indices.
-
-    Args:
-        text (str): The original text string.
-        citations_list (list): A list of dictionaries, where each dictionary
-                               contains 'start_index', 'end_index', and
-                               'segment_string' (the marker to insert).
-                               Indices are assumed to be for the original text.
-
-    Returns:
-        str: The text with citation markers inserted.
-    """
-    # Sort citations by end_index in descending order.
-    # If end_index is the same, secondary sort by start_index descending.
-    # This ensures that insertions at the end of the string don't affect
-    # the indices of earlier parts of the string that still need to be processed.
-    sorted_citations = sorted(
-        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
-    )
-
-    modified_text = text
-    for citation_info in sorted_citations:
-        # These indices refer to positions in the *original* text,
-        # but since we iterate from the end, they remain valid for insertion
-        # relative to the parts of the string already processed.
-        end_idx = citation_info["end_index"]
-        marker_to_insert = ""
-        for segment in citation_info["segments"]:
-            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
-        # Insert the citation marker at the original end_idx position
-        modified_text = (
-            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
-        )
-
-    return modified_text
-
-
 def get_citations(response, resolved_urls_map):
     """
     Extracts and formats citation information from a Gemini model's response.
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from agent.answer_cache import answer_cache_key, seconds_until_next_bucket
+from agent.search_cache import MemoryLRU, TieredCache
+
+MODELS = ("gemini-2.0-flash", "gemini-2.5-pro")
+DEPTH = (3, 2)
+
+
+def key(topic="What is LangGraph?", models=MODELS, depth=DEPTH, bucket="2026-10-18"):
+    return answer_cache_key(topic, models, depth, bucket)
+
+
+def test_trivially_different_questions_share_a_key():
+    assert key("  what is  langgraph") == key()
+
+
+def test_date_bucket_models_and_depth_are_part_of_the_key():
+    assert key(bucket="2026-10-19") != key()
+    assert key(models=("gemini-2.0-flash", "gemini-2.5-flash")) != key()
+    assert key(depth=(3, 1)) != key()
+    assert key("What is LangChain?") != key()
+
+
+def test_entries_expire_when_the_bucket_rolls_over():
+    assert seconds_until_next_bucket(datetime(2026, 10, 18, 23, 0)) == 3600
+    assert seconds_until_next_bucket(datetime(2026, 10, 18, 0, 0)) == 24 * 3600
+    # Never hand the cache a zero TTL right at midnight
+    assert seconds_until_next_bucket(datetime(2026, 10, 18, 23, 59, 59, 999999)) == 1.0
+
+
+def test_bucket_ttl_is_capped_by_the_cache_ttl(monkeypatch):
+    cache = TieredCache(ttl_seconds=60, memory=MemoryLRU())
+    now = 1_000_000.0
+    monkeypatch.setattr("agent.search_cache.time.time", lambda: now)
+    cache.put("long", {"answer": "a"}, ttl_seconds=3600)
+    cache.put("short", {"answer": "b"}, ttl_seconds=10)
+    now += 30
+    assert cache.get("long") == {"answer": "a"}
+    assert cache.get("short") is None
+    now += 31
+    assert cache.get("long") is None
+
+
+@pytest.mark.parametrize("topic", ["Was ist LangGraph?", "LangGraph 是什么？"])
+def test_non_ascii_topics_are_keyed(topic):
+    assert key(topic) == key(topic.lower())
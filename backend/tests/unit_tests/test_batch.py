@@ -0,0 +1,126 @@
+import asyncio
+import io
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent.batch import (
+    completed_ids,
+    open_output,
+    question_id,
+    read_questions,
+    run_batch,
+)
+
+
+class FakeGraph:
+    """Stands in for the compiled graph, answering every question at once."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.questions = []
+
+    async def astream(self, state, config, stream_mode):
+        question = state["messages"][0].content
+        self.questions.append(question)
+        if question in self.fail:
+            raise RuntimeError("upstream down")
+        yield "updates", {"finalize_answer": {}}
+        yield (
+            "values",
+            {
+                "messages": [
+                    *state["messages"],
+                    AIMessage(content=f"答案: {question}"),
+                ],
+                "sources_gathered": [
+                    {"label": "a", "value": "https://a", "count": 1, "cited": True},
+                    {"label": "b", "value": "https://b", "count": 1, "cited": False},
+                ],
+                "token_usage": {"total": {"input_tokens": 1}},
+            },
+        )
+
+
+def write_torn_output(path):
+    line = json.dumps({"id": "q1", "answer": "完成"}, ensure_ascii=False) + "\n"
+    torn = json.dumps({"id": "q2", "answer": "中文答案"}, ensure_ascii=False)
+    # Cut the second line inside a multibyte character
+    path.write_bytes(line.encode() + torn.encode()[:-4])
+
+
+def test_torn_multibyte_line_is_ignored_on_resume(tmp_path):
+    path = tmp_path / "out.jsonl"
+    write_torn_output(path)
+    assert completed_ids(str(path)) == {"q1"}
+
+
+def test_open_output_starts_a_fresh_line_after_a_torn_write(tmp_path):
+    path = tmp_path / "out.jsonl"
+    write_torn_output(path)
+    with open_output(str(path)) as out:
+        out.write(json.dumps({"id": "q2", "answer": "重试"}, ensure_ascii=False) + "\n")
+    assert completed_ids(str(path)) == {"q1", "q2"}
+    assert path.read_bytes().endswith('重试"}\n'.encode())
+
+
+def test_open_output_leaves_complete_files_alone(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "q1"}\n', encoding="utf-8")
+    with open_output(str(path)):
+        pass
+    assert path.read_text(encoding="utf-8") == '{"id": "q1"}\n'
+    with open_output(str(tmp_path / "new.jsonl")):
+        pass
+    assert (tmp_path / "new.jsonl").read_bytes() == b""
+
+
+def test_question_id_defaults_to_a_hash_of_the_question():
+    assert question_id({"id": 7, "question": "q"}) == "7"
+    assert question_id({"question": "q"}) == question_id({"question": "q"})
+    assert question_id({"question": "q"}) != question_id({"question": "r"})
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text(
+        '{"id": 1, "question": "a"}\n\n{"id": "1", "question": "b"}\n',
+        encoding="utf-8",
+    )
+    with pytest.raises(
+        ValueError, match=r"questions.jsonl:3: duplicate id '1'.*line 1"
+    ):
+        list(read_questions(str(path)))
+
+
+def test_repeated_question_needs_its_own_id(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text('{"question": "a"}\n{"question": "a"}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="duplicate id"):
+        list(read_questions(str(path)))
+    path.write_text(
+        '{"id": "x", "question": "a"}\n{"id": "y", "question": "a"}\n',
+        encoding="utf-8",
+    )
+    assert len(list(read_questions(str(path)))) == 2
+
+
+def test_run_batch_skips_completed_and_records_failures():
+    graph = FakeGraph(fail={"坏问题"})
+    items = [
+        {"id": "done", "question": "已完成"},
+        {"id": "ok", "question": "好问题"},
+        {"id": "bad", "question": "坏问题"},
+    ]
+    out = io.StringIO()
+    counts = asyncio.run(
+        run_batch(graph, iter(items), out, concurrency=2, skip={"done"})
+    )
+    assert counts == {"completed": 1, "failed": 1, "skipped": 1}
+    assert "已完成" not in graph.questions
+    results = {r["id"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert results["ok"]["answer"] == "答案: 好问题"
+    assert results["ok"]["sources"] == [{"label": "a", "url": "https://a", "count": 1}]
+    assert "finalize_answer" in results["ok"]["timings"]["node_done_ms"]
+    assert "upstream down" in results["bad"]["error"]
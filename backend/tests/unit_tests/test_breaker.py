@@ -0,0 +1,205 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import graph
+from agent.breaker import CircuitBreakers, CircuitOpenError
+from agent.executor import WorkerTimeoutError
+from agent.ratelimit import QueueTimeoutError
+
+MODEL = "gemini-test"
+
+
+def breakers(**settings):
+    settings = {"min_calls": 2, "failure_rate": 0.5, "min_timeout": 5.0, **settings}
+    return CircuitBreakers({"*": settings})
+
+
+def fail(breakers, error, timeout=30.0):
+    """Make one guarded call, given ``timeout`` seconds, that raises ``error``."""
+    with pytest.raises(type(error)):
+        with breakers.guard(MODEL) as call:
+            call.timeout = timeout
+            raise error
+
+
+def test_long_enough_timeouts_open_the_breaker():
+    limits = breakers()
+    fail(limits, TimeoutError("upstream"))
+    fail(limits, TimeoutError("upstream"))
+    assert limits.stats()[MODEL]["state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        with limits.guard(MODEL):
+            pass
+
+
+def test_timeouts_of_calls_cut_short_are_ignored():
+    limits = breakers()
+    for _ in range(4):
+        # The run budget left the call less than min_timeout
+        fail(limits, TimeoutError("budget"), timeout=1.0)
+    assert limits.stats()[MODEL]["state"] == "closed"
+    assert limits.stats()[MODEL]["window_calls"] == 0
+
+
+def test_local_waits_are_ignored():
+    limits = breakers()
+    fail(limits, QueueTimeoutError("rate limit queue"), timeout=None)
+    fail(limits, WorkerTimeoutError("no free worker"))
+    fail(limits, TimeoutError("never reached the upstream"), timeout=None)
+    assert limits.stats()[MODEL]["window_calls"] == 0
+
+
+def test_min_timeout_is_never_below_the_call_floor():
+    limits = breakers(min_timeout=0)
+    fail(limits, TimeoutError("leftover"), timeout=0.01)
+    assert limits.stats()[MODEL]["window_calls"] == 0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("agent.breaker.time.monotonic", lambda: now[0])
+    return now
+
+
+def succeed(breakers):
+    with breakers.guard(MODEL) as call:
+        call.timeout = 30.0
+
+
+def test_probe_success_closes_the_breaker(clock):
+    limits = breakers(open_seconds=10)
+    fail(limits, RuntimeError("500"))
+    fail(limits, RuntimeError("500"))
+    clock[0] += 5
+    with pytest.raises(CircuitOpenError) as rejected:
+        succeed(limits)
+    assert rejected.value.retry_in == 5
+    clock[0] += 5
+    with limits.guard(MODEL):
+        assert limits.stats()[MODEL]["state"] == "half_open"
+        # Only one probe at a time
+        with pytest.raises(CircuitOpenError):
+            succeed(limits)
+    assert limits.stats()[MODEL]["state"] == "closed"
+    assert limits.stats()[MODEL]["rejected"] == 2
+
+
+def test_failed_probe_reopens_for_twice_as_long(clock):
+    limits = breakers(open_seconds=10, max_open_seconds=15)
+    fail(limits, RuntimeError("500"))
+    fail(limits, RuntimeError("500"))
+    clock[0] += 10
+    fail(limits, RuntimeError("500"))
+    stats = limits.stats()[MODEL]
+    assert (stats["state"], stats["retry_in"], stats["opened"]) == ("open", 15, 2)
+    clock[0] += 15
+    succeed(limits)
+    assert limits.stats()[MODEL]["state"] == "closed"
+    # Closing resets the open time
+    fail(limits, RuntimeError("500"))
+    fail(limits, RuntimeError("500"))
+    assert limits.stats()[MODEL]["retry_in"] == 10
+
+
+def test_probe_failing_locally_leaves_the_breaker_half_open(clock):
+    limits = breakers(open_seconds=10)
+    fail(limits, RuntimeError("500"))
+    fail(limits, RuntimeError("500"))
+    clock[0] += 10
+    fail(limits, QueueTimeoutError("rate limit queue"), timeout=None)
+    assert limits.stats()[MODEL]["state"] == "half_open"
+    succeed(limits)
+    assert limits.stats()[MODEL]["state"] == "closed"
+
+
+def test_failures_outside_the_window_do_not_count(clock):
+    limits = breakers(window=30, min_calls=3)
+    fail(limits, RuntimeError("500"))
+    fail(limits, RuntimeError("500"))
+    clock[0] += 31
+    succeed(limits)
+    fail(limits, RuntimeError("500"))
+    succeed(limits)
+    stats = limits.stats()[MODEL]
+    assert stats["state"] == "closed"
+    assert stats["window_calls"] == 3
+
+
+def test_client_errors_are_not_failures():
+    class BadRequest(Exception):
+        code = 400
+
+    class Throttled(Exception):
+        code = 429
+
+    limits = breakers()
+    fail(limits, BadRequest("invalid argument"))
+    fail(limits, BadRequest("invalid argument"))
+    assert limits.stats()[MODEL]["window_calls"] == 0
+    fail(limits, Throttled("429"))
+    fail(limits, Throttled("429"))
+    assert limits.stats()[MODEL]["state"] == "open"
+
+
+class FakeChatModel:
+    """Plans two searches, always asks for one more, then answers."""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def invoke(self, prompt, config=None, **kwargs):
+        if self.schema is None:
+            return AIMessage(content="answer")
+        if "query" in self.schema.model_fields:
+            parsed = self.schema(query=["q1", "q2"], rationale="r")
+        else:
+            parsed = self.schema(
+                is_sufficient=False, knowledge_gap="gap", follow_up_queries=["q3"]
+            )
+        return {"raw": AIMessage(content=""), "parsed": parsed, "parsing_error": None}
+
+
+def test_breaker_opened_during_a_run_degrades_the_run(monkeypatch):
+    search_model = "gemini-search"
+    limits = breakers(min_timeout=1.0)
+    release = threading.Event()
+    searches = []
+
+    def hang(**request):
+        searches.append(request["contents"])
+        release.wait(10)
+
+    monkeypatch.setattr(graph, "get_circuit_breakers", lambda: limits)
+    monkeypatch.setattr(
+        graph,
+        "get_chat_model",
+        lambda model, temperature, schema=None: FakeChatModel(schema),
+    )
+    graph.set_genai_client(
+        SimpleNamespace(models=SimpleNamespace(generate_content=hang))
+    )
+    config = {
+        "configurable": {
+            "query_generator_model": search_model,
+            "number_of_initial_queries": 2,
+            "max_research_loops": 2,
+            "run_deadline_seconds": 60,
+            "llm_timeout_seconds": 1.5,
+        }
+    }
+    try:
+        state = graph.graph.invoke(
+            {"messages": [HumanMessage(content="question")]}, config
+        )
+    finally:
+        release.set()
+        graph.set_genai_client(None)
+    # Both first-loop searches timed out; the follow-up search failed fast
+    assert len(searches) == 2
+    assert limits.stats()[search_model]["state"] == "open"
+    assert state["degraded_models"] == [search_model]
+    assert state["messages"][-1].content == "answer"
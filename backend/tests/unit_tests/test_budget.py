@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from agent.budget import (
+    MIN_CALL_TIMEOUT,
+    answer_reserve,
+    budget_exhausted,
+    call_timeout,
+    can_afford_loop,
+    remaining_seconds,
+    start_budget,
+)
+from agent.configuration import Configuration
+
+
+def running(deadline_in, started_ago=0.0, loops=0):
+    """State of a run with ``deadline_in`` seconds left."""
+    now = time.time()
+    return {
+        "run_started_at": now - started_ago,
+        "run_deadline": now + deadline_in,
+        "research_loop_count": loops,
+    }
+
+
+def test_unbounded_run_keeps_the_call_timeout():
+    configurable = Configuration(llm_timeout_seconds=30)
+    state = start_budget(configurable)
+    assert state["run_deadline"] is None
+    assert remaining_seconds(state) is None
+    assert call_timeout(state, configurable, reserve=20) == 30
+    assert not budget_exhausted(state, reserve=20)
+    assert can_afford_loop(state, configurable)
+
+
+def test_start_budget_sets_the_deadline():
+    state = start_budget(Configuration(run_deadline_seconds=60))
+    assert state["run_deadline"] - state["run_started_at"] == pytest.approx(60)
+    assert remaining_seconds(state) == pytest.approx(60, abs=0.1)
+
+
+def test_call_timeout_shrinks_to_the_budget_left():
+    configurable = Configuration(llm_timeout_seconds=30)
+    assert call_timeout(running(100), configurable, reserve=20) == 30
+    assert call_timeout(running(25), configurable, reserve=20) == pytest.approx(
+        5, abs=0.1
+    )
+    # Never below the floor, even once the budget is spent
+    assert call_timeout(running(-5), configurable, reserve=20) == MIN_CALL_TIMEOUT
+
+
+@pytest.mark.parametrize(
+    "deadline, reserve",
+    [(None, 20), (200, 20), (40, 10), (8, 2)],
+)
+def test_answer_reserve_scales_with_the_deadline(deadline, reserve):
+    configurable = Configuration(run_deadline_seconds=deadline)
+    assert answer_reserve(configurable) == reserve
+
+
+def test_short_deadline_leaves_time_for_the_research():
+    configurable = Configuration(run_deadline_seconds=24)
+    state = running(24)
+    timeout = call_timeout(state, configurable, reserve=answer_reserve(configurable))
+    assert timeout == pytest.approx(18, abs=0.1)
+
+
+def test_budget_expires_at_the_reserve():
+    assert not budget_exhausted(running(30), reserve=20)
+    assert budget_exhausted(running(15), reserve=20)
+    assert budget_exhausted(running(-1))
+
+
+def test_loop_is_only_started_if_it_fits():
+    configurable = Configuration(run_deadline_seconds=120, answer_reserve_seconds=20)
+    # 30s per loop so far, 70s left of which 20s are reserved
+    assert can_afford_loop(running(70, started_ago=60, loops=2), configurable)
+    # 60s per loop so far
+    assert not can_afford_loop(running(70, started_ago=60, loops=1), configurable)
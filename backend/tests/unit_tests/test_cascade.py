@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent.cascade import (
+    CascadeStats,
+    escalation_reasons,
+    merge_cascade,
+    parse_rules,
+    samples_needed,
+)
+
+GAP = "The sources do not say when the policy took effect in each region."
+
+
+def reflection(is_sufficient, gap=GAP, queries=("follow-up",)):
+    return SimpleNamespace(
+        is_sufficient=is_sufficient,
+        knowledge_gap=gap,
+        follow_up_queries=list(queries),
+    )
+
+
+def test_parse_rules():
+    assert parse_rules(" inconsistent, short_gap ,") == ("inconsistent", "short_gap")
+    assert parse_rules("") == ()
+    with pytest.raises(ValueError, match="unknown_rule"):
+        parse_rules("inconsistent,unknown_rule")
+
+
+def test_disagreement_needs_a_second_sample():
+    assert samples_needed(("inconsistent", "short_gap")) == 1
+    assert samples_needed(("inconsistent", "disagreement")) == 2
+
+
+def test_consistent_verdicts_are_kept():
+    rules = ("inconsistent", "short_gap")
+    assert escalation_reasons([reflection(False)], rules) == []
+    assert escalation_reasons([reflection(True, gap="", queries=())], rules) == []
+
+
+def test_unreliable_verdicts_escalate():
+    rules = ("inconsistent", "short_gap")
+    assert escalation_reasons([reflection(False, queries=())], rules) == [
+        "inconsistent"
+    ]
+    assert escalation_reasons([reflection(True)], rules) == ["inconsistent"]
+    assert escalation_reasons([reflection(False, gap=" dates ")], rules) == [
+        "short_gap"
+    ]
+    assert (
+        escalation_reasons([reflection(False, gap="dates")], rules, min_gap_chars=5)
+        == []
+    )
+
+
+def test_verdict_and_disagreement_rules():
+    assert escalation_reasons([reflection(False)], ("insufficient",)) == [
+        "insufficient"
+    ]
+    assert escalation_reasons([reflection(False)], ("sufficient",)) == []
+    samples = [reflection(False), reflection(True, gap="", queries=())]
+    assert escalation_reasons(samples, ("disagreement",)) == ["disagreement"]
+    assert escalation_reasons(samples[:1] * 2, ("disagreement",)) == []
+
+
+def test_merge_cascade_sums_counters():
+    left = {"reflections": 2, "escalations": 1, "reasons": {"short_gap": 1}}
+    right = {
+        "reflections": 1,
+        "escalations": 1,
+        "reasons": {"short_gap": 1, "inconsistent": 1},
+    }
+    assert merge_cascade(left, right) == {
+        "reflections": 3,
+        "escalations": 2,
+        "reasons": {"short_gap": 2, "inconsistent": 1},
+    }
+    assert merge_cascade(None, None) == {
+        "reflections": 0,
+        "escalations": 0,
+        "reasons": {},
+    }
+
+
+def test_stats_report_the_escalation_rate():
+    stats = CascadeStats()
+    assert stats.stats()["escalation_rate"] == 0.0
+    stats.add({"reflections": 1, "escalations": 1, "reasons": {"inconsistent": 1}})
+    stats.add({"reflections": 1, "escalations": 0, "reasons": {}})
+    assert stats.stats() == {
+        "reflections": 2,
+        "escalations": 1,
+        "reasons": {"inconsistent": 1},
+        "escalation_rate": 0.5,
+    }
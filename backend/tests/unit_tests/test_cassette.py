@@ -0,0 +1,159 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+from pydantic import BaseModel
+
+from agent.cassette import (
+    Cassette,
+    CassetteChatModel,
+    CassetteGenaiClient,
+    CassetteMissError,
+)
+from agent.search_cache import as_response
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class LiveModel:
+    """Real chat runnable stand-in, counting the calls that reach it."""
+
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.calls = 0
+
+    def _message(self, prompt):
+        self.calls += 1
+        return AIMessage(
+            content=f"answer to {prompt}",
+            usage_metadata={"input_tokens": 3, "output_tokens": 4, "total_tokens": 7},
+        )
+
+    def invoke(self, prompt, config=None):
+        message = self._message(prompt)
+        if self.schema is None:
+            return message
+        return {
+            "raw": message,
+            "parsed": Answer(text=message.content),
+            "parsing_error": None,
+        }
+
+    async def ainvoke(self, prompt, config=None):
+        return self.invoke(prompt, config)
+
+    def stream(self, prompt, config=None):
+        self.calls += 1
+        yield from [AIMessageChunk(content="chunk one "), AIMessageChunk(content="two")]
+
+
+class LiveSearch:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, *, model, contents, config=None):
+        self.calls += 1
+        response = as_response(
+            {
+                "text": f"results for {contents}",
+                "chunks": [{"uri": "https://a", "title": "a"}],
+                "supports": [
+                    {"start_index": 0, "end_index": 7, "grounding_chunk_indices": [0]}
+                ],
+            }
+        )
+        response.usage_metadata = SimpleNamespace(
+            prompt_token_count=5, candidates_token_count=6
+        )
+        return response
+
+
+def chat_model(cassette, live, schema=None):
+    return CassetteChatModel(lambda: live, cassette, "gemini-test", 0.0, schema)
+
+
+def test_recorded_calls_replay_without_the_live_model(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    live = LiveModel()
+    recorded = chat_model(Cassette(path, mode="record"), live).invoke("q")
+    assert live.calls == 1
+
+    replay = Cassette(path, mode="replay", latency="0")
+    replayed = chat_model(replay, None).invoke("q")
+    assert replayed.content == recorded.content
+    assert replayed.usage_metadata["output_tokens"] == 4
+    assert replay.stats() == {"hits": 1, "recorded": 0, "mode": "replay"}
+
+
+def test_replay_mode_refuses_unrecorded_calls(tmp_path):
+    cassette = Cassette(str(tmp_path / "cassette.jsonl"), mode="replay")
+    with pytest.raises(CassetteMissError, match="gemini-test"):
+        chat_model(cassette, LiveModel()).invoke("never recorded")
+
+
+def test_auto_mode_records_misses_once(tmp_path):
+    cassette = Cassette(str(tmp_path / "cassette.jsonl"), mode="auto", latency="0")
+    live = LiveModel()
+    model = chat_model(cassette, live)
+    model.invoke("q")
+    model.invoke("q")
+    assert live.calls == 1
+    assert cassette.stats()["recorded"] == 1
+
+
+def test_dates_are_masked_out_of_the_key():
+    assert Cassette.key({"prompt": "Today is June 05, 2025."}) == Cassette.key(
+        {"prompt": "Today is October 18, 2026."}
+    )
+    assert Cassette.key({"prompt": "a"}) != Cassette.key({"prompt": "b"})
+
+
+def test_structured_output_round_trips(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    chat_model(Cassette(path, mode="record"), LiveModel(Answer), Answer).invoke("q")
+    replayed = chat_model(Cassette(path, mode="replay", latency="0"), None, Answer)
+    output = asyncio.run(replayed.ainvoke("q"))
+    assert output["parsed"] == Answer(text="answer to q")
+    assert output["parsing_error"] is None
+
+
+def test_streams_replay_their_chunks(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    recorded = list(chat_model(Cassette(path, mode="record"), LiveModel()).stream("q"))
+    replay = chat_model(Cassette(path, mode="replay", latency="0"), None)
+    assert [c.content for c in replay.stream("q")] == [c.content for c in recorded]
+
+
+def test_grounded_searches_replay_with_metadata_and_usage(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    live = LiveSearch()
+    recorder = CassetteGenaiClient(
+        SimpleNamespace(models=live), Cassette(path, mode="record")
+    )
+    recorder.models.generate_content(model="gemini-test", contents="q")
+    client = CassetteGenaiClient(None, Cassette(path, mode="replay", latency="0"))
+    response = asyncio.run(
+        client.aio.models.generate_content(model="gemini-test", contents="q")
+    )
+    assert response.text == "results for q"
+    metadata = response.candidates[0].grounding_metadata
+    assert metadata.grounding_chunks[0].web.uri == "https://a"
+    assert response.usage_metadata.candidates_token_count == 6
+    assert live.calls == 1
+
+
+def test_replay_latency(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    chat_model(Cassette(path, mode="record"), LiveModel()).invoke("q")
+    cassette = Cassette(path, mode="replay", latency="0.1", latency_scale=2)
+    started = time.perf_counter()
+    chat_model(cassette, None).invoke("q")
+    assert time.perf_counter() - started >= 0.2
+    assert 0.1 <= Cassette(path, latency="0.1-0.3").delay({}) <= 0.3
+    assert Cassette(path).delay({"elapsed": 0.5}) == 0.5
+    with pytest.raises(ValueError):
+        Cassette(path, mode="rewind")
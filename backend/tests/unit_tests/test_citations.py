@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from agent.citations import ShortUrlRewriter, insert_citation_markers
+from agent.graph import _stream_answer
+
+SHORT = "https://vertexaisearch.cloud.google.com/id/1-0"
+URL_MAP = {
+    SHORT: "https://example.com/a",
+    SHORT + "1": "https://example.com/b",
+    "https://vertexaisearch.cloud.google.com/id/2-0": "https://example.com/c",
+}
+TEXT = f"See [a]({SHORT}) and [b]({SHORT}1), not {SHORT[:-3]}."
+
+
+def legacy_insert_citation_markers(text, citations_list):
+    """The implementation replaced by the single pass, kept as the reference."""
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    modified_text = text
+    for citation_info in sorted_citations:
+        end_idx = citation_info["end_index"]
+        marker_to_insert = ""
+        for segment in citation_info["segments"]:
+            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
+        modified_text = (
+            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+        )
+    return modified_text
+
+
+def cite(start, end, *labels):
+    return {
+        "start_index": start,
+        "end_index": end,
+        "segments": [{"label": label, "short_url": f"u/{label}"} for label in labels],
+    }
+
+
+SENTENCE = "Alpha beta. Gamma delta."
+
+
+@pytest.mark.parametrize(
+    "citations",
+    [
+        [],
+        [cite(0, 11, "a")],
+        [cite(12, len(SENTENCE), "a")],
+        [cite(0, 0, "a")],
+        [cite(0, 11, "a", "b", "c")],
+        # Adjacent end indices
+        [cite(0, 11, "a"), cite(0, 12, "b"), cite(12, 13, "c")],
+        # Shared end index, different starts, in either input order
+        [cite(6, 11, "a"), cite(0, 11, "b")],
+        [cite(0, 11, "b"), cite(6, 11, "a")],
+        # Exact duplicates
+        [cite(0, 11, "a"), cite(0, 11, "b"), cite(0, 11, "a")],
+        # Unsorted input
+        [cite(12, 24, "c"), cite(0, 5, "a"), cite(6, 11, "b")],
+    ],
+)
+def test_markers_match_the_previous_implementation(citations):
+    assert insert_citation_markers(SENTENCE, citations) == (
+        legacy_insert_citation_markers(SENTENCE, citations)
+    )
+
+
+def test_out_of_range_markers_are_appended_in_order():
+    # The previous implementation spliced the second marker into the first
+    citations = [cite(0, 30, "b"), cite(12, 24, "a"), cite(0, 26, "c")]
+    assert insert_citation_markers(SENTENCE, citations) == (
+        f"{SENTENCE} [a](u/a) [c](u/c) [b](u/b)"
+    )
+
+
+def stream_through(rewriter, chunks):
+    return "".join(rewriter.feed(chunk) for chunk in chunks) + rewriter.flush()
+
+
+@pytest.mark.parametrize("split", range(1, len(TEXT)))
+def test_short_url_split_across_two_chunks(split):
+    rewriter = ShortUrlRewriter(URL_MAP)
+    assert stream_through(rewriter, [TEXT[:split], TEXT[split:]]) == (
+        ShortUrlRewriter(URL_MAP).rewrite(TEXT)
+    )
+    assert rewriter.used == {SHORT, SHORT + "1"}
+
+
+def test_one_character_chunks():
+    rewriter = ShortUrlRewriter(URL_MAP)
+    assert stream_through(rewriter, list(TEXT)) == (
+        "See [a](https://example.com/a) and [b](https://example.com/b), "
+        f"not {SHORT[:-3]}."
+    )
+
+
+def test_longest_short_url_wins_across_chunks():
+    rewriter = ShortUrlRewriter(URL_MAP)
+    assert rewriter.feed(f"({SHORT}") == "("
+    assert stream_through(rewriter, ["1)"]) == "https://example.com/b)"
+
+
+def test_flush_settles_what_is_held_back():
+    rewriter = ShortUrlRewriter(URL_MAP)
+    # The end of the stream could still be the start of a short url
+    settled = rewriter.feed("x" * 100 + SHORT[:10])
+    assert settled == "x" * (110 - len(SHORT))
+    assert settled + rewriter.flush() == "x" * 100 + SHORT[:10]
+    # A complete short url may still be the start of a longer one
+    assert rewriter.feed(f"cited {SHORT}") == "cited "
+    assert rewriter.flush() == "https://example.com/a"
+    assert rewriter.flush() == ""
+
+
+def test_without_sources_chunks_pass_straight_through():
+    rewriter = ShortUrlRewriter({})
+    assert rewriter.feed("abc") == "abc"
+    assert rewriter.flush() == ""
+
+
+class StreamingModel:
+    """Chat model streaming ``chunks``, pausing after the first until released."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.release = threading.Event()
+        self.closed = False
+
+    def stream(self, prompt, config=None):
+        try:
+            for index, text in enumerate(self.chunks):
+                if index == 1:
+                    self.release.wait(5)
+                yield AIMessageChunk(content=text)
+        finally:
+            self.closed = True
+
+
+def test_stream_emits_rewritten_chunks_and_the_flushed_tail():
+    model, written = StreamingModel(["See ", SHORT[:20], SHORT[20:], "."]), []
+    model.release.set()
+    answer, _ = _stream_answer(
+        model, "prompt", ShortUrlRewriter(URL_MAP), written.append, {}
+    )
+    assert answer == "See https://example.com/a."
+    assert "".join(w["answer_chunk"] for w in written) == answer
+    assert model.closed
+
+
+def test_cancelled_stream_stops_reading_and_emitting():
+    model, written = StreamingModel(["first ", "second ", "third"]), []
+    rewriter = ShortUrlRewriter({})
+    first = threading.Event()
+
+    def writer(item):
+        written.append(item)
+        first.set()
+
+    thread = threading.Thread(
+        target=_stream_answer, args=(model, "prompt", rewriter, writer, {})
+    )
+    thread.start()
+    assert first.wait(5)
+    # The caller timed out while the stream was still running
+    rewriter.cancel()
+    model.release.set()
+    thread.join(5)
+    assert written == [{"answer_chunk": "first "}]
+    assert model.closed
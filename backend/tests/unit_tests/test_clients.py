@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+from pydantic import BaseModel
+
+from agent.clients import ClientRegistry
+
+
+class Answer(BaseModel):
+    text: str
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registry that builds stand-ins instead of Gemini clients."""
+    built = []
+
+    def build(model, temperature, schema, api_key):
+        runnable = SimpleNamespace(
+            model=model, temperature=temperature, schema=schema, api_key=api_key
+        )
+        built.append(runnable)
+        return runnable
+
+    monkeypatch.setattr(ClientRegistry, "_build", staticmethod(build))
+    monkeypatch.setenv("GEMINI_API_KEY", "key-1")
+    registry = ClientRegistry(max_size=2)
+    registry.built = built
+    return registry
+
+
+def test_same_key_reuses_the_runnable(registry):
+    first = registry.get("gemini-test", 0)
+    # Temperatures are compared as floats
+    assert registry.get("gemini-test", 0.0) is first
+    assert len(registry.built) == 1
+
+
+def test_model_temperature_schema_and_key_are_part_of_the_key(registry, monkeypatch):
+    registry.max_size = 8
+    base = registry.get("gemini-test", 0)
+    assert registry.get("gemini-other", 0) is not base
+    assert registry.get("gemini-test", 1.0) is not base
+    assert registry.get("gemini-test", 0, Answer).schema is Answer
+    monkeypatch.setenv("GEMINI_API_KEY", "key-2")
+    rotated = registry.get("gemini-test", 0)
+    assert rotated is not base
+    assert rotated.api_key == "key-2"
+    assert len(registry.built) == 5
+
+
+def test_least_recently_used_runnable_is_evicted(registry):
+    a = registry.get("a", 0)
+    registry.get("b", 0)
+    # Touching "a" makes "b" the least recently used
+    assert registry.get("a", 0) is a
+    registry.get("c", 0)
+    assert registry.get("a", 0) is a
+    assert [r.model for r in registry.built] == ["a", "b", "c"]
+    registry.get("b", 0)
+    assert [r.model for r in registry.built] == ["a", "b", "c", "b"]
+
+
+def test_stats_count_hits_misses_and_evictions(registry):
+    assert registry.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "evictions": 0,
+        "size": 0,
+        "hit_rate": 0.0,
+    }
+    for model in ["a", "a", "b", "c", "a"]:
+        registry.get(model, 0)
+    assert registry.stats() == {
+        "hits": 1,
+        "misses": 4,
+        "evictions": 2,
+        "size": 2,
+        "hit_rate": 0.2,
+    }
+    registry.clear()
+    assert registry.stats()["size"] == 0
+    assert registry.stats()["misses"] == 0
+
+
+def test_clients_leave_retries_to_the_rate_limiter():
+    llm = ClientRegistry._build("gemini-test", 0, None, "key")
+    assert llm.max_retries == 0
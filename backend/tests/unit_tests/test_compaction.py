@@ -0,0 +1,71 @@
+import time
+
+from langchain_core.messages import HumanMessage
+
+from agent import graph
+from agent.compaction import (
+    estimate_tokens,
+    prompt_summaries,
+    results_to_fold,
+    tokens_saved,
+)
+
+
+def results(*tokens):
+    """One result per entry, ``tokens`` estimated tokens long."""
+    return ["x" * (4 * n) for n in tokens]
+
+
+def test_estimate_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_nothing_is_folded_without_a_budget_or_within_it():
+    assert results_to_fold(results(100, 100), "", 0, None) == 0
+    assert results_to_fold(results(100, 100), "", 0, 200) == 0
+    # The digest counts towards the budget
+    assert results_to_fold(results(100, 100), "x" * 4, 0, 200) == 1
+
+
+def test_oldest_results_are_folded_until_the_rest_fit_half_the_budget():
+    assert results_to_fold(results(100, 100, 100, 100), "", 0, 300) == 3
+    assert results_to_fold(results(100, 20, 30, 30), "", 0, 150) == 2
+
+
+def test_newest_result_is_always_kept_raw():
+    assert results_to_fold(results(10, 1000), "", 0, 100) == 1
+    assert results_to_fold(results(1000), "", 0, 100) == 0
+
+
+def test_results_already_in_the_digest_are_not_folded_again():
+    found = results(100, 100, 100, 100)
+    digest = "x" * 4 * 20
+    assert results_to_fold(found, digest, 2, 300) == 0
+    assert results_to_fold(found, digest, 2, 150) == 1
+
+
+def test_prompts_use_the_digest_then_the_newest_results():
+    found = results(1, 2, 3)
+    assert prompt_summaries(found, "", 0) == found
+    assert prompt_summaries(found, "digest", 2) == ["digest", found[2]]
+    assert tokens_saved(found, prompt_summaries(found, "d", 2)) == 1 + 2 - 1
+
+
+def test_out_of_budget_reflection_reports_the_tokens_saved(monkeypatch):
+    monkeypatch.setattr(graph, "get_chat_model", lambda *args, **kwargs: None)
+    found = results(100, 100, 100)
+    state = {
+        "messages": [HumanMessage(content="question")],
+        "search_query": ["a", "b", "c"],
+        "web_research_result": found,
+        "sources_gathered": [],
+        "research_digest": "x" * 40,
+        "compacted_count": 2,
+        "research_loop_count": 0,
+        "run_deadline": time.time() - 1,
+    }
+    update = graph.reflection(state, {"configurable": {}})
+    assert update["is_sufficient"]
+    assert update["tokens_saved"] == 200 - 10
@@ -0,0 +1,55 @@
+import pytest
+
+from agent.configuration import Configuration
+
+
+def test_defaults_without_a_config():
+    configuration = Configuration.from_runnable_config()
+    assert configuration.number_of_initial_queries == 3
+    assert configuration.reasoning_model is None
+    assert Configuration.from_runnable_config({}) == configuration
+
+
+def test_configurable_values_are_validated():
+    configuration = Configuration.from_runnable_config(
+        {"configurable": {"max_research_loops": "4", "run_deadline_seconds": 90}}
+    )
+    assert configuration.max_research_loops == 4
+    assert configuration.run_deadline_seconds == 90.0
+
+
+def test_none_values_fall_back_to_the_defaults():
+    configuration = Configuration.from_runnable_config(
+        {"configurable": {"answer_model": None}}
+    )
+    assert configuration.answer_model == Configuration().answer_model
+
+
+def test_environment_overrides_the_config(monkeypatch):
+    monkeypatch.setenv("MAX_RESEARCH_LOOPS", "5")
+    monkeypatch.setenv("MODEL_PRICING", '{"gemini": {"input": 1, "output": 2}}')
+    configuration = Configuration.from_runnable_config(
+        {"configurable": {"max_research_loops": 1}}
+    )
+    assert configuration.max_research_loops == 5
+    assert configuration.model_pricing == {"gemini": {"input": 1.0, "output": 2.0}}
+
+
+def test_changed_values_are_picked_up(monkeypatch):
+    config = {"configurable": {"max_research_loops": 1}}
+    assert Configuration.from_runnable_config(config).max_research_loops == 1
+    config["configurable"]["max_research_loops"] = 2
+    assert Configuration.from_runnable_config(config).max_research_loops == 2
+    monkeypatch.setenv("MAX_RESEARCH_LOOPS", "3")
+    assert Configuration.from_runnable_config(config).max_research_loops == 3
+
+
+def test_instances_are_independent():
+    first = Configuration.from_runnable_config()
+    first.max_research_loops = 7
+    assert Configuration.from_runnable_config().max_research_loops == 2
+
+
+def test_unknown_cascade_rules_are_rejected():
+    with pytest.raises(ValueError):
+        Configuration.from_runnable_config({"configurable": {"cascade_rules": "nope"}})
@@ -0,0 +1,58 @@
+import pytest
+
+from agent.dedup import dedupe_queries, jaccard, query_terms
+
+
+def test_terms_ignore_case_punctuation_stopwords_and_plurals():
+    assert query_terms("What are Apple's newest iPhones?") == query_terms(
+        "apple newest iphone"
+    )
+    # A query of stopwords only is still comparable
+    assert query_terms("who is it") == {"who", "is", "it"}
+
+
+@pytest.mark.parametrize(
+    "a, b, similarity",
+    [
+        ("Apple iPhone 15 release date", "apple iphone 15 release dates", 1.0),
+        ("tesla q3 earnings report", "Tesla Q3 earnings", 0.75),
+        ("tesla q3 earnings", "tesla q4 earnings", 0.5),
+        ("python asyncio tutorial", "rust borrow checker", 0.0),
+    ],
+)
+def test_similarity_of_query_pairs(a, b, similarity):
+    assert jaccard(query_terms(a), query_terms(b)) == similarity
+
+
+def test_queries_at_the_threshold_are_dropped():
+    kept, dropped = dedupe_queries(
+        ["Tesla Q3 earnings", "tesla q4 earnings"],
+        seen=["tesla q3 earnings report"],
+        threshold=0.75,
+    )
+    assert kept == ["tesla q4 earnings"]
+    assert dropped == [
+        {
+            "query": "Tesla Q3 earnings",
+            "duplicate_of": "tesla q3 earnings report",
+            "similarity": 0.75,
+        }
+    ]
+
+
+def test_queries_below_the_threshold_are_kept():
+    queries = ["tesla q3 earnings", "tesla q4 earnings"]
+    assert dedupe_queries(queries, seen=[], threshold=0.75) == (queries, [])
+    kept, dropped = dedupe_queries(queries, seen=[], threshold=0.5)
+    assert kept == ["tesla q3 earnings"]
+    assert dropped[0]["duplicate_of"] == "tesla q3 earnings"
+
+
+def test_earlier_queries_of_the_same_batch_count():
+    kept, dropped = dedupe_queries(
+        ["iPhone 15 release date", "iphone 15 release dates", "iphone 15 price"],
+        seen=[],
+        threshold=0.75,
+    )
+    assert kept == ["iPhone 15 release date", "iphone 15 price"]
+    assert [d["query"] for d in dropped] == ["iphone 15 release dates"]
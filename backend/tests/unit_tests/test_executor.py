@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from agent.executor import DeadlineExecutor, ExecutorSaturatedError
+
+
+@pytest.fixture
+def release():
+    """Event that unblocks hung calls, so no worker outlives the test."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def hang(release):
+    release.wait(5)
+    return "late"
+
+
+def in_background(executor, func, *args, timeout):
+    thread = threading.Thread(
+        target=lambda: executor.run(func, *args, timeout=timeout), daemon=True
+    )
+    thread.start()
+    # Let a worker pick the call up, or let it settle in the queue
+    time.sleep(0.05)
+    return thread
+
+
+def test_timeout_returns_control_within_the_bound(release):
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        executor.run(hang, release, timeout=0.2)
+    elapsed = time.perf_counter() - started
+    assert 0.2 <= elapsed < 0.4
+    assert executor.abandoned_count == 1
+
+
+def test_abandoned_call_is_forgotten_once_it_finishes(release):
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    with pytest.raises(TimeoutError):
+        executor.run(hang, release, timeout=0.05)
+    release.set()
+    deadline = time.perf_counter() + 1
+    while executor.abandoned_count and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert executor.abandoned_count == 0
+    assert executor.stats()["timeouts"] == 1
+
+
+def test_result_is_returned_before_the_deadline():
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    assert executor.run(lambda x, y=0: x + y, 1, y=2, timeout=1) == 3
+
+
+def test_exceptions_propagate():
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        executor.run(fail, timeout=1)
+
+
+def test_timeout_raised_by_the_call_is_not_an_abandoned_call():
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+
+    def upstream_timeout():
+        raise TimeoutError("upstream")
+
+    with pytest.raises(TimeoutError, match="upstream"):
+        executor.run(upstream_timeout, timeout=1)
+    assert executor.abandoned_count == 0
+    assert executor.stats()["timeouts"] == 0
+
+
+def test_max_abandoned_must_leave_a_worker_free():
+    with pytest.raises(ValueError):
+        DeadlineExecutor(max_workers=4, max_abandoned=4)
+    with pytest.raises(ValueError):
+        DeadlineExecutor(max_workers=4, max_abandoned=8)
+
+
+def test_hung_calls_never_block_live_ones(release):
+    executor = DeadlineExecutor(max_workers=4, max_abandoned=3)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            executor.run(hang, release, timeout=0.05)
+    started = time.perf_counter()
+    assert executor.run(lambda: 1, timeout=0.2) == 1
+    assert time.perf_counter() - started < 0.1
+
+
+def test_saturated_executor_fails_fast(release):
+    executor = DeadlineExecutor(max_workers=4, max_abandoned=3)
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            executor.run(hang, release, timeout=0.05)
+    started = time.perf_counter()
+    with pytest.raises(ExecutorSaturatedError):
+        executor.run(lambda: 1, timeout=0.2)
+    assert time.perf_counter() - started < 0.05
+    assert executor.stats()["rejected"] == 1
+
+
+def test_queued_calls_count_against_the_limit(release):
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    busy = [in_background(executor, hang, release, timeout=5) for _ in range(2)]
+    queued = in_background(executor, lambda: 1, timeout=5)
+    assert executor.stats()["queued"] == 1
+    with pytest.raises(ExecutorSaturatedError):
+        executor.run(lambda: 1, timeout=0.2)
+    release.set()
+    for thread in [*busy, queued]:
+        thread.join(1)
+
+
+def test_deadline_starts_when_a_worker_picks_the_call_up():
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    busy = [in_background(executor, time.sleep, 0.35, timeout=1) for _ in range(2)]
+    started = time.perf_counter()
+    # Waits about 0.25s for a worker, then runs 0.25s: over the timeout in
+    # total, but within it once dispatched
+    assert executor.run(lambda: time.sleep(0.25) or "done", timeout=0.4) == "done"
+    assert time.perf_counter() - started > 0.4
+    for thread in busy:
+        thread.join(1)
+
+
+def test_waiting_for_a_worker_is_bounded(release):
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    busy = [in_background(executor, hang, release, timeout=5) for _ in range(2)]
+    ran = threading.Event()
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError, match="free worker"):
+        executor.run(ran.set, timeout=0.2)
+    assert time.perf_counter() - started < 0.4
+    release.set()
+    for thread in busy:
+        thread.join(1)
+    assert not ran.is_set()
+    assert executor.stats()["queued"] == 0
+    assert executor.abandoned_count == 0
+
+
+def test_caller_waits_at_most_twice_the_timeout(release):
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    busy = [in_background(executor, time.sleep, 0.25, timeout=1) for _ in range(2)]
+    started = time.perf_counter()
+    # About 0.2s waiting for a worker, then the call hangs past its own 0.3s
+    with pytest.raises(TimeoutError, match="timed out"):
+        executor.run(hang, release, timeout=0.3)
+    assert 0.3 < time.perf_counter() - started < 0.6
+    for thread in busy:
+        thread.join(1)
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.executor import DeadlineExecutor
+from agent.hedging import Hedger, LatencyHistogram
+
+MODEL = "gemini-test"
+
+
+def warmed(max_rate=1.0, latency=0.05, samples=5, executor=None):
+    """Hedger that has seen ``samples`` calls of ``latency`` seconds."""
+    executor = executor or DeadlineExecutor(max_workers=4, max_abandoned=2)
+    hedger = Hedger(max_rate=max_rate, min_samples=samples, executor=executor)
+    for _ in range(samples):
+        hedger._model(MODEL).histogram.record(latency)
+    return hedger
+
+
+def slow_first(slow=1.0, fast=0.01):
+    """Attempt that is slow the first time it is made, fast afterwards."""
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        time.sleep(slow if len(calls) == 1 else fast)
+        return len(calls)
+
+    return attempt, calls
+
+
+def test_histogram_quantiles():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    for seconds in [0.1] * 90 + [2.0] * 10:
+        histogram.record(seconds)
+    assert histogram.count() == 100
+    assert histogram.quantile(0.5) == pytest.approx(0.1, rel=0.1)
+    assert histogram.quantile(0.95) == pytest.approx(2.0, rel=0.1)
+
+
+def test_old_latencies_age_out(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("agent.hedging.time.time", lambda: now[0])
+    histogram = LatencyHistogram(window=60, slots=6)
+    histogram.record(0.1)
+    now[0] += 30
+    histogram.record(0.2)
+    assert histogram.count() == 2
+    now[0] += 40
+    assert histogram.count() == 1
+
+
+def test_no_hedging_before_min_samples():
+    hedger = warmed(samples=5)
+    hedger.min_samples = 6
+    assert hedger.delay(MODEL, 0.95) is None
+    attempt, calls = slow_first(slow=0.1)
+    assert hedger.run(MODEL, attempt, timeout=5, quantile=0.95) == 1
+    assert len(calls) == 1
+
+
+def test_slow_call_is_hedged_and_the_hedge_wins():
+    hedger = warmed()
+    attempt, calls = slow_first()
+    assert hedger.run(MODEL, attempt, timeout=5, quantile=0.95) == 2
+    # The hedge only gets the time the primary has not used
+    assert calls[0] == 5 and calls[1] < 5
+    stats = hedger.stats()[MODEL]
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_fast_call_is_not_hedged():
+    hedger = warmed(latency=0.5)
+    attempt, calls = slow_first(slow=0.01)
+    hedger.run(MODEL, attempt, timeout=5, quantile=0.95)
+    assert len(calls) == 1
+    assert hedger.stats()[MODEL]["hedges"] == 0
+
+
+def test_hedges_spend_credit_earned_by_requests():
+    # Each request earns half a hedge
+    hedger = warmed(max_rate=0.5)
+    attempt, calls = slow_first(slow=0.2)
+    hedger.run(MODEL, attempt, timeout=5, quantile=0.95)
+    assert len(calls) == 1
+    attempt, calls = slow_first(slow=0.2)
+    hedger.run(MODEL, attempt, timeout=5, quantile=0.95)
+    assert len(calls) == 2
+    stats = hedger.stats()[MODEL]
+    assert (stats["requests"], stats["hedges"], stats["denied"]) == (2, 1, 1)
+    assert stats["hedge_rate"] == 0.5
+
+
+def test_credit_is_capped():
+    hedger = warmed(max_rate=1.0)
+    for _ in range(20):
+        hedger.delay(MODEL, 0.95)
+    assert hedger._model(MODEL).credits == 5.0
+
+
+def test_async_hedge_cancels_the_losing_attempt():
+    hedger = warmed()
+    cancelled = []
+
+    async def attempt(timeout):
+        try:
+            await asyncio.sleep(1.0 if timeout == 5 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(timeout)
+            raise
+        return timeout
+
+    assert asyncio.run(hedger.arun(MODEL, attempt, timeout=5, quantile=0.95)) < 5
+    assert cancelled == [5]
+    assert hedger.stats()[MODEL]["hedge_wins"] == 1
+
+
+def test_timed_records_calls_cut_short():
+    hedger = Hedger()
+    with pytest.raises(TimeoutError):
+        with hedger.timed(MODEL):
+            raise TimeoutError
+    with pytest.raises(ValueError):
+        with hedger.timed(MODEL):
+            raise ValueError
+    with hedger.timed(MODEL):
+        pass
+    assert hedger.stats()[MODEL]["samples"] == 2
+
+
+def test_losing_attempt_is_an_abandoned_call_of_the_executor():
+    executor = DeadlineExecutor(max_workers=4, max_abandoned=2)
+    hedger = warmed(executor=executor)
+    attempt, calls = slow_first(slow=0.3)
+    assert hedger.run(MODEL, attempt, timeout=5, quantile=0.95) == 2
+    assert executor.abandoned_count == 1
+    time.sleep(0.4)
+    assert executor.abandoned_count == 0
+
+
+def test_saturated_executor_is_not_hedged():
+    executor = DeadlineExecutor(max_workers=3, max_abandoned=1)
+    release = threading.Event()
+    hung = executor.submit(release.wait, 5)
+    executor.abandon(hung)
+    hedger = warmed(executor=executor)
+    try:
+        attempt, calls = slow_first(slow=0.2)
+        assert hedger.run(MODEL, attempt, timeout=5, quantile=0.95) == 1
+        assert len(calls) == 1
+        stats = hedger.stats()[MODEL]
+        assert stats["hedges"] == 0
+        assert hedger._model(MODEL).credits == 1.0
+    finally:
+        release.set()
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.executor import DeadlineExecutor
+from agent.pipeline import StragglerPolicy, Stragglers
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def loop_state(trace_id="run", fanout=3, query="q"):
+    return {
+        "trace_id": trace_id,
+        "loop_started_at": time.time(),
+        "fanout": fanout,
+        "search_query": query,
+    }
+
+
+QUORUM = StragglerPolicy(quorum=0.6, grace=0.1)
+
+
+def pool(max_abandoned=2):
+    return DeadlineExecutor(max_workers=max_abandoned + 2, max_abandoned=max_abandoned)
+
+
+def test_cached_branch_counts_towards_the_quorum(release):
+    stragglers = Stragglers(pool())
+    state = loop_state()
+    # Branch one is a cache hit, branch two a fast search
+    stragglers.skip(state, QUORUM)
+    assert stragglers.run(state, lambda: "fast", QUORUM) == "fast"
+    # Branch three only waits out the grace period
+    started = time.time()
+    result = stragglers.run(state, lambda: release.wait(5) and "slow", QUORUM, "ctx")
+    assert result is None
+    assert time.time() - started < 0.5
+    release.set()
+    time.sleep(0.05)
+    assert stragglers.collect("run") == [("ctx", "slow")]
+    assert stragglers.stats()["loops"] == 0
+
+
+def test_cached_branches_alone_can_reach_the_quorum(release):
+    stragglers = Stragglers(pool())
+    state = loop_state()
+    stragglers.skip(state, QUORUM)
+    stragglers.skip(state, QUORUM)
+    started = time.time()
+    assert stragglers.run(state, lambda: release.wait(5), QUORUM) is None
+    assert time.time() - started < 0.5
+
+
+def test_async_cached_and_slow_branches():
+    stragglers = Stragglers(pool())
+    state = loop_state()
+
+    async def fast():
+        return "fast"
+
+    async def slow():
+        await asyncio.sleep(0.3)
+        return "slow"
+
+    async def loop():
+        async def cached():
+            stragglers.skip(state, QUORUM)
+            return "cached"
+
+        return await asyncio.gather(
+            cached(),
+            stragglers.arun(state, fast, QUORUM),
+            stragglers.arun(state, slow, QUORUM, "ctx"),
+        )
+
+    started = time.time()
+    assert asyncio.run(loop()) == ["cached", "fast", None]
+    assert time.time() - started < 0.3
+    assert stragglers.stats()["parked"] == 1
+
+
+def test_final_collect_drops_the_run(release):
+    stragglers = Stragglers(pool())
+    state = loop_state()
+    stragglers.skip(state, QUORUM)
+    stragglers.skip(state, QUORUM)
+    assert stragglers.run(state, lambda: release.wait(5), QUORUM, "ctx") is None
+    assert stragglers.collect("run", final=True) == []
+    stats = stragglers.stats()
+    assert stats["parked"] == 0
+    assert stats["loops"] == 0
+
+
+def test_failed_run_is_forgotten(release):
+    stragglers = Stragglers(pool())
+    state = loop_state(fanout=3)
+    stragglers.skip(state, QUORUM)
+    stragglers.skip(state, QUORUM)
+    assert stragglers.run(state, lambda: release.wait(5), QUORUM, "ctx") is None
+    other = loop_state(trace_id="other", fanout=2)
+    stragglers.skip(other, QUORUM)
+    stragglers.forget("run")
+    stats = stragglers.stats()
+    assert stats["parked"] == 0
+    assert stats["loops"] == 1
+
+
+def test_idle_runs_are_swept():
+    stragglers = Stragglers(max_idle=0.1)
+    stragglers.skip(loop_state(trace_id="vanished", fanout=2), QUORUM)
+    time.sleep(0.15)
+    stragglers.skip(loop_state(trace_id="next", fanout=2), QUORUM)
+    assert stragglers.stats()["loops"] == 1
+
+
+def test_straggler_timeout_without_quorum(release):
+    stragglers = Stragglers(pool())
+    state = loop_state(fanout=2)
+    policy = StragglerPolicy(timeout=0.1)
+    started = time.time()
+    assert stragglers.run(state, lambda: release.wait(5), policy) is None
+    assert 0.1 <= time.time() - started < 0.4
+
+
+def test_parked_searches_count_as_abandoned_calls(release):
+    executor = pool()
+    stragglers = Stragglers(executor)
+    state = loop_state(fanout=2)
+    policy = StragglerPolicy(timeout=0.05)
+    assert stragglers.run(state, lambda: release.wait(5) and "late", policy) is None
+    assert executor.abandoned_count == 1
+    release.set()
+    deadline = time.time() + 1
+    while executor.abandoned_count and time.time() < deadline:
+        time.sleep(0.01)
+    assert executor.abandoned_count == 0
+    assert stragglers.collect("run") == [(None, "late")]
+
+
+def test_saturated_executor_runs_the_search_on_the_branch(release):
+    executor = pool(max_abandoned=1)
+    stragglers = Stragglers(executor)
+    policy = StragglerPolicy(timeout=0.05)
+    assert stragglers.run(loop_state(fanout=2), lambda: release.wait(5), policy) is None
+    # The hung search fills the backlog; the next one is not cut short
+    state = loop_state(trace_id="next", fanout=1)
+    assert stragglers.run(state, lambda: time.sleep(0.1) or "done", policy) == "done"
+    assert executor.stats()["rejected"] == 1
+    # The branch of the second run counted as finished
+    assert stragglers.stats()["loops"] == 1
@@ -0,0 +1,169 @@
+import asyncio
+import functools
+import threading
+import time
+
+import pytest
+
+from agent.executor import AbandonedCallError, DeadlineExecutor
+from agent.ratelimit import QueueTimeoutError, RateLimiter, is_overload_error
+
+MODEL = "gemini-test"
+
+
+class Throttled(Exception):
+    code = 429
+
+
+def limiter(**settings):
+    settings = {
+        "initial_concurrency": 4,
+        "requeue_backoff": 0.01,
+        "max_requeue_backoff": 0.05,
+        **settings,
+    }
+    return RateLimiter({"*": settings})
+
+
+def flaky(failures):
+    """Call that is throttled ``failures`` times, then succeeds."""
+    calls = []
+
+    def call(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise Throttled("429 Too Many Requests")
+        return "ok"
+
+    return call, calls
+
+
+def test_overload_errors_are_recognised():
+    assert is_overload_error(Throttled())
+    assert is_overload_error(RuntimeError("503 UNAVAILABLE"))
+    assert not is_overload_error(ValueError("bad request"))
+
+
+def test_throttled_call_is_requeued_until_it_succeeds():
+    limits = limiter()
+    call, calls = flaky(2)
+    assert limits.call(MODEL, call, timeout=10) == "ok"
+    assert len(calls) == 3
+    stats = limits.stats()[MODEL]
+    assert stats["requeued"] == 2
+    assert stats["throttled"] == 1  # Two 429s within the cooldown halve once
+    assert stats["limit"] < 4
+    assert stats["in_flight"] == 0
+
+
+def test_requeue_stops_when_the_deadline_leaves_no_room():
+    limits = limiter(requeue_backoff=1.0, max_requeue_backoff=1.0)
+    call, calls = flaky(1)
+    with pytest.raises(Throttled):
+        limits.call(MODEL, call, timeout=1.2)
+    assert len(calls) == 1
+
+
+def test_requeue_stops_after_max_requeues():
+    limits = limiter(max_requeues=2)
+    call, calls = flaky(5)
+    with pytest.raises(Throttled):
+        limits.call(MODEL, call, timeout=10)
+    assert len(calls) == 3
+
+
+def test_call_with_side_effects_is_not_requeued():
+    limits = limiter()
+    call, calls = flaky(1)
+    with pytest.raises(Throttled):
+        limits.call(MODEL, call, timeout=10, retryable=lambda: False)
+    assert len(calls) == 1
+
+
+def test_other_errors_are_not_requeued():
+    limits = limiter()
+    calls = []
+
+    def call(timeout):
+        calls.append(timeout)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limits.call(MODEL, call, timeout=10)
+    assert len(calls) == 1
+
+
+def test_async_throttled_call_is_requeued():
+    limits = limiter()
+    calls = []
+
+    async def call(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            raise Throttled("429")
+        return "ok"
+
+    assert asyncio.run(limits.acall(MODEL, call, timeout=10)) == "ok"
+    assert len(calls) == 2
+
+
+def hold_slot(limits, seconds):
+    thread = threading.Thread(
+        target=lambda: limits.call(
+            MODEL, lambda timeout: time.sleep(seconds), timeout=10
+        ),
+        daemon=True,
+    )
+    thread.start()
+    time.sleep(0.02)
+    return thread
+
+
+def test_call_left_with_too_little_time_is_not_made():
+    limits = limiter(initial_concurrency=1)
+    holder = hold_slot(limits, 0.5)
+    calls = []
+    with pytest.raises(QueueTimeoutError, match="left after queueing"):
+        limits.call(MODEL, lambda timeout: calls.append(timeout), timeout=0.6)
+    assert calls == []
+    holder.join()
+    assert limits.stats()[MODEL]["in_flight"] == 0
+
+
+def test_call_gets_the_time_left_after_queueing():
+    limits = limiter(initial_concurrency=1)
+    holder = hold_slot(limits, 0.2)
+    calls = []
+    limits.call(MODEL, lambda timeout: calls.append(timeout), timeout=2)
+    holder.join()
+    assert 1.7 < calls[0] < 1.85
+
+
+def test_slot_is_held_until_an_abandoned_call_finishes():
+    limits = limiter(initial_concurrency=1)
+    executor = DeadlineExecutor(max_workers=2, max_abandoned=1)
+    release = threading.Event()
+    try:
+        with pytest.raises(AbandonedCallError):
+            limits.call(
+                MODEL,
+                functools.partial(executor.run, release.wait, 5),
+                timeout=0.1,
+            )
+        # The upstream call still runs, so its slot is still taken
+        assert limits.stats()[MODEL]["in_flight"] == 1
+        with pytest.raises(QueueTimeoutError):
+            limits.call(MODEL, lambda timeout: "next", timeout=0.1)
+    finally:
+        release.set()
+    time.sleep(0.05)
+    assert limits.stats()[MODEL]["in_flight"] == 0
+    assert limits.call(MODEL, lambda timeout: "next", timeout=0.1) == "next"
+
+
+def test_disabled_limiter_calls_straight_through():
+    limits = RateLimiter(enabled=False)
+    call, calls = flaky(1)
+    with pytest.raises(Throttled):
+        limits.call(MODEL, call, timeout=10)
+    assert calls == [10]
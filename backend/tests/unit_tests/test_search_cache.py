@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from agent.search_cache import MemoryLRU, SQLiteStore, TieredCache
+
+
+class SlowDisk(SQLiteStore):
+    """SQLite tier on a slow disk."""
+
+    def get(self, key):
+        time.sleep(0.2)
+        return super().get(key)
+
+    def put(self, key, value, expires_at):
+        time.sleep(0.2)
+        super().put(key, value, expires_at)
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    TieredCache(60, MemoryLRU(), SQLiteStore(path)).put("k", {"text": "v"})
+    cache = TieredCache(60, MemoryLRU(), SQLiteStore(path))
+    assert cache.get("k") == {"text": "v"}
+    assert cache.memory.get("k") == {"text": "v"}
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_async_access_keeps_the_event_loop_free(tmp_path):
+    cache = TieredCache(60, MemoryLRU(), SlowDisk(str(tmp_path / "cache.sqlite")))
+    ticks = []
+
+    async def ticker():
+        for _ in range(10):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def main():
+        ticking = asyncio.create_task(ticker())
+        await cache.aput("k", {"text": "v"})
+        cache.memory.clear()
+        value = await cache.aget("k")
+        await ticking
+        return value
+
+    assert asyncio.run(main()) == {"text": "v"}
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+    assert cache.stats()["hits"] == 1
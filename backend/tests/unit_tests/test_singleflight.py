@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent.singleflight import Coalescer, RedisFlight, SingleFlight
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class SlowModel:
+    """Fake grounded search: slow, counting its calls, JSON-serializable results."""
+
+    def __init__(self, latency=0.2, error=None):
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _result(self, query):
+        with self._lock:
+            self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {"text": f"results for {query}"}
+
+    def search(self, query):
+        time.sleep(self.latency)
+        return self._result(query)
+
+    async def asearch(self, query):
+        await asyncio.sleep(self.latency)
+        return self._result(query)
+
+
+def replica(server, **settings):
+    """Coalescer of one API replica talking to the shared fake Redis ``server``."""
+    return Coalescer(
+        SingleFlight(),
+        RedisFlight(
+            client=fakeredis.FakeRedis(server=server),
+            aclient_factory=lambda: fakeredis.FakeAsyncRedis(server=server),
+            poll_interval=0.01,
+            **settings,
+        ),
+    )
+
+
+def run_threads(callers):
+    with ThreadPoolExecutor(max_workers=len(callers)) as pool:
+        futures = [pool.submit(caller) for caller in callers]
+        return [future.result() for future in futures]
+
+
+def test_concurrent_threads_share_one_call():
+    flight, model = SingleFlight(), SlowModel()
+    results = run_threads(
+        [lambda: flight.do("q", lambda: model.search("q"), timeout=5)] * 8
+    )
+    assert model.calls == 1
+    assert results == [{"text": "results for q"}] * 8
+    assert flight.stats() == {"leaders": 1, "shared": 7}
+
+
+def test_different_keys_are_not_coalesced():
+    flight, model = SingleFlight(), SlowModel(latency=0.05)
+    run_threads([lambda k=k: flight.do(k, lambda: model.search(k)) for k in "abc"])
+    assert model.calls == 3
+
+
+def test_concurrent_coroutines_share_one_call():
+    flight, model = SingleFlight(), SlowModel()
+
+    async def main():
+        return await asyncio.gather(
+            *[flight.ado("q", lambda: model.asearch("q"), timeout=5) for _ in range(8)]
+        )
+
+    assert asyncio.run(main()) == [{"text": "results for q"}] * 8
+    assert model.calls == 1
+
+
+def test_leader_error_reaches_every_follower():
+    flight, model = SingleFlight(), SlowModel(error=RuntimeError("upstream down"))
+
+    def caller():
+        with pytest.raises(RuntimeError, match="upstream down"):
+            flight.do("q", lambda: model.search("q"), timeout=5)
+
+    run_threads([caller] * 4)
+    assert model.calls == 1
+
+
+def test_follower_gives_up_after_its_timeout():
+    flight, model = SingleFlight(), SlowModel(latency=0.5)
+    leader = threading.Thread(target=lambda: flight.do("q", lambda: model.search("q")))
+    leader.start()
+    time.sleep(0.05)
+    with pytest.raises(TimeoutError):
+        flight.do("q", lambda: model.search("q"), timeout=0.1)
+    leader.join()
+
+
+def test_replicas_share_one_call_through_redis():
+    server, model = fakeredis.FakeServer(), SlowModel()
+    replicas = [replica(server) for _ in range(3)]
+    results = run_threads(
+        [
+            lambda r=r: r.do("q", lambda: model.search("q"), timeout=5)
+            for r in replicas
+            for _ in range(3)
+        ]
+    )
+    assert model.calls == 1
+    assert results == [{"text": "results for q"}] * 9
+
+
+def test_async_replicas_share_one_call_through_redis():
+    server, model = fakeredis.FakeServer(), SlowModel()
+    replicas = [replica(server) for _ in range(3)]
+
+    async def main():
+        return await asyncio.gather(
+            *[r.ado("q", lambda: model.asearch("q"), timeout=5) for r in replicas]
+        )
+
+    assert asyncio.run(main()) == [{"text": "results for q"}] * 3
+    assert model.calls == 1
+
+
+def test_async_client_is_created_per_event_loop():
+    server, created = fakeredis.FakeServer(), []
+
+    def factory():
+        client = fakeredis.FakeAsyncRedis(server=server)
+        created.append(client)
+        return client
+
+    flight = Coalescer(SingleFlight(), RedisFlight(aclient_factory=factory))
+    model = SlowModel(latency=0)
+
+    async def search(key):
+        first = await flight.ado(key, lambda: model.asearch(key))
+        second = await flight.ado(key + "2", lambda: model.asearch(key))
+        return first, second
+
+    # Like the batch CLI and the benchmarks, each asyncio.run is a new loop
+    asyncio.run(search("a"))
+    asyncio.run(search("b"))
+    assert len(created) == 2
+
+
+def test_follower_runs_the_call_when_the_leader_vanishes():
+    server, model = fakeredis.FakeServer(), SlowModel(latency=0)
+    # A leader on another replica took the lock and crashed
+    fakeredis.FakeRedis(server=server).set(
+        "agent:singleflight:lock:q", "crashed", px=200
+    )
+    started = time.monotonic()
+    result = replica(server).do("q", lambda: model.search("q"), timeout=5)
+    assert result == {"text": "results for q"}
+    assert model.calls == 1
+    assert time.monotonic() - started >= 0.15
+
+
+def test_unavailable_redis_falls_back_to_a_direct_call():
+    class DownRedis:
+        def get(self, key):
+            raise ConnectionError("redis is down")
+
+    model = SlowModel(latency=0)
+    flight = Coalescer(SingleFlight(), RedisFlight(client=DownRedis()))
+    assert flight.do("q", lambda: model.search("q"), timeout=5) == {
+        "text": "results for q"
+    }
+    assert model.calls == 1
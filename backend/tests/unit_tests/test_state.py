@@ -0,0 +1,64 @@
+from agent.state import merge_sources
+
+
+def source(url, short_url, label="site", **extra):
+    return {"label": label, "short_url": short_url, "value": url, **extra}
+
+
+def test_empty_inputs():
+    assert merge_sources(None, None) == []
+    assert merge_sources([], []) == []
+    assert merge_sources(None, [source("https://a", "s/1")]) == [
+        {"label": "site", "short_url": "s/1", "value": "https://a", "count": 1}
+    ]
+
+
+def test_duplicate_urls_across_branches_are_merged():
+    branch_1 = [source("https://a", "s/1-0"), source("https://b", "s/1-1")]
+    branch_2 = [source("https://a", "s/2-0"), source("https://a", "s/2-1")]
+    merged = merge_sources(branch_1, branch_2)
+    assert [entry["value"] for entry in merged] == ["https://a", "https://b"]
+    entry = merged[0]
+    # The first short url stays canonical, the others become aliases
+    assert entry["short_url"] == "s/1-0"
+    assert entry["aliases"] == ["s/2-0", "s/2-1"]
+    assert entry["count"] == 3
+    assert "aliases" not in merged[1]
+
+
+def test_order_of_first_appearance_is_kept():
+    left = [source("https://c", "s/c"), source("https://a", "s/a")]
+    right = [source("https://b", "s/b"), source("https://c", "s/c2")]
+    assert [e["value"] for e in merge_sources(left, right)] == [
+        "https://c",
+        "https://a",
+        "https://b",
+    ]
+
+
+def test_registry_entries_merge_counts_aliases_and_citations():
+    registry = merge_sources(
+        [], [source("https://a", "s/1"), source("https://a", "s/2")]
+    )
+    cited = [{**registry[0], "count": 0, "cited": True}]
+    merged = merge_sources(registry, cited)
+    assert merged == [
+        {
+            "label": "site",
+            "short_url": "s/1",
+            "value": "https://a",
+            "count": 2,
+            "aliases": ["s/2"],
+            "cited": True,
+        }
+    ]
+    # Merging again is stable
+    assert merge_sources(merged, []) == merged
+
+
+def test_inputs_are_not_mutated():
+    left = [source("https://a", "s/1")]
+    right = [source("https://a", "s/2", cited=True)]
+    merge_sources(left, right)
+    assert left == [source("https://a", "s/1")]
+    assert right == [source("https://a", "s/2", cited=True)]
@@ -0,0 +1,100 @@
+import gzip
+
+from agent.static_files import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    StaticManifest,
+)
+
+SCRIPT = b"console.log('hello');\n" * 100
+
+
+def build(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<html></html>", encoding="utf-8")
+    (tmp_path / "assets" / "index-4f9a1c2b.js").write_bytes(SCRIPT)
+    (tmp_path / "assets" / "logo.png").write_bytes(b"\x89PNG" * 400)
+    (tmp_path / "app.css").write_bytes(b"body{}" * 300)
+    # Precompressed by the build, served as-is
+    (tmp_path / "app.css.gz").write_bytes(b"prebuilt gzip")
+    return StaticManifest(str(tmp_path))
+
+
+def test_lookup_by_url_path(tmp_path):
+    manifest = build(tmp_path)
+    assert manifest.lookup("/index.html").media_type == "text/html; charset=utf-8"
+    assert manifest.lookup("assets/index-4f9a1c2b.js").content == SCRIPT
+    assert manifest.lookup("/missing.js") is None
+    # The precompressed sibling is a variant, not a file of its own
+    assert manifest.lookup("/app.css.gz") is None
+    assert manifest.lookup("/app.css").variants["gzip"] == b"prebuilt gzip"
+
+
+def test_only_hashed_assets_are_immutable(tmp_path):
+    manifest = build(tmp_path)
+    assert manifest.lookup("/assets/index-4f9a1c2b.js").cache_control == (
+        IMMUTABLE_CACHE_CONTROL
+    )
+    assert manifest.lookup("/index.html").cache_control == REVALIDATE_CACHE_CONTROL
+    assert manifest.lookup("/assets/logo.png").cache_control == REVALIDATE_CACHE_CONTROL
+
+
+def test_names_that_only_look_hashed_are_revalidated(tmp_path):
+    (tmp_path / "assets").mkdir()
+    for name in ["app-main.js", "vendor-lodash-es.js", "index-4f9a1c2.js"]:
+        (tmp_path / "assets" / name).write_bytes(SCRIPT)
+    manifest = StaticManifest(str(tmp_path))
+    for name in ["app-main.js", "vendor-lodash-es.js", "index-4f9a1c2.js"]:
+        entry = manifest.lookup(f"/assets/{name}")
+        assert entry.cache_control == REVALIDATE_CACHE_CONTROL, name
+
+
+def test_compressible_files_are_compressed_up_front(tmp_path):
+    manifest = build(tmp_path)
+    script = manifest.lookup("/assets/index-4f9a1c2b.js")
+    assert gzip.decompress(script.variants["gzip"]) == SCRIPT
+    # Too small, and not compressible
+    assert manifest.lookup("/index.html").variants == {}
+    assert manifest.lookup("/assets/logo.png").variants == {}
+
+
+def test_select_negotiates_accept_encoding(tmp_path):
+    entry = build(tmp_path).lookup("/assets/index-4f9a1c2b.js")
+    entry.variants["br"] = b"brotli"
+    assert entry.select("gzip, deflate, br")[:2] == (b"brotli", "br")
+    assert entry.select("gzip, br;q=0")[1] == "gzip"
+    assert entry.select("*")[1] == "br"
+    assert entry.select("identity") == (SCRIPT, None, entry.etag)
+    body, coding, etag = entry.select("gzip")
+    assert etag == entry.etag[:-1] + '-gzip"'
+    assert etag != entry.etag
+
+
+def test_headers_name_the_coding_and_vary(tmp_path):
+    manifest = build(tmp_path)
+    script = manifest.lookup("/assets/index-4f9a1c2b.js")
+    _, coding, etag = script.select("gzip")
+    headers = script.headers(etag, coding)
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert headers["ETag"] == etag
+    page = manifest.lookup("/index.html")
+    assert "Vary" not in page.headers(page.etag, None)
+
+
+def test_conditional_requests(tmp_path):
+    entry = build(tmp_path).lookup("/index.html")
+    assert entry.not_modified({"if-none-match": entry.etag}, entry.etag)
+    assert entry.not_modified({"if-none-match": f'"x", W/{entry.etag}'}, entry.etag)
+    assert entry.not_modified({"if-none-match": "*"}, entry.etag)
+    assert not entry.not_modified({"if-none-match": '"x"'}, entry.etag)
+    assert entry.not_modified({"if-modified-since": entry.last_modified}, entry.etag)
+    assert not entry.not_modified(
+        {"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}, entry.etag
+    )
+    assert not entry.not_modified({"if-modified-since": "garbage"}, entry.etag)
+    # If-None-Match wins over If-Modified-Since
+    assert not entry.not_modified(
+        {"if-none-match": '"x"', "if-modified-since": entry.last_modified}, entry.etag
+    )
+    assert not entry.not_modified({}, entry.etag)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+from agent import graph
+from agent.tracing import (
+    JsonLinesExporter,
+    OtlpHttpExporter,
+    RetryCounter,
+    Tracer,
+    annotate,
+    set_tracer,
+    traced_node,
+)
+from agent.utils import run_with_timeout
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def exported():
+    exporter = ListExporter()
+    previous = set_tracer(Tracer([exporter]))
+    yield exporter.spans
+    set_tracer(previous)
+
+
+def test_spans_nest_and_record_errors():
+    exporter = ListExporter()
+    tracer = Tracer([exporter])
+    with pytest.raises(ValueError):
+        with tracer.span("node.reflection", trace_id="t1", loop=1) as node:
+            with tracer.span("model.reflection", model="gemini") as call:
+                annotate(retries=2, ignored=None)
+            raise ValueError("bad output")
+    assert [span.name for span in exporter.spans] == [
+        "model.reflection",
+        "node.reflection",
+    ]
+    assert call.parent_id == node.span_id
+    assert call.trace_id == node.trace_id == "t1"
+    assert call.attributes["retries"] == 2
+    assert "ignored" not in call.attributes
+    assert node.status == "error"
+    assert node.attributes["error"] == "ValueError: bad output"
+    assert node.attributes["duration_ms"] >= call.attributes["duration_ms"]
+
+
+def test_disabled_tracer_yields_no_span():
+    with Tracer().span("node.x") as span:
+        annotate(ignored=True)
+    assert span is None
+
+
+def test_traced_node_starts_and_propagates_the_trace(exported):
+    def generate_query(state, config):
+        return {"query": "q"}
+
+    async def web_research(state, config):
+        return {"result": "r"}
+
+    first = traced_node("generate_query", generate_query, new_trace=True)
+    update = first({"trace_id": "previous run"}, {})
+    trace_id = update["trace_id"]
+    assert trace_id != "previous run"
+    branch = traced_node("web_research", web_research)
+    assert asyncio.run(branch({"trace_id": trace_id, "id": 2}, {})) == {"result": "r"}
+    assert [span.trace_id for span in exported] == [trace_id, trace_id]
+    assert exported[1].attributes["branch_id"] == 2
+
+
+def test_json_lines_export(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer([JsonLinesExporter(str(path))])
+    with tracer.span("node.a", trace_id="t1"):
+        with tracer.span("model.a"):
+            pass
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["name"] for r in records] == ["model.a", "node.a"]
+    assert records[0]["parent_id"] == records[1]["span_id"]
+    assert records[1]["end_time"] >= records[1]["start_time"]
+
+
+def test_otlp_export_posts_batches_to_the_collector():
+    received = []
+
+    class Collector(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append(json.loads(body))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Collector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    exporter = OtlpHttpExporter(
+        f"http://127.0.0.1:{server.server_port}/v1/traces",
+        service_name="test-agent",
+        interval=60,
+    )
+    try:
+        tracer = Tracer([exporter])
+        with tracer.span("node.a", trace_id="ab" * 16, count=3):
+            pass
+        exporter.shutdown()
+    finally:
+        server.shutdown()
+    resource = received[0]["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0]["value"] == {
+        "stringValue": "test-agent"
+    }
+    (span,) = resource["scopeSpans"][0]["spans"]
+    assert span["name"] == "node.a"
+    assert span["traceId"] == "ab" * 16
+    assert {"key": "count", "value": {"intValue": "3"}} in span["attributes"]
+    assert span["status"] == {"code": 1}
+
+
+class ModelStarts(BaseCallbackHandler):
+    def __init__(self):
+        self.starts = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.starts += 1
+
+
+def test_model_calls_keep_the_run_callbacks():
+    parent = ModelStarts()
+    llm = FakeListChatModel(responses=["answer"])
+    span = Tracer([ListExporter()]).span("llm.reflection")
+
+    def node(prompt):
+        with span as current:
+            config = graph._call_config(current, tags=["nostream"])
+            # Runs on an executor thread, out of reach of the node's context
+            result = run_with_timeout(llm.invoke, prompt, config=config, timeout=5)
+        return config, result
+
+    config, result = RunnableLambda(node).invoke(
+        "question", config={"callbacks": [parent], "tags": ["run"]}
+    )
+    assert result.content == "answer"
+    assert parent.starts == 1
+    handlers = config["callbacks"].handlers
+    assert parent in handlers
+    assert any(isinstance(h, RetryCounter) for h in handlers)
+    assert {"run", "nostream"} <= set(config["tags"])
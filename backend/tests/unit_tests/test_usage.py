@@ -0,0 +1,43 @@
+import pytest
+
+from agent.usage import call_cost, merge_usage, price_for, record_usage
+
+
+def test_dated_model_names_share_the_rate_of_their_family():
+    assert price_for("gemini-2.5-flash-preview-05-20") == price_for("gemini-2.5-flash")
+    # The longest prefix wins over the shorter family name
+    assert price_for("gemini-2.5-flash-lite-001")["input"] == 0.10
+    assert price_for("gpt-4o") is None
+
+
+def test_call_cost_is_priced_per_million_tokens():
+    assert call_cost("gemini-2.5-pro", 1_000_000, 100_000) == pytest.approx(2.25)
+    assert call_cost("gemini-2.5-flash", 2_000, 1_000) == pytest.approx(0.0031)
+    assert call_cost("unknown-model", 1_000, 1_000) == 0.0
+
+
+def test_custom_pricing_replaces_the_defaults():
+    pricing = {"my-model": {"input": 1.0, "output": 2.0}}
+    assert call_cost("my-model-v2", 1_000_000, 1_000_000, pricing) == 3.0
+    assert call_cost("gemini-2.5-pro", 1_000_000, 0, pricing) == 0.0
+
+
+def test_usage_is_summed_per_node_and_model():
+    total = None
+    for update in [
+        record_usage("web_research", "gemini-2.0-flash", 1_000, 500),
+        record_usage("web_research", "gemini-2.0-flash", 3_000, 500),
+        record_usage("finalize_answer", "gemini-2.5-pro", 10_000, 2_000),
+    ]:
+        total = merge_usage(total, update)
+    assert total["total"]["calls"] == 3
+    assert total["total"]["input_tokens"] == 14_000
+    assert total["by_node"]["web_research"]["output_tokens"] == 1_000
+    assert total["by_model"]["gemini-2.5-pro"]["cost_usd"] == pytest.approx(0.0325)
+    assert total["total"]["cost_usd"] == pytest.approx(0.0325 + 0.0008)
+
+
+def test_usage_record_is_logged(caplog):
+    with caplog.at_level("INFO", logger="agent.usage"):
+        record_usage("reflection", "gemini-2.5-flash", 10, 20)
+    assert caplog.records[0].token_usage["node"] == "reflection"
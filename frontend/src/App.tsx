@@ -29,7 +29,13 @@ export default function App() {
     },
     onUpdateEvent: (event: any) => {
       let processedEvent: ProcessedEvent | null = null;
-      if (event.generate_query) {
+      if (event.check_answer_cache?.answer_cache_hit) {
+        processedEvent = {
+          title: "Cached Answer",
+          data: "This question was already researched today, reusing its answer.",
+        };
+        hasFinalizeEventOccurredRef.current = true;
+      } else if (event.generate_query) {
         processedEvent = {
           title: "Generating Search Queries",
           data: event.generate_query.query_list.join(", "),
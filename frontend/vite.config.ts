@@ -7,6 +7,12 @@ import tailwindcss from "@tailwindcss/vite";
 export default defineConfig({
   plugins: [react(), tailwindcss()],
   base: "/app/",
+  build: {
+    rollupOptions: {
+      // Hex content hashes let the backend tell hashed assets apart by name
+      output: { hashCharacters: "hex" },
+    },
+  },
   resolve: {
     alias: {
       "@": path.resolve(__dirname, "./src"),